@@ -0,0 +1,102 @@
+"""Benchmark de l'extraction du texte des PDF : un thread vs pool de processus par plages de pages
+
+Génère des menus synthétiques de différentes tailles et compare, pour chaque nombre de pages,
+l'extraction séquentielle (extract_pages_text) et l'extraction parallèle
+(extract_pages_text_parallel) avec plusieurs tailles de pool.
+
+    python bench_pdf_extraction.py                     # 1, 5, 10, 20, 40, 80 pages
+    python bench_pdf_extraction.py --pages 40 160 --workers 2 4 8 --repeat 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+import fitz  # PyMuPDF
+
+# main.py crée le client Groq à l'import : aucune requête n'est faite par ce benchmark
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+import main
+
+DISHES = [
+    ("Velouté de potimarron, crème fouettée aux noisettes", "9,50"),
+    ("Tartare de boeuf au couteau, frites maison", "19,00"),
+    ("Filet de bar rôti, risotto crémeux au citron", "24,00"),
+    ("Magret de canard, sauce aux cerises, gratin dauphinois", "23,50"),
+    ("Fondant au chocolat, glace vanille de Madagascar", "8,50"),
+    ("Tarte fine aux pommes caramélisées", "7,50"),
+]
+WINES = ["Côtes du Rhône", "Bordeaux Supérieur", "Chablis", "Sancerre", "Saint-Émilion"]
+
+def build_menu_pdf(path: str, page_count: int):
+    """Menu synthétique : pages de plats (texte dense) alternées avec des cartes des vins en grille"""
+    doc = fitz.open()
+    for page_number in range(page_count):
+        page = doc.new_page()
+        if page_number % 4 == 3:
+            # Grille Verre / Bouteille, reconnue par detect_price_grids
+            page.insert_text((300, 60), "Verre", fontsize=10)
+            page.insert_text((400, 60), "Bouteille", fontsize=10)
+            for row, wine in enumerate(WINES * 6):
+                y = 80 + row * 22
+                page.insert_text((40, y), f"{wine} {row}", fontsize=10)
+                page.insert_text((300, y), f"{6 + row % 5},00 €", fontsize=10)
+                page.insert_text((400, y), f"{28 + row % 9},00 €", fontsize=10)
+            continue
+
+        page.insert_text((40, 50), f"NOS PLATS - PAGE {page_number + 1}", fontsize=14)
+        for row in range(34):
+            name, price = DISHES[row % len(DISHES)]
+            page.insert_text((40, 80 + row * 21), f"{name} ({row}) .......... {price}", fontsize=9)
+    doc.save(path)
+    doc.close()
+
+def time_sequential(path: str) -> float:
+    started = time.perf_counter()
+    doc = fitz.open(path, filetype="pdf")
+    try:
+        main.PAGE_SEPARATOR.join(main.extract_pages_text(doc))
+    finally:
+        doc.close()
+    return time.perf_counter() - started
+
+async def time_parallel(path: str, page_count: int) -> float:
+    started = time.perf_counter()
+    main.PAGE_SEPARATOR.join(await main.extract_pages_text_parallel(path, page_count))
+    return time.perf_counter() - started
+
+async def run(page_counts, worker_counts, repeat: int):
+    print(f"🖥️  {os.cpu_count()} CPU, {repeat} mesure(s) par cas (médiane, en ms)")
+    header = ["pages", "séquentiel"] + [f"{workers} proc." for workers in worker_counts]
+    print(" | ".join(f"{column:>11}" for column in header))
+
+    with tempfile.TemporaryDirectory() as directory:
+        for page_count in page_counts:
+            path = os.path.join(directory, f"menu-{page_count}.pdf")
+            build_menu_pdf(path, page_count)
+
+            sequential = statistics.median(time_sequential(path) for _ in range(repeat))
+            row = [str(page_count), f"{sequential * 1000:.0f}"]
+
+            for workers in worker_counts:
+                main.reset_process_pool("pdf")
+                main.PDF_MAX_WORKERS = workers
+                # Premier appel hors mesure : démarrage des processus du pool
+                await time_parallel(path, page_count)
+                timings = [await time_parallel(path, page_count) for _ in range(repeat)]
+                parallel = statistics.median(timings)
+                row.append(f"{parallel * 1000:.0f} (x{sequential / parallel:.1f})")
+
+            print(" | ".join(f"{column:>11}" for column in row))
+
+    main.reset_process_pool("pdf")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 5, 10, 20, 40, 80])
+    parser.add_argument("--workers", type=int, nargs="+", default=sorted({2, 4, os.cpu_count() or 2}))
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    asyncio.run(run(args.pages, args.workers, args.repeat))
@@ -1,15 +1,38 @@
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 import fitz  # PyMuPDF
 import json
 import os
-from groq import Groq
-from typing import Dict, List
+import re
+from groq import AsyncGroq
+from typing import Dict, Iterator, List, Set
+import asyncio
+import hashlib
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import requests
 from dotenv import load_dotenv
 import paramiko
-from PIL import Image
+from PIL import Image, ImageOps
 import io
+import gzip
+import zipfile
+import tarfile
+import sqlite3
+import uuid
+import inspect
+import shutil
+import tempfile
+import shlex
+import unicodedata
+from functools import lru_cache
+from stat import S_ISDIR, S_ISLNK
+from types import MappingProxyType
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from starlette.datastructures import Headers
 
 load_dotenv()
 
@@ -27,7 +50,475 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 if not GROQ_API_KEY:
     raise ValueError("⚠️  GROQ_API_KEY non définie dans .env")
 
-groq_client = Groq(api_key=GROQ_API_KEY)
+GROQ_MODEL = "llama-3.3-70b-versatile"
+
+# Nombre maximum d'appels Groq simultanés (les autres requêtes attendent leur tour
+# sans bloquer la boucle d'événements)
+GROQ_MAX_CONCURRENCY = int(os.getenv("GROQ_MAX_CONCURRENCY", "4"))
+
+groq_client = AsyncGroq(api_key=GROQ_API_KEY)
+groq_semaphore = asyncio.Semaphore(GROQ_MAX_CONCURRENCY)
+
+# Classification par morceaux : taille cible d'un morceau et seuil de découpage automatique
+GROQ_CHUNK_CHARS = int(os.getenv("GROQ_CHUNK_CHARS", "6000"))
+GROQ_CHUNK_THRESHOLD = int(os.getenv("GROQ_CHUNK_THRESHOLD", "12000"))
+
+# Ingestion par lot : nombre de menus traités en parallèle et taille maximale d'un lot (archive
+# ZIP reçue, puis total décompressé)
+BATCH_MAX_WORKERS = int(os.getenv("BATCH_MAX_WORKERS", "4"))
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "100"))
+BATCH_ZIP_MAX_BYTES = int(os.getenv("BATCH_ZIP_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# Jobs en arrière-plan : base SQLite (état, étapes, résultats) et fichiers d'entrée
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", ".jobs/jobs.sqlite3")
+JOBS_DIR = os.getenv("JOBS_DIR", ".jobs/inputs")
+JOBS_MAX_WORKERS = int(os.getenv("JOBS_MAX_WORKERS", "2"))
+# Champs jamais écrits sur disque (gardés en mémoire le temps du job)
+JOBS_SECRET_FIELDS = {"ftp_password"}
+
+# Menus stockés (SQLite) : restaurants et leurs réglages, versions des menus et fichiers générés
+MENUS_DB_PATH = os.getenv("MENUS_DB_PATH", ".menus/menus.sqlite3")
+MENU_VERSIONS_KEEP = int(os.getenv("MENU_VERSIONS_KEEP", "20"))
+
+# Serveur Pleazze (SFTP) : port 2266 pour les JSON, port 22 pour les images
+SFTP_HOST = os.getenv("SFTP_HOST", "178.32.198.72")
+SFTP_USER = os.getenv("SFTP_USER", "snadmin")
+SFTP_JSON_PORT = int(os.getenv("SFTP_JSON_PORT", "2266"))
+SFTP_IMAGES_PORT = int(os.getenv("SFTP_IMAGES_PORT", "22"))
+# Mot de passe optionnel : permet d'ouvrir les connexions dès le démarrage
+SFTP_PASSWORD = os.getenv("SFTP_PASSWORD")
+
+# Pool de sessions SFTP gardées ouvertes entre les requêtes
+SFTP_POOL_SIZE = int(os.getenv("SFTP_POOL_SIZE", "4"))
+SFTP_IDLE_TIMEOUT = int(os.getenv("SFTP_IDLE_TIMEOUT", "300"))
+SFTP_KEEPALIVE = int(os.getenv("SFTP_KEEPALIVE", "30"))
+# Une session inutilisée depuis plus longtemps est vérifiée (stat) avant d'être reprise
+SFTP_HEALTHCHECK_AFTER = 10
+
+# Upload des images d'articles : conversions en parallèle (processus) et transferts
+# simultanés sur plusieurs sessions SFTP, avec une file bornée entre les deux
+IMAGE_MAX_WORKERS = int(os.getenv("IMAGE_MAX_WORKERS", str(os.cpu_count() or 2)))
+UPLOAD_CONCURRENCY = int(os.getenv("UPLOAD_CONCURRENCY", "4"))
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "8"))
+
+# Variantes web des images : formats produits (le premier disponible est référencé dans les JSON,
+# les suivants servent de repli), qualité et taille d'affichage maximale (plus grand côté, en px)
+try:
+    import pillow_avif  # noqa: F401 (ajoute l'AVIF à Pillow s'il est installé)
+except ImportError:
+    pass
+
+IMAGE_FORMATS = [f.strip() for f in os.getenv("IMAGE_FORMATS", "webp,avif,jpg").split(",") if f.strip()]
+IMAGE_QUALITY = {
+    "webp": int(os.getenv("IMAGE_WEBP_QUALITY", "80")),
+    "avif": int(os.getenv("IMAGE_AVIF_QUALITY", "60")),
+    "jpg": int(os.getenv("IMAGE_JPEG_QUALITY", "82"))
+}
+IMAGE_ITEM_MAX_SIZE = int(os.getenv("IMAGE_ITEM_MAX_SIZE", "800"))
+IMAGE_BANNER_MAX_SIZE = int(os.getenv("IMAGE_BANNER_MAX_SIZE", "1600"))
+
+# Format Pillow correspondant à chaque extension
+IMAGE_PIL_FORMATS = {"webp": "WEBP", "avif": "AVIF", "jpg": "JPEG"}
+
+# Synchronisation différentielle : chaque dossier distant contient un manifeste
+# {entrée: {"hash": ..., "files": {fichier: taille}}} ; un contenu inchangé n'est pas renvoyé
+SYNC_MANIFEST_NAME = ".manifest.json"
+
+# Bannières par défaut : leurs variantes web sont encodées une fois et rangées sur le serveur
+# (DEFAULT_BANNERS_PATH/.variants), puis copiées côté serveur pour chaque restaurant.
+# Le cache local retient, par fichier source (chemin, taille, mtime), l'empreinte et les variantes.
+DEFAULT_BANNERS_PATH = "/var/www/pleazze/static/adel/defaults"
+DEFAULTS_CACHE_MAX_BYTES = 1024 * 1024
+
+# Publication versionnée des JSON de cache : chaque version va dans releases/data-<empreinte>
+# et PUBLISH_CURRENT_NAME (le chemin lu par l'application) devient un lien symbolique basculé
+# atomiquement. Les images portent l'empreinte de leur contenu dans leur nom (cache immuable).
+PUBLISH_CACHE_ROOT = "/var/www/pleazze/data/cache/abdel"
+PUBLISH_CURRENT_NAME = os.getenv("PUBLISH_CURRENT_NAME", "data_2025-07-29_17-25-11")
+PUBLISH_KEEP_RELEASES = int(os.getenv("PUBLISH_KEEP_RELEASES", "5"))
+
+# Chaque JSON publié est accompagné de ses versions précompressées (.gz, et .br si le module
+# brotli est installé), servies telles quelles par le serveur statique (gzip_static/brotli_static)
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Sessions libres par (hôte, port, utilisateur)
+sftp_pool: Dict[tuple, List[Dict]] = {}
+sftp_pool_lock = threading.Lock()
+
+# Séparateur inséré entre les pages du PDF dans le texte extrait
+PAGE_SEPARATOR = "\f"
+
+# OCR des pages scannées (tesseract), une page par processus
+OCR_ENABLED = os.getenv("OCR_ENABLED", "1") == "1"
+OCR_LANG = os.getenv("OCR_LANG", "fra")
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_MAX_WORKERS = int(os.getenv("OCR_MAX_WORKERS", str(os.cpu_count() or 2)))
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+# En dessous de ce nombre de caractères, la couche texte d'une page est considérée vide
+OCR_MIN_PAGE_CHARS = 20
+# Pages scannées rasterisées et OCRisées par lots : seuls les PNG du lot en cours sont en mémoire
+OCR_BATCH_PAGES = int(os.getenv("OCR_BATCH_PAGES", str(OCR_MAX_WORKERS * 2)))
+
+# Extraction du texte des PDF longs répartie par plages de pages sur un pool de processus
+# (chaque processus ouvre le fichier lui-même) ; en dessous de PDF_PARALLEL_MIN_PAGES, un thread suffit
+PDF_MAX_WORKERS = int(os.getenv("PDF_MAX_WORKERS", str(os.cpu_count() or 2)))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "8"))
+
+# Réception des PDF : copiés sur disque par morceaux (jamais entièrement en mémoire) puis ouverts
+# depuis le fichier ; au-delà de PDF_MAX_BYTES le fichier est refusé (413)
+PDF_MAX_BYTES = int(os.getenv("PDF_MAX_BYTES", str(100 * 1024 * 1024)))
+PDF_SPOOL_DIR = os.getenv("PDF_SPOOL_DIR") or None
+PDF_SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Pools de processus pour le travail CPU (OCR, images), créés à la demande
+process_pools: Dict[str, ProcessPoolExecutor] = {}
+
+# Tableaux de formats (Verre/Bouteille/Magnum...) : en-têtes reconnus -> libellé ajouté au nom
+GRID_FORMATS = {
+    "verre": "Verre",
+    "coupe": "Coupe",
+    "bouteille": "Bouteille",
+    "btl": "Bouteille",
+    "magnum": "Magnum",
+    "jeroboam": "Jéroboam",
+    "jéroboam": "Jéroboam",
+    "pichet": "Pichet",
+    "25cl": "25cl",
+    "33cl": "33cl",
+    "50cl": "50cl",
+    "75cl": "75cl",
+    "150cl": "150cl"
+}
+GRID_PRICE_RE = re.compile(r"^\d+(?:[.,]\d{1,2})?€?$")
+GRID_EMPTY_CELLS = {"-", "–", "—", "/"}
+# Écart horizontal (points) au-delà duquel deux mots n'appartiennent plus au même nom
+GRID_NAME_GAP = 40
+GRID_BLOCK_START = "[Tableau des formats]"
+GRID_BLOCK_END = "[Fin du tableau]"
+
+# Registre des catégories, dans l'ordre de publication (cet ordre fixe les drinkIndex) :
+# (clé, section Odoo, nom fr, nom en)
+MENU_CATEGORIES = (
+    ("entrees", "sections", "ENTRÉES", "STARTERS"),
+    ("salades", "sections", "SALADES", "SALADS"),
+    ("plats", "sections", "PLATS", "MAINS"),
+    ("desserts", "sections", "DESSERTS", "DESSERTS"),
+    ("planches", "sections", "PLANCHES", "BOARDS"),
+    ("tapas", "sections", "TAPAS", "TAPAS"),
+    ("pinsa_pizza", "sections", "PINSA & PIZZA", "PINSA & PIZZA"),
+    ("pates", "sections", "PÂTES", "PASTA"),
+    ("burgers", "sections", "BURGERS", "BURGERS"),
+    ("brasserie", "sections", "LA BRASSERIE", "BRASSERIE"),
+    ("accompagnements", "sections", "ACCOMPAGNEMENTS", "SIDE DISHES"),
+    
+    ("boissons_soft", "drinks", "SOFTS-EAUX", "SOFT DRINKS"),
+    ("jus", "drinks", "JUS", "JUICES"),
+    ("boissons_chaudes", "drinks", "CAFÉTERIE", "HOT DRINKS"),
+    
+    ("bieres_pression", "drinks", "BIÈRES PRESSION", "DRAFT BEERS"),
+    ("bieres_bouteilles", "drinks", "BIÈRES BOUTEILLES", "BOTTLED BEERS"),
+    
+    ("vins_blancs_verre", "drinks", "VINS BLANCS VERRE", "WHITE WINES GLASS"),
+    ("vins_rouges_verre", "drinks", "VINS ROUGES VERRE", "RED WINES GLASS"),
+    ("vins_roses_verre", "drinks", "VINS ROSÉS VERRE", "ROSÉ WINES GLASS"),
+    
+    ("vins_blancs_bouteille", "drinks", "VINS BLANCS BOUTEILLE", "WHITE WINES BOTTLE"),
+    ("vins_rouges_bouteille", "drinks", "VINS ROUGES BOUTEILLE", "RED WINES BOTTLE"),
+    ("vins_roses_bouteille", "drinks", "VINS ROSÉS BOUTEILLE", "ROSÉ WINES BOTTLE"),
+    
+    ("vins_blancs_magnum", "drinks", "VINS BLANCS MAGNUM", "WHITE WINES MAGNUM"),
+    ("vins_rouges_magnum", "drinks", "VINS ROUGES MAGNUM", "RED WINES MAGNUM"),
+    ("vins_roses_magnum", "drinks", "VINS ROSÉS MAGNUM", "ROSÉ WINES MAGNUM"),
+    
+    ("champagnes_coupe", "drinks", "CHAMPAGNES COUPE", "CHAMPAGNES GLASS"),
+    ("champagnes_bouteille", "drinks", "CHAMPAGNES BOUTEILLE", "CHAMPAGNES BOTTLE"),
+    ("champagnes_magnum", "drinks", "CHAMPAGNES MAGNUM", "CHAMPAGNES MAGNUM"),
+    
+    ("aperitifs", "drinks", "APÉRITIFS", "APERITIFS"),
+    ("spritz", "drinks", "SPRITZ", "SPRITZ"),
+    ("cocktails", "drinks", "COCKTAILS", "COCKTAILS"),
+    ("mocktails", "drinks", "MOCKTAILS", "MOCKTAILS"),
+    
+    ("rhums", "drinks", "RHUMS", "RUMS"),
+    ("vodkas", "drinks", "VODKAS", "VODKAS"),
+    ("gins", "drinks", "GINS", "GINS"),
+    ("tequilas", "drinks", "TEQUILAS", "TEQUILAS"),
+    ("whiskies", "drinks", "WHISKIES", "WHISKIES"),
+    ("digestifs", "drinks", "DIGESTIFS", "DIGESTIFS"),
+    ("cognacs_armagnacs", "drinks", "COGNACS & ARMAGNACS", "COGNACS & ARMAGNACS")
+)
+
+FOOD_CATEGORIES = tuple(key for key, section, _, _ in MENU_CATEGORIES if section == "sections")
+DRINK_CATEGORIES = tuple(key for key, section, _, _ in MENU_CATEGORIES if section == "drinks")
+
+# Boutons d'accueil : (libellé fr, libellé en, priorité, catégories regroupées) ;
+# le premier bouton (la carte) n'est pas un drink
+MENU_BUTTON_GROUPS = (
+    ("La carte", "The menu", 1, FOOD_CATEGORIES),
+    ("Boissons fraîches", "Cold drinks", 4, ("boissons_soft", "jus")),
+    ("Boissons chaudes", "Hot drinks", 5, ("boissons_chaudes",)),
+    ("Bières", "Beers", 6, ("bieres_pression", "bieres_bouteilles")),
+    ("Vins", "Wines", 3, ("vins_blancs_verre", "vins_rouges_verre", "vins_roses_verre",
+                          "vins_blancs_bouteille", "vins_rouges_bouteille", "vins_roses_bouteille",
+                          "vins_blancs_magnum", "vins_rouges_magnum", "vins_roses_magnum")),
+    ("Champagnes", "Champagnes", 7, ("champagnes_coupe", "champagnes_bouteille", "champagnes_magnum")),
+    ("Cocktails", "Cocktails", 2, ("cocktails", "mocktails", "aperitifs", "spritz")),
+    ("Spiritueux", "Spirits", 8, ("rhums", "vodkas", "gins", "tequilas", "whiskies", "digestifs", "cognacs_armagnacs"))
+)
+
+# Index précalculés (lecture seule) à partir du registre
+CATEGORY_SECTION = MappingProxyType({key: section for key, section, _, _ in MENU_CATEGORIES})
+CATEGORY_NAMES = MappingProxyType({key: MappingProxyType({"fr": fr, "en": en}) for key, _, fr, en in MENU_CATEGORIES})
+SECTION_CATEGORY = MappingProxyType({(section, fr): key for key, section, fr, _ in MENU_CATEGORIES})
+BUTTON_LABEL_CATEGORIES = MappingProxyType({
+    label: categories
+    for fr, en, _, categories in MENU_BUTTON_GROUPS
+    for label in (fr, en)
+})
+
+def first_drink_index(categories, drink_indexes: Dict[str, int]):
+    """drinkIndex de la première catégorie active d'un groupe (None si aucune)"""
+    return next((drink_indexes[category] for category in categories if category in drink_indexes), None)
+
+# articleId : "stable" = dérivé de la catégorie et du nom normalisé (insérer un plat ne décale
+# plus les autres) ; "sequential" = compteur historique à partir de 4000
+ARTICLE_ID_MODE = os.getenv("ARTICLE_ID_MODE", "stable")
+# Les ID stables sont dans [1000000, 9999999] : jamais confondus avec les ID séquentiels
+ARTICLE_ID_OFFSET = 1_000_000
+ARTICLE_ID_SPACE = 9_000_000
+
+# Ligatures que NFKD ne décompose pas
+LIGATURES = str.maketrans({"œ": "oe", "æ": "ae", "ß": "ss"})
+
+def normalize_article_name(name: str) -> str:
+    """Nom comparable : minuscules, sans accents ni ponctuation, espaces réduits"""
+    decomposed = unicodedata.normalize("NFKD", str(name).lower().translate(LIGATURES))
+    without_accents = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", without_accents).split())
+
+# Mémoïsé : un menu est souvent reconstruit plusieurs fois (aperçu, génération, PATCH successifs)
+@lru_cache(maxsize=65536)
+def article_id_hash(category: str, name: str, suffix: str = "") -> str:
+    base = f"{category}|{normalize_article_name(name)}"
+    key = f"{base}#{suffix}" if suffix else base
+    return str(ARTICLE_ID_OFFSET + int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:12], 16) % ARTICLE_ID_SPACE)
+
+def article_variant(price, description) -> str:
+    """Prix et description normalisés : ce qui distingue deux homonymes d'une même catégorie"""
+    try:
+        price = f"{float(str(price).replace(',', '.')):.2f}"
+    except (TypeError, ValueError):
+        price = str(price)
+    return f"{price}|{normalize_article_name(description or '')}"
+
+def stable_article_id(category: str, name: str, variant: str, used: set) -> str:
+    """articleId déterministe ; en cas de collision (homonymes, empreinte partagée), on re-hache
+    avec le prix et la description (variant) plutôt que la position, puis #2, #3... pour des
+    articles en tout point identiques"""
+    for suffix in ("", variant):
+        article_id = article_id_hash(category, str(name), suffix)
+        if article_id not in used:
+            used.add(article_id)
+            return article_id
+    attempt = 2
+    while True:
+        article_id = article_id_hash(category, str(name), f"{variant}#{attempt}")
+        if article_id not in used:
+            used.add(article_id)
+            return article_id
+        attempt += 1
+
+def previous_article_ids(previous_menus: Dict) -> Dict[tuple, List[tuple]]:
+    """ID stables d'un menus.4.json publié : {(catégorie, nom normalisé): [(articleId, variant)]}
+    
+    Les ID séquentiels (< ARTICLE_ID_OFFSET) sont ignorés : ils ne sont pas repris.
+    """
+    previous_ids = {}
+    for section_type in ("sections", "drinks"):
+        for section in previous_menus.get(section_type, []):
+            category = SECTION_CATEGORY.get((section_type, section.get("name", {}).get("fr")))
+            if category is None:
+                continue
+            for article in section.get("articles", []):
+                article_id = str(article.get("articleId", ""))
+                if not article_id.isdigit() or int(article_id) < ARTICLE_ID_OFFSET:
+                    continue
+                key = (category, normalize_article_name(article.get("name", {}).get("fr", "")))
+                variant = article_variant(article.get("price", {}).get("amount"), article.get("descr", {}).get("fr"))
+                previous_ids.setdefault(key, []).append((article_id, variant))
+    return previous_ids
+
+class MenuArticle:
+    """Article normalisé (nom, prix, description, allergènes) avec son articleId"""
+    
+    __slots__ = ("article_id", "name", "price", "description", "allergens")
+    
+    def __init__(self, article_id: str, item: Dict):
+        self.article_id = article_id
+        self.name = item.get("nom", "")
+        self.price = item.get("prix")
+        
+        desc_value = item.get("description", False)
+        self.description = "" if (desc_value is False or not desc_value or desc_value == self.name) else desc_value
+        allergens_value = item.get("allergens", False)
+        self.allergens = "" if (allergens_value is False or not allergens_value) else allergens_value
+
+class MenuModel:
+    """Menu parcouru une seule fois, partagé par tous les générateurs d'une requête
+    
+    categories : {catégorie: [MenuArticle]} dans l'ordre du registre (catégories connues non vides)
+    counts : nombre d'articles par catégorie (y compris inconnues), drink_indexes : drinkIndex réels
+    
+    Avec previous_menus (menus.4.json publié), un article de même catégorie et même nom garde
+    son articleId publié (d'abord à prix et description identiques) : retirer ou renommer un
+    homonyme ne change ni l'ID ni l'image des autres.
+    """
+    
+    __slots__ = ("categories", "counts", "total_articles", "drink_indexes", "has_food", "has_drinks")
+    
+    def __init__(self, menu_data: Dict, first_id: int = 4000, previous_menus: Dict = None):
+        self.counts = {category: len(items) for category, items in menu_data.items() if items}
+        self.total_articles = sum(self.counts.values())
+        self.categories = {}
+        self.drink_indexes = {}
+        self.has_food = False
+        self.has_drinks = False
+        
+        current_id = first_id
+        used_ids = set()
+        previous_ids = previous_article_ids(previous_menus) if previous_menus and ARTICLE_ID_MODE != "sequential" else {}
+        for category in CATEGORY_SECTION:
+            items = menu_data.get(category)
+            if not items:
+                continue
+            
+            if ARTICLE_ID_MODE == "sequential":
+                self.categories[category] = [MenuArticle(str(current_id + offset), item) for offset, item in enumerate(items)]
+                current_id += len(items)
+            else:
+                self.categories[category] = self.stable_articles(category, items, used_ids, previous_ids)
+            
+            if category in DRINK_CATEGORIES:
+                self.drink_indexes[category] = len(self.drink_indexes)
+                self.has_drinks = True
+            else:
+                self.has_food = True
+    
+    @staticmethod
+    def stable_articles(category: str, items: List[Dict], used_ids: set, previous_ids: Dict) -> List[MenuArticle]:
+        entries = [MenuArticle(None, item) for item in items]
+        variants = [article_variant(entry.price, entry.description) for entry in entries]
+        keys = [(category, normalize_article_name(entry.name)) for entry in entries]
+        
+        # ID publiés, à nom identique : même prix et description, puis même prix ou même
+        # description, puis le seul homonyme publié restant (jamais au hasard parmi plusieurs)
+        def same_variant(variant, previous_variant, candidates):
+            return previous_variant == variant
+        
+        def same_price_or_description(variant, previous_variant, candidates):
+            price, description = variant.split("|", 1)
+            previous_price, previous_description = previous_variant.split("|", 1)
+            return price == previous_price or (description != "" and description == previous_description)
+        
+        def last_candidate(variant, previous_variant, candidates):
+            return len(candidates) == 1
+        
+        for matches in (same_variant, same_price_or_description, last_candidate):
+            for entry, variant, key in zip(entries, variants, keys):
+                if entry.article_id is not None:
+                    continue
+                candidates = [(article_id, v) for article_id, v in previous_ids.get(key, ()) if article_id not in used_ids]
+                for article_id, previous_variant in candidates:
+                    if matches(variant, previous_variant, candidates):
+                        entry.article_id = article_id
+                        used_ids.add(article_id)
+                        break
+        
+        for entry, variant in zip(entries, variants):
+            if entry.article_id is None:
+                entry.article_id = stable_article_id(category, entry.name, variant, used_ids)
+        return entries
+    
+    def article_ids(self) -> Dict[str, List[str]]:
+        """articleId de chaque article, par catégorie, dans l'ordre du menu"""
+        return {category: [entry.article_id for entry in articles] for category, articles in self.categories.items()}
+
+def as_menu_model(menu) -> MenuModel:
+    """Accepte un menu brut {catégorie: [articles]} ou un MenuModel déjà construit"""
+    return menu if isinstance(menu, MenuModel) else MenuModel(menu)
+
+# Bundle (ZIP/tar) renvoyé par /generate-menu avec response_format : nom de fichier -> champ
+# de formulaire de /upload-to-server ; meta.json liste les fichiers identiques (aliases)
+BUNDLE_FORMATS = {"zip": "application/zip", "tar": "application/x-tar"}
+BUNDLE_FILES = {
+    "backend.json": "backend_json",
+    "backend_2.json": "backend_2_json",
+    "frontend.json": "frontend_json",
+    "frontend_2.json": "frontend_2_json",
+    "menus.4.json": "menus_json",
+    "menus_2.4.json": "menus_2_json"
+}
+BUNDLE_CHUNK_SIZE = 64 * 1024
+# Bundle reçu par /upload-to-server : nombre d'entrées et taille décompressée d'un fichier
+BUNDLE_MAX_MEMBERS = int(os.getenv("BUNDLE_MAX_MEMBERS", "32"))
+BUNDLE_MAX_FILE_BYTES = int(os.getenv("BUNDLE_MAX_FILE_BYTES", str(64 * 1024 * 1024)))
+
+# Pré-classification locale des lignes évidentes (sans appel Groq)
+PRECLASSIFY_ENABLED = os.getenv("PRECLASSIFY_ENABLED", "1") == "1"
+
+# Mots-clés par catégorie, testés en début de nom et dans cet ordre (le plus spécifique d'abord)
+PRECLASSIFIER_RULES = {
+    # Pression et softs : le nom entier doit correspondre (ancré en fin), sinon "Pression des
+    # champs" ou "Perrier-Jouët Grand Brut" partiraient dans ces catégories
+    "bieres_pression": [
+        r"(?:(?:bi[èe]re|demi|pinte|galopin) )?(?:(?:heineken|1664|kronenbourg|leffe|grimbergen|affligem|goudale|pelforth|hoegaarden|blanche|blonde|ambr[ée]e|brune)(?: [\w-]+)? )?(?:en )?pression(?: (?:blonde|blanche|ambr[ée]e|brune))?(?: \d+\s?cl)?$"
+    ],
+    "bieres_bouteilles": [
+        r"(?:heineken|1664|kronenbourg|leffe|corona|desperados|chouffe|duvel|chimay|carlsberg|budweiser|tsingtao|singha|asahi|kirin)\b.*\b(?:25|33|75)\s?cl\b"
+    ],
+    # Jus, boissons chaudes et accompagnements : même ancrage, sinon "Jus de viande",
+    # "Noisette d'agneau" ou "Riz au lait" partiraient dans ces catégories
+    "jus": [
+        r"jus d(?:e |[’'] ?)(?:orange|pomme|ananas|tomate|raisin|pamplemousse|abricot|mangue|fraise|poire|p[êe]che|carotte|cranberry|fruits?(?: rouges| exotiques)?)(?: press[ée]e?| frais| bio| \d+\s?cl)?$",
+        r"nectar d(?:e |[’'] ?)\w+(?: \d+\s?cl)?$",
+        r"(?:orange|citron|pamplemousse) press[ée]e?$"
+    ],
+    "boissons_soft": [
+        r"(?:coca(?:[- ]cola)?|pepsi|orangina|schweppes|sprite|fanta|red[- ]?bull)(?: (?:z[ée]ro|light|max|cherry|tonic|indian tonic|agrumes))?(?: \d+\s?cl)?$",
+        r"(?:ice[- ]?tea|fuze[- ]?tea)(?: (?:p[êe]che|citron|mangue|framboise))?(?: \d+\s?cl)?$",
+        r"(?:perrier|san[- ]pellegrino|badoit|evian|vittel|volvic|eau (?:plate|gazeuse|min[ée]rale))(?: (?:rondelle|citron|tranche))?(?: \d+(?:[.,]\d+)?\s?c?l)?$",
+        r"limonade(?: artisanale| maison)?(?: \d+\s?cl)?$",
+        r"(?:sirop|diabolo)(?: (?:de |d[’'] ?|[àa] la )?(?:menthe|grenadine|fraise|citron|p[êe]che|violette|orgeat|cassis|framboise))?(?: \d+\s?cl)?$"
+    ],
+    "boissons_chaudes": [
+        r"(?:grand |petit |double )?(?:caf[ée]|expresso|espresso|ristretto|d[ée]ca(?:f[ée]in[ée])?|cappuccino|latte|macchiato|chocolat chaud)(?: (?:allong[ée]|serr[ée]|double|noisette|\d+\s?cl))?$",
+        r"(?:th[ée]|infusion|tisane)(?: (?:vert|noir|blanc|menthe|[àa] la menthe|earl grey|\d+\s?cl))?$"
+    ],
+    "accompagnements": [
+        r"(?:bol de |portion de |assiette de |suppl[ée]ment )?(?:frites(?: maison)?|potatoes|pur[ée]e(?: maison)?|salade verte|l[ée]gumes (?:grill[ée]s|du moment)|pommes (?:grenailles|saut[ée]es|de terre)|haricots verts|gratin dauphinois)$",
+        r"(?:bol|portion) de riz$",
+        r"riz (?:blanc|basmati|pilaf|nature)$"
+    ]
+}
+
+# Un nom contenant l'un de ces mots n'est jamais pré-classé (desserts, cocktails, plats composés...)
+PRECLASSIFIER_EXCLUSIONS = re.compile(
+    r"gourmand|li[ée]geois|glac[ée]|irish|viennois|tiramisu|cr[èe]me|sauce|cocktail|spritz|mojito|rhum|whisk|vodka|\bgin\b|\bet\b|\bavec\b|\+"
+    r"|agneau|burger|viande|au lait|entrec[ôo]te|b(?:oe|œ)uf|veau|poulet|canard|porc"
+    r"|jou[eë]t|\bbrut\b|champagne|sirop d(?:e |[’'] ?)[\w-]+ sur\b",
+    re.IGNORECASE
+)
+
+# Ligne "Nom ..... 12,50 €" : un seul prix, en fin de ligne
+PRECLASSIFY_LINE_RE = re.compile(r"^(?P<name>.*?[^\d\s.…_])[\s.…_]*(?P<price>\d{1,4}(?:[.,]\d{1,2})?)\s*(?:€|eur(?:os?)?)?\s*$", re.IGNORECASE)
+# Un autre nombre isolé dans le nom = probablement un second prix ("Pression 25cl 4 / 50cl 7")
+PRECLASSIFY_EXTRA_PRICE_RE = re.compile(r"(?<![\w.,])\d{1,3}(?:[.,]\d{1,2})?(?![\w.,])")
+PRECLASSIFY_MAX_NAME_WORDS = 7
+# Catégories à noms courts : au-delà, la ligne part chez Groq
+PRECLASSIFY_MAX_NAME_WORDS_BY_CATEGORY = {"boissons_chaudes": 3, "jus": 5, "accompagnements": 4, "boissons_soft": 4, "bieres_pression": 5}
 
 # Configuration Odoo
 ODOO_URL = os.getenv("ODOO_URL", "https://ton-instance.odoo.com")
@@ -35,78 +526,211 @@ ODOO_DB = os.getenv("ODOO_DB", "nom_base")
 ODOO_USERNAME = os.getenv("ODOO_USERNAME", "admin")
 ODOO_PASSWORD = os.getenv("ODOO_PASSWORD", "")
 
-def classify_menu_with_groq(text: str) -> Dict:
-    """Utilise Groq pour classifier le menu complet"""
+# Cache disque (résultats de classification, etc.)
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+MENU_CACHE_MAX_BYTES = int(os.getenv("MENU_CACHE_MAX_BYTES", str(200 * 1024 * 1024)))
+
+# Compteurs hits/misses par espace de cache
+cache_stats: Dict[str, Dict[str, int]] = {}
+
+def cache_key(*parts: str) -> str:
+    """Calcule une clé de cache (SHA-256) à partir de plusieurs chaînes"""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+def cache_get(namespace: str, key: str):
+    """Lit une entrée du cache disque (None si absente) et la marque comme récemment utilisée"""
+    stats = cache_stats.setdefault(namespace, {"hits": 0, "misses": 0})
+    path = os.path.join(CACHE_DIR, namespace, f"{key}.json")
+    
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            value = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        stats["misses"] += 1
+        return None
+    
+    # LRU : la date de modification sert de date de dernier accès
+    try:
+        os.utime(path, None)
+    except OSError:
+        pass
+    
+    stats["hits"] += 1
+    return value
+
+def cache_put(namespace: str, key: str, value, max_bytes: int):
+    """Écrit une entrée dans le cache disque puis évince les plus anciennes si la taille dépasse max_bytes"""
+    directory = os.path.join(CACHE_DIR, namespace)
+    os.makedirs(directory, exist_ok=True)
+    
+    path = os.path.join(directory, f"{key}.json")
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(value, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    
+    cache_evict(namespace, max_bytes)
+
+def cache_evict(namespace: str, max_bytes: int):
+    """Supprime les entrées les moins récemment utilisées jusqu'à repasser sous max_bytes"""
+    directory = os.path.join(CACHE_DIR, namespace)
+    entries = []
+    total_size = 0
+    
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(".json"):
+            continue
+        stat = entry.stat()
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_size += stat.st_size
+    
+    entries.sort()
+    for _, size, path in entries:
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+            total_size -= size
+        except OSError:
+            pass
+
+def cache_info(namespace: str) -> Dict:
+    """Statistiques d'un espace de cache (hits, misses, nombre d'entrées, taille)"""
+    stats = cache_stats.get(namespace, {"hits": 0, "misses": 0})
+    directory = os.path.join(CACHE_DIR, namespace)
+    entries = 0
+    size = 0
     
-    prompt = f"""Tu es un expert en extraction de menus de restaurants. Tu dois analyser cette carte et extraire TOUS les articles avec une précision maximale.
+    if os.path.isdir(directory):
+        for entry in os.scandir(directory):
+            if entry.name.endswith(".json"):
+                entries += 1
+                size += entry.stat().st_size
+    
+    return {**stats, "entries": entries, "size_bytes": size}
+
+# Prompt de classification, assemblé par build_menu_prompt avec uniquement les blocs utiles
+MENU_PROMPT_HEADER = """Tu es un expert en extraction de menus de restaurants. Tu dois analyser cette carte et extraire TOUS les articles avec une précision maximale.
 
 TEXTE DE LA CARTE :
 {text}
 
-CATÉGORIES DISPONIBLES :
-
-**NOURRITURE :**
-- entrees : entrées/starters (peut inclure les salades SI la carte ne les sépare pas)
-- salades : toutes les salades (Niçoise, Caesar, etc.) - UNIQUEMENT si la carte a une section "SALADES" dédiée
-- plats : plats principaux/mains
-- desserts : desserts
-- planches : planches à partager (charcuterie, fromage, mixte)
-- tapas : tapas, petits plaisirs croustillants, snacking, amuse-bouches
-- pinsa_pizza : pinsa, pizza
-- pates : pâtes, pasta
-- burgers : tous les burgers
-- brasserie : plats de brasserie (fish & chips, moules frites, tartares, bavettes, cuisse de canard, etc.)
-- accompagnements : frites, salade verte, bol de frites, garnitures, riz, purées, légumes grillés, pommes grenailles, etc.
-
-**BOISSONS NON-ALCOOLISÉES :**
-- boissons_soft : Coca, Perrier, Orangina, etc.
-- jus : jus de fruits, pressés
-- boissons_chaudes : café, thé, chocolat chaud
-
-**BOISSONS ALCOOLISÉES - BIÈRES :**
-- bieres_pression : bières pression (25cl, 50cl)
-- bieres_bouteilles : bières en bouteilles
-
-**BOISSONS ALCOOLISÉES - VINS :**
-- vins_blancs_verre : vins blancs au verre
-- vins_rouges_verre : vins rouges au verre
-- vins_roses_verre : vins rosés au verre
-- vins_blancs_bouteille : vins blancs en bouteille (75cl)
-- vins_rouges_bouteille : vins rouges en bouteille (75cl)
-- vins_roses_bouteille : vins rosés en bouteille (75cl)
-- vins_blancs_magnum : vins blancs magnum/jeroboam/mathusalem (150cl, 300cl, 600cl)
-- vins_rouges_magnum : vins rouges magnum/jeroboam/mathusalem (150cl, 300cl, 600cl)
-- vins_roses_magnum : vins rosés magnum/jeroboam/mathusalem (150cl, 300cl, 600cl)
-
-**BOISSONS ALCOOLISÉES - CHAMPAGNES :**
-- champagnes_coupe : champagnes au verre/coupe
-- champagnes_bouteille : champagnes en bouteille
-- champagnes_magnum : champagnes magnum et plus
-
-**BOISSONS ALCOOLISÉES - APÉRITIFS :**
-- aperitifs : Ricard, Pastis, Porto, Martini, Campari, Kir, etc.
-- spritz : tous les spritz
-
-**BOISSONS ALCOOLISÉES - COCKTAILS :**
-- cocktails : cocktails avec alcool
-- mocktails : cocktails sans alcool
-
-**BOISSONS ALCOOLISÉES - SPIRITUEUX :**
-- rhums : tous les rhums (format verre/bouteille/magnum dans le nom si applicable)
-- vodkas : toutes les vodkas (format verre/bouteille/magnum dans le nom si applicable)
-- gins : tous les gins (format verre/bouteille/magnum dans le nom si applicable)
-- tequilas : toutes les tequilas (format verre/bouteille/magnum dans le nom si applicable)
-- whiskies : tous les whiskies/whisky (format verre/bouteille/magnum dans le nom si applicable)
-- digestifs : liqueurs, digestifs divers, Limoncello, Get 27, etc.
-- cognacs_armagnacs : cognacs, armagnacs
-
-**RÈGLES DE CLASSIFICATION CRITIQUES :**
+CATÉGORIES DISPONIBLES :"""
+
+# Groupes de catégories : (titre, regex de détection dans la carte ou None = toujours inclus, lignes)
+MENU_PROMPT_CATEGORY_GROUPS = [
+    ("NOURRITURE", None, [
+        ("entrees", "entrées/starters (peut inclure les salades SI la carte ne les sépare pas)"),
+        ("salades", "toutes les salades (Niçoise, Caesar, etc.) - UNIQUEMENT si la carte a une section \"SALADES\" dédiée"),
+        ("plats", "plats principaux/mains"),
+        ("desserts", "desserts"),
+        ("planches", "planches à partager (charcuterie, fromage, mixte)"),
+        ("tapas", "tapas, petits plaisirs croustillants, snacking, amuse-bouches"),
+        ("pinsa_pizza", "pinsa, pizza"),
+        ("pates", "pâtes, pasta"),
+        ("burgers", "tous les burgers"),
+        ("brasserie", "plats de brasserie (fish & chips, moules frites, tartares, bavettes, cuisse de canard, etc.)"),
+        ("accompagnements", "frites, salade verte, bol de frites, garnitures, riz, purées, légumes grillés, pommes grenailles, etc.")
+    ]),
+    ("BOISSONS NON-ALCOOLISÉES", None, [
+        ("boissons_soft", "Coca, Perrier, Orangina, etc."),
+        ("jus", "jus de fruits, pressés"),
+        ("boissons_chaudes", "café, thé, chocolat chaud")
+    ]),
+    ("BOISSONS ALCOOLISÉES - BIÈRES", r"bi[èe]re|pression|blonde|ambr[ée]e|\bipa\b|pils|lager|\b(?:25|33|50)\s?cl\b", [
+        ("bieres_pression", "bières pression (25cl, 50cl)"),
+        ("bieres_bouteilles", "bières en bouteilles")
+    ]),
+    ("BOISSONS ALCOOLISÉES - VINS", r"\bvins?\b|ch[âa]teau|domaine|c[ôo]te|cuv[ée]e|\baop\b|\baoc\b|\bigp\b|ros[ée]|rouge|blanc|magnum|\b75\s?cl\b", [
+        ("vins_blancs_verre", "vins blancs au verre"),
+        ("vins_rouges_verre", "vins rouges au verre"),
+        ("vins_roses_verre", "vins rosés au verre"),
+        ("vins_blancs_bouteille", "vins blancs en bouteille (75cl)"),
+        ("vins_rouges_bouteille", "vins rouges en bouteille (75cl)"),
+        ("vins_roses_bouteille", "vins rosés en bouteille (75cl)"),
+        ("vins_blancs_magnum", "vins blancs magnum/jeroboam/mathusalem (150cl, 300cl, 600cl)"),
+        ("vins_rouges_magnum", "vins rouges magnum/jeroboam/mathusalem (150cl, 300cl, 600cl)"),
+        ("vins_roses_magnum", "vins rosés magnum/jeroboam/mathusalem (150cl, 300cl, 600cl)")
+    ]),
+    ("BOISSONS ALCOOLISÉES - CHAMPAGNES", r"champagne|\bbrut\b|mo[ëe]t|veuve|ruinart|taittinger|coupe", [
+        ("champagnes_coupe", "champagnes au verre/coupe"),
+        ("champagnes_bouteille", "champagnes en bouteille"),
+        ("champagnes_magnum", "champagnes magnum et plus")
+    ]),
+    ("BOISSONS ALCOOLISÉES - APÉRITIFS", r"ap[ée]ritif|ap[ée]ro|spritz|ricard|pastis|porto|martini|campari|\bkir\b|suze|aperol|lillet", [
+        ("aperitifs", "Ricard, Pastis, Porto, Martini, Campari, Kir, etc."),
+        ("spritz", "tous les spritz")
+    ]),
+    ("BOISSONS ALCOOLISÉES - COCKTAILS", r"cocktail|mocktail|mojito|virgin|sour\b|margarita|colada|caipi|mule\b|spritz|tonic", [
+        ("cocktails", "cocktails avec alcool"),
+        ("mocktails", "cocktails sans alcool")
+    ]),
+    ("BOISSONS ALCOOLISÉES - SPIRITUEUX", r"rhum|\brum\b|vodka|\bgin\b|tequila|mezcal|whisk|bourbon|scotch|cognac|armagnac|calvados|digestif|liqueur|limoncello|get ?27|\b[24]cl\b", [
+        ("rhums", "tous les rhums (format verre/bouteille/magnum dans le nom si applicable)"),
+        ("vodkas", "toutes les vodkas (format verre/bouteille/magnum dans le nom si applicable)"),
+        ("gins", "tous les gins (format verre/bouteille/magnum dans le nom si applicable)"),
+        ("tequilas", "toutes les tequilas (format verre/bouteille/magnum dans le nom si applicable)"),
+        ("whiskies", "tous les whiskies/whisky (format verre/bouteille/magnum dans le nom si applicable)"),
+        ("digestifs", "liqueurs, digestifs divers, Limoncello, Get 27, etc."),
+        ("cognacs_armagnacs", "cognacs, armagnacs")
+    ])
+]
+
+MENU_PROMPT_CLASSIFICATION_RULES = """**RÈGLES DE CLASSIFICATION CRITIQUES :**
 1. **RESPECTE L'ORGANISATION DE LA CARTE** : Si la carte met les salades dans "NOS ENTRÉES", alors mets-les dans "entrees". Ne crée "salades" QUE si la carte a une section "NOS SALADES" distincte.
 2. **ACCOMPAGNEMENTS** : Frites, bol de frites, salade verte, purées, riz, légumes, pommes grenailles = catégorie "accompagnements"
 3. **BOISSONS_SOFT** : UNIQUEMENT Coca, Sprite, Perrier, sodas, sirops, jus industriels (PAS les accompagnements)
-4. **ANALYSE LA STRUCTURE** : Regarde les titres de sections dans la carte (ex: "NOS ENTRÉES", "LA BRASSERIE", "NOS SALADES") pour déterminer où classer chaque article
+4. **ANALYSE LA STRUCTURE** : Regarde les titres de sections dans la carte (ex: "NOS ENTRÉES", "LA BRASSERIE", "NOS SALADES") pour déterminer où classer chaque article"""
+
+# Règles strictes : (règle, groupe de catégories requis ou None = toujours incluse)
+MENU_PROMPT_STRICT_RULES = [
+    ("Extrais TOUS les articles même s'ils semblent incomplets", None),
+    ("Si un prix contient une virgule (12,50), convertis-le en point (12.50)", None),
+    ("N'utilise JAMAIS de guillemets doubles \" dans les noms (remplace par ')", None),
+    ("Pour les formats, note-les dans le nom : \"Coca-Cola 33cl\", \"Bière pression 25cl\"", None),
+    ("Si plusieurs formats existent (25cl/50cl), crée un article par format", None),
+    ("Pour les vins/champagnes, distingue verre/coupe/bouteille/magnum/jeroboam/mathusalem", "BOISSONS ALCOOLISÉES - VINS"),
+    ("**CRITIQUE : Si un article N'A PAS de description dans la carte, mets \"description\": false (PAS le nom du produit)**", None),
+    ("**IMPORTANT : Si un alcool a plusieurs formats (verre/bouteille/magnum), crée UN ARTICLE PAR FORMAT avec le format dans le nom**", "BOISSONS ALCOOLISÉES - SPIRITUEUX"),
+    ("**CRITIQUE : Les ROSÉS ne sont PAS des BLANCS ! Classe-les correctement dans vins_roses_**", "BOISSONS ALCOOLISÉES - VINS"),
+    ("**CRITIQUE : Si un prix est marqué \"-\" ou absent, NE CRÉE PAS L'ARTICLE (ignore-le complètement)**", None),
+    ("**BON SENS : Utilise ton intelligence pour classifier correctement selon le TYPE de plat, si tu constates une incohérence**", None),
+    ("**CATEGORIES VIDES : Si une catégorie n'a AUCUN article, omets-la complètement du JSON**", None),
+    ("**ACCOMPAGNEMENTS vs SOFTS** : Les frites, purées, riz, légumes vont dans \"accompagnements\", PAS dans \"boissons_soft\"", None)
+]
+
+MENU_PROMPT_FORMAT = """FORMAT DE RÉPONSE (JSON UNIQUEMENT, pas de texte avant/après) :
+Retourne UNIQUEMENT les catégories qui contiennent au moins 1 article, parmi :
+{categories}
+
+Structure : {{"entrees": [...], "plats": [...]}}
+
+Chaque article doit avoir ce format exact :
+{{"nom": "...", "prix": 12.50, "description": "..." ou false}}
+
+IMPORTANT : Retourne UNIQUEMENT le JSON, rien d'autre !"""
+
+# Adaptation du prompt au contenu de la carte (PROMPT_ADAPTIVE=0 : toutes les catégories et règles)
+PROMPT_ADAPTIVE = os.getenv("PROMPT_ADAPTIVE", "1") == "1"
+
+# Budget de sortie : max_tokens estimé depuis la taille du texte, borné par GROQ_MIN/MAX_TOKENS
+GROQ_MAX_TOKENS = int(os.getenv("GROQ_MAX_TOKENS", "16000"))
+GROQ_MIN_TOKENS = int(os.getenv("GROQ_MIN_TOKENS", "1024"))
+GROQ_CHARS_PER_TOKEN = 3.5
+# Le JSON de sortie est plus verbeux que le texte de la carte (clés, guillemets, noms répétés par format)
+GROQ_OUTPUT_RATIO = 2.5
+# Au-delà de cette fraction de max_tokens utilisée, on signale que la réponse frôle le plafond
+GROQ_CEILING_WARNING = 0.9
 
-**IMPORTANT POUR LES TABLEAUX D'ALCOOLS :**
+# Consommation cumulée de tokens depuis le démarrage
+groq_usage_totals = {"requests": 0, "prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0, "near_ceiling": 0}
+
+# Consignes pour les tableaux de formats bruts (colonnes Verre/Bouteille/Magnum non structurées)
+MENU_PROMPT_TABLE_RULES = """**IMPORTANT POUR LES TABLEAUX D'ALCOOLS :**
 Si tu vois un tableau comme :          Verre    Bouteille   Magnum
 JACK DANIEL'S  10€      130€        -
 GREY GOOSE     12.50€   150€       290€
@@ -117,91 +741,157 @@ Crée 3 articles :
 - "GREY GOOSE Bouteille" (150€) dans vodkas
 - "GREY GOOSE Magnum" (290€) dans vodkas
 NE CRÉE PAS d'article pour les "-"
+**TABLES/TABLEAUX : Si tu vois un tableau avec colonnes Verre/Bouteille/Magnum, extrais CHAQUE COLONNE comme un article séparé**"""
 
-**RÈGLES STRICTES :
-1. Extrais TOUS les articles même s'ils semblent incomplets
-2. Si un prix contient une virgule (12,50), convertis-le en point (12.50)
-3. N'utilise JAMAIS de guillemets doubles " dans les noms (remplace par ')
-4. Pour les formats, note-les dans le nom : "Coca-Cola 33cl", "Bière pression 25cl"
-5. Si plusieurs formats existent (25cl/50cl), crée un article par format
-6. Pour les vins/champagnes, distingue verre/coupe/bouteille/magnum/jeroboam/mathusalem
-7. **CRITIQUE : Si un article N'A PAS de description dans la carte, mets "description": false (PAS le nom du produit)**
-8. **IMPORTANT : Si un alcool a plusieurs formats (verre/bouteille/magnum), crée UN ARTICLE PAR FORMAT avec le format dans le nom**
-9. **CRITIQUE : Les ROSÉS ne sont PAS des BLANCS ! Classe-les correctement dans vins_roses_**
-10. **CRITIQUE : Si un prix est marqué "-" ou absent, NE CRÉE PAS L'ARTICLE (ignore-le complètement)**
-11. **TABLES/TABLEAUX : Si tu vois un tableau avec colonnes Verre/Bouteille/Magnum, extrais CHAQUE COLONNE comme un article séparé**
-12. **BON SENS : Utilise ton intelligence pour classifier correctement selon le TYPE de plat, si tu constates une incohérence**
-13. **CATEGORIES VIDES : Si une catégorie n'a AUCUN article, omets-la complètement du JSON**
-14. **ACCOMPAGNEMENTS vs SOFTS** : Les frites, purées, riz, légumes vont dans "accompagnements", PAS dans "boissons_soft"
-
-FORMAT DE RÉPONSE (JSON UNIQUEMENT, pas de texte avant/après) :
-Retourne UNIQUEMENT les catégories qui contiennent au moins 1 article.
-Si une catégorie est vide, ne l'inclus pas dans le JSON.
-
-FORMAT DE RÉPONSE (JSON UNIQUEMENT, pas de texte avant/après) :
-{{
-  "entrees": [...],
-  "salades": [...],
-  "plats": [...],
-  "desserts": [...],
-  "planches": [...],
-  "tapas": [...],
-  "pinsa_pizza": [...],
-  "pates": [...],
-  "burgers": [...],
-  "brasserie": [...],
-  "accompagnements": [...],
-  "boissons_soft": [...],  // TOUJOURS PRÉSENT (même vide)
-  "jus": [...],
-  "boissons_chaudes": [...],
-  "bieres_pression": [...],
-  "bieres_bouteilles": [...],
-  "vins_blancs_verre": [...],
-  "vins_rouges_verre": [...],
-  "vins_roses_verre": [...],
-  "vins_blancs_bouteille": [...],
-  "vins_rouges_bouteille": [...],
-  "vins_roses_bouteille": [...],
-  "vins_blancs_magnum": [...],
-  "vins_rouges_magnum": [...],
-  "vins_roses_magnum": [...],
-  "champagnes_coupe": [...],
-  "champagnes_bouteille": [...],
-  "champagnes_magnum": [...],
-  "aperitifs": [...],
-  "spritz": [...],
-  "cocktails": [...],
-  "mocktails": [...],
-  "rhums": [...],
-  "vodkas": [...],
-  "gins": [...],
-  "tequilas": [...],
-  "whiskies": [...],
-  "digestifs": [...],
-  "cognacs_armagnacs": [...]
-}}
+# Consignes pour les tableaux déjà structurés par extract_page_text (un article par ligne)
+MENU_PROMPT_STRUCTURED_TABLE_RULES = """**TABLEAUX STRUCTURÉS :**
+Les lignes entre "[Tableau des formats]" et "[Fin du tableau]" sont déjà UN ARTICLE PAR LIGNE au format "NOM Format : prix".
+Reprends-les telles quelles (nom avec le format, prix) : il te reste seulement à choisir la catégorie."""
 
-Chaque article doit avoir ce format exact :
-{{"nom": "...", "prix": 12.50, "description": "..." ou false}}
+# Version du prompt : toute modification des blocs invalide le cache de classification
+MENU_PROMPT_VERSION = cache_key(
+    MENU_PROMPT_HEADER,
+    json.dumps(MENU_PROMPT_CATEGORY_GROUPS, ensure_ascii=False),
+    MENU_PROMPT_CLASSIFICATION_RULES,
+    json.dumps(MENU_PROMPT_STRICT_RULES, ensure_ascii=False),
+    MENU_PROMPT_FORMAT,
+    MENU_PROMPT_TABLE_RULES,
+    MENU_PROMPT_STRUCTURED_TABLE_RULES,
+    str(PROMPT_ADAPTIVE)
+)[:12]
 
-IMPORTANT : Retourne UNIQUEMENT le JSON, rien d'autre !"""
+def menu_cache_key(text: str) -> str:
+    """Clé du cache de classification pour un texte de carte"""
+    return cache_key(text, MENU_PROMPT_VERSION, GROQ_MODEL)
+
+def normalize_menu_text(text: str) -> str:
+    """Normalise les espaces du texte PDF (espaces multiples, points de conduite, lignes vides répétées)"""
+    pages = []
+    for page_text in text.split(PAGE_SEPARATOR):
+        lines = []
+        for line in page_text.split("\n"):
+            line = re.sub(r"[.…_]{3,}", " ", line)
+            line = re.sub(r"[ \t\u00a0]+", " ", line).strip()
+            if line or (lines and lines[-1]):
+                lines.append(line)
+        pages.append("\n".join(lines).strip("\n"))
+    return PAGE_SEPARATOR.join(pages)
+
+def build_menu_prompt(text: str) -> str:
+    """Construit le prompt de classification avec uniquement les catégories et consignes utiles à cette carte"""
+    lowered = text.lower()
+    groups = [
+        group for group in MENU_PROMPT_CATEGORY_GROUPS
+        if not PROMPT_ADAPTIVE or group[1] is None or re.search(group[1], lowered)
+    ]
+    group_titles = {title for title, _, _ in groups}
+    
+    parts = [MENU_PROMPT_HEADER.format(text=text)]
+    for title, _, categories in groups:
+        lines = "\n".join(f"- {key} : {description}" for key, description in categories)
+        parts.append(f"**{title} :**\n{lines}")
+    parts.append(MENU_PROMPT_CLASSIFICATION_RULES)
+    
+    if GRID_BLOCK_START in text:
+        parts.append(MENU_PROMPT_STRUCTURED_TABLE_RULES)
+    if has_raw_price_grid(text) or not PROMPT_ADAPTIVE:
+        parts.append(MENU_PROMPT_TABLE_RULES)
+    
+    strict_rules = [rule for rule, group in MENU_PROMPT_STRICT_RULES if group is None or group in group_titles]
+    parts.append("**RÈGLES STRICTES :**\n" + "\n".join(f"{i}. {rule}" for i, rule in enumerate(strict_rules, 1)))
+    
+    categories = ", ".join(key for _, _, group_categories in groups for key, _ in group_categories)
+    parts.append(MENU_PROMPT_FORMAT.format(categories=categories))
+    
+    return "\n\n".join(parts)
+
+def estimate_max_tokens(text: str) -> int:
+    """Budget de sortie proportionnel à la taille du texte de la carte"""
+    estimate = int(len(text) / GROQ_CHARS_PER_TOKEN * GROQ_OUTPUT_RATIO) + 512
+    return max(GROQ_MIN_TOKENS, min(GROQ_MAX_TOKENS, estimate))
+
+def record_groq_usage(usage, max_tokens: int, token_usage: Dict = None):
+    """Enregistre les tokens d'un appel Groq (totaux globaux + compteur de la requête en cours)"""
+    if usage is None:
+        return
+    
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    completion_tokens = getattr(usage, "completion_tokens", 0) or 0
+    total_tokens = getattr(usage, "total_tokens", 0) or prompt_tokens + completion_tokens
+    near_ceiling = completion_tokens >= max_tokens * GROQ_CEILING_WARNING
+    
+    if near_ceiling:
+        print(f"⚠️  Réponse Groq proche du plafond : {completion_tokens}/{max_tokens} tokens")
+    print(f"🔢 Tokens Groq : prompt {prompt_tokens}, completion {completion_tokens}, total {total_tokens} (max {max_tokens})")
+    
+    groq_usage_totals["requests"] += 1
+    groq_usage_totals["prompt_tokens"] += prompt_tokens
+    groq_usage_totals["completion_tokens"] += completion_tokens
+    groq_usage_totals["total_tokens"] += total_tokens
+    groq_usage_totals["near_ceiling"] += int(near_ceiling)
+    
+    if token_usage is not None:
+        token_usage["requests"] = token_usage.get("requests", 0) + 1
+        token_usage["prompt_tokens"] = token_usage.get("prompt_tokens", 0) + prompt_tokens
+        token_usage["completion_tokens"] = token_usage.get("completion_tokens", 0) + completion_tokens
+        token_usage["total_tokens"] = token_usage.get("total_tokens", 0) + total_tokens
+        token_usage["max_tokens"] = token_usage.get("max_tokens", 0) + max_tokens
+        token_usage["near_ceiling"] = token_usage.get("near_ceiling", False) or near_ceiling
+
+def parse_groq_json(response_text: str) -> Dict:
+    """Extrait le JSON de la réponse Groq (en retirant les éventuels blocs ```json)"""
+    response_text = response_text.strip()
+    
+    if "```json" in response_text:
+        response_text = response_text.split("```json")[1].split("```")[0]
+    elif "```" in response_text:
+        response_text = response_text.split("```")[1].split("```")[0]
+    
+    return json.loads(response_text)
+
+async def classify_menu_with_groq(text: str, bypass_cache: bool = False, token_usage: Dict = None) -> Dict:
+    """Utilise Groq pour classifier le menu complet (client asynchrone, concurrence bornée)
+    
+    Le résultat est mis en cache sur disque, indexé par le texte, la version du prompt et le modèle.
+    bypass_cache=True force un nouvel appel Groq (et rafraîchit l'entrée du cache).
+    token_usage (optionnel) cumule les tokens consommés par la requête en cours.
+    """
+    
+    key = menu_cache_key(text)
+    if not bypass_cache:
+        cached = cache_get("menus", key)
+        if cached is not None:
+            print(f"⚡ Classification servie depuis le cache ({key[:12]})")
+            return cached
+    
+    prompt = build_menu_prompt(text)
+    max_tokens = estimate_max_tokens(text)
 
     try:
-        response = groq_client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            max_tokens=16000
-        )
-        
-        response_text = response.choices[0].message.content.strip()
+        async with groq_semaphore:
+            response = await groq_client.chat.completions.create(
+                model=GROQ_MODEL,
+                messages=[{"role": "user", "content": prompt}],
+                temperature=0.1,
+                max_tokens=max_tokens
+            )
+            record_groq_usage(response.usage, max_tokens, token_usage)
+            
+            # Réponse tronquée par un budget trop serré : une seule relance avec le plafond complet
+            if response.choices[0].finish_reason == "length" and max_tokens < GROQ_MAX_TOKENS:
+                print(f"⚠️  Réponse tronquée à {max_tokens} tokens, relance avec {GROQ_MAX_TOKENS}")
+                max_tokens = GROQ_MAX_TOKENS
+                response = await groq_client.chat.completions.create(
+                    model=GROQ_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,
+                    max_tokens=max_tokens
+                )
+                record_groq_usage(response.usage, max_tokens, token_usage)
         
-        if "```json" in response_text:
-            response_text = response_text.split("```json")[1].split("```")[0]
-        elif "```" in response_text:
-            response_text = response_text.split("```")[1].split("```")[0]
+        menu_json = parse_groq_json(response.choices[0].message.content)
         
-        menu_json = json.loads(response_text)
+        cache_put("menus", key, menu_json, MENU_CACHE_MAX_BYTES)
         
         return menu_json
         
@@ -212,6 +902,402 @@ IMPORTANT : Retourne UNIQUEMENT le JSON, rien d'autre !"""
         raise HTTPException(status_code=500, detail=f"Erreur Groq API: {str(e)}")
     
 
+class IncrementalMenuParser:
+    """Parseur JSON incrémental pour la réponse Groq {catégorie: [articles]}
+    
+    Reçoit le texte par morceaux et renvoie des événements dès qu'un article
+    (objet de niveau 3) ou une catégorie (tableau de niveau 2) est complet.
+    """
+    
+    def __init__(self):
+        self.started = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.key_chars = []
+        self.last_key = None
+        self.category = None
+        self.article_chars = None
+        self.menu = {}
+    
+    def feed(self, chunk: str) -> List[Dict]:
+        events = []
+        
+        for ch in chunk:
+            if self.finished:
+                break
+            
+            # Ignorer tout ce qui précède l'objet racine (```json, texte...)
+            if not self.started:
+                if ch == "{":
+                    self.started = True
+                    self.depth = 1
+                continue
+            
+            if self.article_chars is not None:
+                self.article_chars.append(ch)
+            
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_key = "".join(self.key_chars)
+                elif self.depth == 1:
+                    self.key_chars.append(ch)
+                continue
+            
+            if ch == '"':
+                self.in_string = True
+                if self.depth == 1:
+                    self.key_chars = []
+            elif ch in "{[":
+                self.depth += 1
+                if self.depth == 2 and ch == "[":
+                    self.category = self.last_key
+                    self.menu[self.category] = []
+                    events.append({"event": "category_start", "category": self.category})
+                elif self.depth == 3 and ch == "{" and self.category:
+                    self.article_chars = ["{"]
+            elif ch in "}]":
+                self.depth -= 1
+                if self.depth == 2 and ch == "}" and self.article_chars is not None:
+                    try:
+                        article = json.loads("".join(self.article_chars))
+                        self.menu[self.category].append(article)
+                        events.append({"event": "article", "category": self.category, "article": article})
+                    except json.JSONDecodeError:
+                        print(f"⚠️  Article illisible ignoré dans le flux ({self.category})")
+                    self.article_chars = None
+                elif self.depth == 1 and ch == "]" and self.category:
+                    events.append({"event": "category", "category": self.category, "articles": self.menu[self.category]})
+                    self.category = None
+                elif self.depth == 0:
+                    self.finished = True
+        
+        return events
+
+def ndjson_event(event: Dict) -> str:
+    """Sérialise un événement en une ligne NDJSON"""
+    return json.dumps(event, ensure_ascii=False) + "\n"
+
+async def stream_classify_menu_with_groq(text: str, bypass_cache: bool = False, token_usage: Dict = None):
+    """Appel Groq en streaming : produit les événements au fil des tokens
+    
+    Une réponse tronquée par le budget estimé est relancée une fois avec GROQ_MAX_TOKENS : les
+    catégories déjà émises en entier sont gardées et rien n'est émis deux fois.
+    Le dernier événement est {"event": "menu", "menu": {...}} avec le menu complet.
+    """
+    key = menu_cache_key(text)
+    if not bypass_cache:
+        cached = cache_get("menus", key)
+        if cached is not None:
+            print(f"⚡ Classification servie depuis le cache ({key[:12]})")
+            for category, items in cached.items():
+                yield {"event": "category", "category": category, "articles": items}
+            yield {"event": "menu", "menu": cached}
+            return
+    
+    prompt = build_menu_prompt(text)
+    max_tokens = estimate_max_tokens(text)
+    # Déjà émis au client : articles par catégorie, catégories complètes
+    emitted_articles = {}
+    completed = {}
+    
+    def is_new(event: Dict, seen: Dict[str, int]) -> bool:
+        category = event["category"]
+        if category in completed:
+            return False
+        if event["event"] == "category_start":
+            if category in emitted_articles:
+                return False
+            emitted_articles[category] = 0
+        elif event["event"] == "article":
+            seen[category] = seen.get(category, 0) + 1
+            if seen[category] <= emitted_articles.get(category, 0):
+                return False
+            emitted_articles[category] = seen[category]
+        elif event["event"] == "category":
+            completed[category] = event["articles"]
+        return True
+    
+    while True:
+        parser = IncrementalMenuParser()
+        response_chunks = []
+        usage = None
+        finish_reason = None
+        seen = {}
+        
+        try:
+            async with groq_semaphore:
+                stream = await groq_client.chat.completions.create(
+                    model=GROQ_MODEL,
+                    messages=[{"role": "user", "content": prompt}],
+                    temperature=0.1,
+                    max_tokens=max_tokens,
+                    stream=True
+                )
+                
+                async for chunk in stream:
+                    # Groq renvoie la consommation de tokens dans x_groq du dernier morceau
+                    if chunk.x_groq and chunk.x_groq.usage:
+                        usage = chunk.x_groq.usage
+                    if not chunk.choices:
+                        continue
+                    finish_reason = getattr(chunk.choices[0], "finish_reason", None) or finish_reason
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    response_chunks.append(delta)
+                    for event in parser.feed(delta):
+                        if is_new(event, seen):
+                            yield event
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Erreur Groq API: {str(e)}")
+        
+        record_groq_usage(usage, max_tokens, token_usage)
+        
+        # Réponse tronquée par un budget trop serré : une seule relance avec le plafond complet
+        if finish_reason == "length" and max_tokens < GROQ_MAX_TOKENS:
+            print(f"⚠️  Réponse tronquée à {max_tokens} tokens, relance avec {GROQ_MAX_TOKENS}")
+            max_tokens = GROQ_MAX_TOKENS
+            continue
+        break
+    
+    # Validation finale sur la réponse complète (le parseur incrémental est tolérant)
+    try:
+        menu_json = parse_groq_json("".join(response_chunks))
+    except json.JSONDecodeError as e:
+        if not parser.finished:
+            print(f"⚠️  JSON invalide reçu de Groq")
+            raise HTTPException(status_code=500, detail=f"Erreur parsing JSON: {str(e)}")
+        menu_json = parser.menu
+    # Le menu final reprend exactement les catégories déjà envoyées au client
+    menu_json.update(completed)
+    
+    cache_put("menus", key, menu_json, MENU_CACHE_MAX_BYTES)
+    
+    yield {"event": "menu", "menu": menu_json}
+    
+
+async def stream_classify_menu(text: str, bypass_cache: bool = False, classification_stats: Dict = None):
+    """Classifie le menu en streaming et produit les événements au fil de l'eau
+    
+    Les articles pré-classés localement sont émis immédiatement, puis ceux de Groq au fil des tokens.
+    Le dernier événement est {"event": "menu", "menu": {...}} avec le menu complet.
+    """
+    text = normalize_menu_text(text)
+    token_usage = {}
+    
+    local_menu = {}
+    if PRECLASSIFY_ENABLED:
+        local_menu, text = preclassify_menu_text(text)
+        for category, items in local_menu.items():
+            yield {"event": "category", "category": category, "articles": items}
+    
+    llm_menu = {}
+    if re.search(r"\d", text):
+        async for event in stream_classify_menu_with_groq(text, bypass_cache, token_usage):
+            if event["event"] == "menu":
+                llm_menu = event["menu"]
+            else:
+                yield event
+    
+    if classification_stats is not None:
+        classification_stats["articles_sans_llm"] = sum(len(items) for items in local_menu.values())
+        classification_stats["articles_llm"] = sum(len(items) for items in llm_menu.values() if isinstance(items, list))
+        classification_stats["tokens"] = token_usage
+    
+    yield {"event": "menu", "menu": merge_classified_chunks([llm_menu, local_menu])}
+
+def is_section_heading(line: str) -> bool:
+    """Détecte un titre de section (ex: "NOS ENTRÉES", "LA BRASSERIE") : court, en majuscules, sans prix"""
+    line = line.strip()
+    if len(line) < 3 or len(line) > 60:
+        return False
+    if any(c.isdigit() for c in line):
+        return False
+    return any(c.isalpha() for c in line) and line == line.upper()
+
+def split_menu_sections(page_text: str) -> List[str]:
+    """Découpe le texte d'une page en blocs commençant chacun par un titre de section"""
+    sections = []
+    current = []
+    
+    for line in page_text.splitlines():
+        if is_section_heading(line) and any(l.strip() for l in current):
+            sections.append("\n".join(current))
+            current = []
+        current.append(line)
+    
+    if any(l.strip() for l in current):
+        sections.append("\n".join(current))
+    
+    return sections
+
+def split_menu_text(text: str, max_chars: int = GROQ_CHUNK_CHARS) -> List[str]:
+    """Découpe le texte de la carte en morceaux d'au plus max_chars, sur les pages puis les sections"""
+    blocks = []
+    for page_text in text.split(PAGE_SEPARATOR):
+        for section in split_menu_sections(page_text):
+            if len(section) <= max_chars:
+                blocks.append(section)
+                continue
+            
+            # Section trop longue (grande carte des vins) : découpe par lignes
+            # en répétant le titre pour garder le contexte de classification
+            lines = section.splitlines()
+            heading = lines[0] if is_section_heading(lines[0]) else ""
+            part = []
+            part_len = 0
+            for line in lines:
+                if part and part_len + len(line) + 1 > max_chars:
+                    blocks.append("\n".join(part))
+                    part = [heading] if heading else []
+                    part_len = len(heading)
+                part.append(line)
+                part_len += len(line) + 1
+            if part:
+                blocks.append("\n".join(part))
+    
+    # Regrouper les blocs consécutifs tant que le morceau reste sous max_chars
+    chunks = []
+    current = ""
+    for block in blocks:
+        if current and len(current) + len(block) + 1 > max_chars:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n{block}" if current else block
+    if current.strip():
+        chunks.append(current)
+    
+    return chunks
+
+def merge_classified_chunks(results: List[Dict]) -> Dict:
+    """Fusionne les résultats de plusieurs morceaux en un seul menu {catégorie: [articles]}"""
+    merged = {}
+    for result in results:
+        for category, items in result.items():
+            if not isinstance(items, list):
+                continue
+            merged.setdefault(category, []).extend(items)
+    return merged
+
+def compile_preclassifier_index(rules: Dict[str, List[str]]):
+    """Compile toutes les règles en une seule regex ancrée, un groupe nommé par catégorie"""
+    alternatives = [f"(?P<{category}>{'|'.join(patterns)})" for category, patterns in rules.items()]
+    return re.compile(r"^(?:" + "|".join(alternatives) + ")", re.IGNORECASE)
+
+PRECLASSIFIER_INDEX = compile_preclassifier_index(PRECLASSIFIER_RULES)
+
+def parse_price(value: str) -> float:
+    """Convertit un prix de carte ("12,50", "12.50€", "8 €") en float"""
+    return float(value.replace("€", "").replace(",", ".").strip())
+
+def preclassify_line(line: str):
+    """Classe localement une ligne "Nom prix" évidente : (catégorie, article) ou None"""
+    match = PRECLASSIFY_LINE_RE.match(line.strip())
+    if not match:
+        return None
+    
+    name = match.group("name").strip()
+    if len(name.split()) > PRECLASSIFY_MAX_NAME_WORDS:
+        return None
+    if PRECLASSIFIER_EXCLUSIONS.search(name) or PRECLASSIFY_EXTRA_PRICE_RE.search(name):
+        return None
+    
+    rule = PRECLASSIFIER_INDEX.match(name)
+    if not rule:
+        return None
+    if len(name.split()) > PRECLASSIFY_MAX_NAME_WORDS_BY_CATEGORY.get(rule.lastgroup, PRECLASSIFY_MAX_NAME_WORDS):
+        return None
+    
+    return rule.lastgroup, {
+        "nom": name.replace('"', "'"),
+        "prix": parse_price(match.group("price")),
+        "description": False
+    }
+
+def preclassify_menu_text(text: str):
+    """Sépare les articles évidents (classés localement) du reste du texte à envoyer à Groq
+    
+    Une ligne n'est retirée que si l'article tient sur une ligne : la ligne suivante doit être
+    un autre article avec prix, un titre de section ou la fin de page (pas une description).
+    Renvoie (menu local {catégorie: [articles]}, texte résiduel).
+    """
+    local_menu = {}
+    residue_pages = []
+    
+    for page_text in text.split(PAGE_SEPARATOR):
+        lines = page_text.split("\n")
+        kept = []
+        
+        for i, line in enumerate(lines):
+            result = preclassify_line(line)
+            if result:
+                next_line = next((l for l in lines[i + 1:] if l.strip()), None)
+                standalone = (
+                    next_line is None
+                    or is_section_heading(next_line)
+                    or PRECLASSIFY_LINE_RE.match(next_line.strip()) is not None
+                )
+                if standalone:
+                    category, article = result
+                    local_menu.setdefault(category, []).append(article)
+                    continue
+            kept.append(line)
+        
+        residue_pages.append("\n".join(kept))
+    
+    return local_menu, PAGE_SEPARATOR.join(residue_pages)
+
+async def classify_menu(text: str, bypass_cache: bool = False, chunked: bool = False, classification_stats: Dict = None) -> Dict:
+    """Classifie le menu, en un seul appel Groq ou par morceaux classifiés en parallèle
+    
+    Les lignes évidentes (sodas, cafés, frites...) sont d'abord classées localement ; seul le reste part chez Groq.
+    Le mode par morceaux est activé par chunked=True ou automatiquement au-delà de GROQ_CHUNK_THRESHOLD
+    caractères : la latence suit alors le plus gros morceau plutôt que la carte entière.
+    classification_stats (optionnel) reçoit le nombre d'articles classés sans LLM et par Groq,
+    ainsi que les tokens consommés (prompt, completion, total).
+    """
+    text = normalize_menu_text(text)
+    token_usage = {}
+    
+    local_menu = {}
+    if PRECLASSIFY_ENABLED:
+        local_menu, text = preclassify_menu_text(text)
+    
+    if not re.search(r"\d", text):
+        # Plus aucun prix dans le résidu : inutile d'appeler Groq
+        llm_menu = {}
+    elif not chunked and len(text) <= GROQ_CHUNK_THRESHOLD:
+        llm_menu = await classify_menu_with_groq(text, bypass_cache, token_usage)
+    else:
+        chunks = split_menu_text(text)
+        if len(chunks) <= 1:
+            llm_menu = await classify_menu_with_groq(text, bypass_cache, token_usage)
+        else:
+            print(f"✂️  Classification en {len(chunks)} morceaux (max {max(len(c) for c in chunks)} caractères)")
+            results = await asyncio.gather(*(classify_menu_with_groq(chunk, bypass_cache, token_usage) for chunk in chunks))
+            llm_menu = merge_classified_chunks(results)
+    
+    local_count = sum(len(items) for items in local_menu.values())
+    llm_count = sum(len(items) for items in llm_menu.values() if isinstance(items, list))
+    if local_count:
+        print(f"⚡ {local_count} article(s) classé(s) sans LLM, {llm_count} par Groq")
+    
+    if classification_stats is not None:
+        classification_stats["articles_sans_llm"] = classification_stats.get("articles_sans_llm", 0) + local_count
+        classification_stats["articles_llm"] = classification_stats.get("articles_llm", 0) + llm_count
+        classification_stats["tokens"] = token_usage
+    
+    return merge_classified_chunks([llm_menu, local_menu])
+    
+
 def clean_empty_categories(menu_data: Dict) -> Dict:
     """Supprime les catégories vides du menu"""
     cleaned = {}
@@ -267,7 +1353,7 @@ def generate_backend_json(restaurant_name: str, qr_mode: str, address: Dict, odo
                 }
             },
             "restaurantName": restaurant_name,
-            "restaurantId": restaurant_name.lower().replace(" ", "_"),
+            "restaurantId": restaurant_id_for(restaurant_name),
             "supervisorRole": "manager",
             "qrMode": qr_mode
         }
@@ -296,12 +1382,19 @@ def generate_backend_json(restaurant_name: str, qr_mode: str, address: Dict, odo
     
     return backend
 
-def generate_frontend_json(restaurant_name: str, colors: Dict, version: int = 1, menu_data: Dict = None, selected_buttons: List[Dict] = None) -> Dict:
-    """Génère le fichier frontend.json (version 1 ou 2)"""
+def generate_frontend_json(restaurant_name: str, colors: Dict, version: int = 1, menu_data: Dict = None, selected_buttons: List[Dict] = None, banner_paths: Dict = None) -> Dict:
+    """Génère le fichier frontend.json (version 1 ou 2)
+    
+    menu_data peut être un menu brut ou un MenuModel (construit une fois par /generate-menu).
+    banner_paths ({"home": ..., "menu": ...}) donne les chemins à empreinte renvoyés par
+    /upload-to-server ; à défaut, les chemins sans empreinte sont réécrits à la publication.
+    """
     
     safe_restaurant_name = restaurant_name.lower().replace(' ', '-').replace('/', '-')
-    home_banner_path = f"/static/adel/home-banner-{safe_restaurant_name}.png"
-    menu_banner_path = f"/static/adel/menu-banner-{safe_restaurant_name}.png"
+    banner_format = primary_image_format()
+    banner_paths = banner_paths or {}
+    home_banner_path = banner_paths.get("home") or f"/static/adel/home-banner-{safe_restaurant_name}.{banner_format}"
+    menu_banner_path = banner_paths.get("menu") or f"/static/adel/menu-banner-{safe_restaurant_name}.{banner_format}"
     
     if version == 1:
         return {
@@ -384,66 +1477,17 @@ def generate_frontend_json(restaurant_name: str, colors: Dict, version: int = 1,
         }
     }
     
+    menu = as_menu_model(menu_data) if menu_data else None
+    
     # ✅ NOUVEAU : Recalculer les drinkIndex si selected_buttons existe
-    if selected_buttons and menu_data:
-        # Calculer l'ordre RÉEL des drinks dans le menu
-        drink_categories_order = [
-            "boissons_soft", "jus", "boissons_chaudes",
-            "bieres_pression", "bieres_bouteilles",
-            "vins_blancs_verre", "vins_rouges_verre", "vins_roses_verre",
-            "vins_blancs_bouteille", "vins_rouges_bouteille", "vins_roses_bouteille",
-            "vins_blancs_magnum", "vins_rouges_magnum", "vins_roses_magnum",
-            "champagnes_coupe", "champagnes_bouteille", "champagnes_magnum",
-            "aperitifs", "spritz", "cocktails", "mocktails",
-            "rhums", "vodkas", "gins", "tequilas", "whiskies", "digestifs", "cognacs_armagnacs"
-        ]
-        
-        category_to_real_index = {}
-        current_drink_index = 0
-        
-        for category in drink_categories_order:
-            if menu_data.get(category) and len(menu_data[category]) > 0:
-                category_to_real_index[category] = current_drink_index
-                current_drink_index += 1
-        
-        # Mettre à jour les drinkIndex dans selected_buttons
-        for button in selected_buttons:
-            if "drinkIndex" in button and button["routerLink"].startswith("/menus/drinks/"):
-                # Trouver la catégorie correspondante
-                old_index = button["drinkIndex"]
-                # On ne peut pas retrouver la catégorie depuis l'ancien index, donc on garde tel quel
-                # MAIS le frontend JS aura recalculé correctement
-                pass
-        
-        frontend["home"]["buttons"] = selected_buttons
-    elif menu_data:
-        frontend["home"]["buttons"] = detect_active_sections(menu_data)
+    if selected_buttons and menu:
+        frontend["home"]["buttons"] = reconcile_button_indexes(selected_buttons, menu.drink_indexes)
+    elif menu:
+        frontend["home"]["buttons"] = detect_active_sections(menu)
     
     # Déterminer les sections disponibles dans menu
-    has_food = False
-    has_drinks = False
-    
-    food_categories = ["entrees", "salades", "plats", "burgers", "brasserie", "desserts", 
-                      "planches", "tapas", "pinsa_pizza", "pates", "accompagnements"]
-    drink_categories = ["boissons_soft", "jus", "boissons_chaudes", "bieres_pression", 
-                       "bieres_bouteilles", "vins_blancs_verre", "vins_rouges_verre", 
-                       "vins_roses_verre", "vins_blancs_bouteille", "vins_rouges_bouteille", 
-                       "vins_roses_bouteille", "champagnes_coupe", "champagnes_bouteille", 
-                       "aperitifs", "spritz", "cocktails", "mocktails", "rhums", "vodkas", 
-                       "gins", "tequilas", "whiskies", "digestifs", "cognacs_armagnacs",
-                       "vins_blancs_magnum", "vins_rouges_magnum", "vins_roses_magnum",
-                       "champagnes_magnum"]
-    
-    if menu_data:
-        for cat in food_categories:
-            if menu_data.get(cat) and len(menu_data[cat]) > 0:
-                has_food = True
-                break
-        
-        for cat in drink_categories:
-            if menu_data.get(cat) and len(menu_data[cat]) > 0:
-                has_drinks = True
-                break
+    has_food = bool(menu) and menu.has_food
+    has_drinks = bool(menu) and menu.has_drinks
     
     if has_drinks:
         frontend["menu"]["drinks"] = {
@@ -459,218 +1503,133 @@ def generate_frontend_json(restaurant_name: str, colors: Dict, version: int = 1,
     
     return frontend
 
-def detect_active_sections(menu_data: Dict) -> List[Dict]:
+def detect_active_sections(menu_data) -> List[Dict]:
     """Détecte TOUTES les sections actives et génère des suggestions avec les BONS index"""
     
-    sections_config = [
-        # La carte (nourriture) - PAS un drink
-        {
-            "categories": ["entrees", "salades", "plats", "burgers", "brasserie", "desserts", 
-                          "planches", "tapas", "pinsa_pizza", "pates", "accompagnements"],
-            "button": {
-                "routerLink": "/menus",
-                "label": {"fr": "La carte", "en": "The menu"},
-                "drinkIndex": None
-            },
-            "priority": 1
-        }
-    ]
-    
-    # DRINKS avec numérotation FIXE et PRÉVISIBLE
-    drink_sections = [
-        {
-            "categories": ["boissons_soft", "jus"],
-            "button": {
-                "label": {"fr": "Boissons fraîches", "en": "Cold drinks"}
-            },
-            "priority": 4,
-            "fixed_index": 0 
-        },
-        {
-            "categories": ["boissons_chaudes"],
-            "button": {
-                "label": {"fr": "Boissons chaudes", "en": "Hot drinks"}
-            },
-            "priority": 5,
-            "fixed_index": 1 
-        },
-        {
-            "categories": ["bieres_pression", "bieres_bouteilles"],
-            "button": {
-                "label": {"fr": "Bières", "en": "Beers"}
-            },
-            "priority": 6,
-            "fixed_index": 2  
-        },
-        {
-            "categories": ["vins_blancs_verre", "vins_rouges_verre", "vins_roses_verre",
-                          "vins_blancs_bouteille", "vins_rouges_bouteille", "vins_roses_bouteille",
-                          "vins_blancs_magnum", "vins_rouges_magnum", "vins_roses_magnum"],
-            "button": {
-                "label": {"fr": "Vins", "en": "Wines"}
-            },
-            "priority": 3,
-            "fixed_index": 3  
-        },
-        {
-            "categories": ["champagnes_coupe", "champagnes_bouteille", "champagnes_magnum"],
-            "button": {
-                "label": {"fr": "Champagnes", "en": "Champagnes"}
-            },
-            "priority": 7,
-            "fixed_index": 4  
-        },
-        {
-            "categories": ["cocktails", "mocktails", "aperitifs", "spritz"],
-            "button": {
-                "label": {"fr": "Cocktails", "en": "Cocktails"}
-            },
-            "priority": 2,
-            "fixed_index": 5  
-        },
-        {
-            "categories": ["rhums", "vodkas", "gins", "tequilas", "whiskies", 
-                          "digestifs", "cognacs_armagnacs"],
-            "button": {
-                "label": {"fr": "Spiritueux", "en": "Spirits"}
-            },
-            "priority": 8,
-            "fixed_index": 6  
-        }
-    ]
-    
-    # Ajouter les sections de drinks AVEC leur index fixe
-    for drink_section in drink_sections:
-        total_items = sum(
-            len(menu_data.get(cat, [])) 
-            for cat in drink_section["categories"]
-        )
-        
-        if total_items > 0:
-            drink_section["button"]["routerLink"] = f"/menus/drinks/{drink_section['fixed_index']}"
-            drink_section["button"]["drinkIndex"] = drink_section["fixed_index"]
-            sections_config.append(drink_section)
-    
-    # Générer les suggestions
+    menu = as_menu_model(menu_data)
     suggestions = []
     
-    for section_config in sections_config:
-        total_items = sum(
-            len(menu_data.get(cat, [])) 
-            for cat in section_config["categories"]
-        )
+    for label_fr, label_en, priority, categories in MENU_BUTTON_GROUPS:
+        total_items = sum(menu.counts.get(cat, 0) for cat in categories)
+        if total_items == 0:
+            continue
+        
+        button = {"label": {"fr": label_fr, "en": label_en}}
+        if categories is FOOD_CATEGORIES:
+            # La carte (nourriture) - PAS un drink
+            button.update({"routerLink": "/menus", "drinkIndex": None})
+        else:
+            # Index réel de la première catégorie active du groupe dans menus.json
+            drink_index = first_drink_index(categories, menu.drink_indexes)
+            button.update({"routerLink": f"/menus/drinks/{drink_index}", "drinkIndex": drink_index})
         
-        if total_items > 0:
-            suggestions.append({
-                **section_config["button"],
-                "item_count": total_items,
-                "priority": section_config["priority"]
-            })
+        suggestions.append({**button, "item_count": total_items, "priority": priority})
     
     suggestions.sort(key=lambda x: x["priority"])
     
     return suggestions
 
-def generate_menus_json(menu_data: Dict, restaurant_id: str, item_images: Dict = None) -> Dict:
-    """Génère le fichier menus.4.json au format Odoo"""
-    
+def reconcile_button_indexes(buttons: List[Dict], drink_indexes: Dict[str, int]) -> List[Dict]:
+    """Recale drinkIndex/routerLink des boutons de boissons sur l'ordre réel de menus.json"""
+    for button in buttons:
+        if "drinkIndex" not in button:
+            continue
+        
+        # Trouver la première catégorie active pour cette section
+        label = button["label"]["fr"]
+        real_index = first_drink_index(BUTTON_LABEL_CATEGORIES.get(label, ()), drink_indexes)
+        if real_index is not None:
+            button["drinkIndex"] = real_index
+            button["routerLink"] = f"/menus/drinks/{real_index}"
+            print(f"✅ Bouton '{label}' -> index {real_index}")
+    
+    return buttons
+
+def article_signature(article: Dict) -> tuple:
+    """Champs issus du menu source (hors image) : deux articles de même signature sont identiques"""
+    return (
+        article["articleId"], article["name"]["fr"], article["price"]["amount"],
+        article["descr"]["fr"], article["allergens"]["fr"]
+    )
+
+def generate_menus_json(menu_data, restaurant_id: str, item_images: Dict = None, previous_menus: Dict = None, changes: Dict = None) -> Dict:
+    """Génère le fichier menus.4.json au format Odoo (menu brut ou MenuModel)
+    
+    Avec previous_menus (le menus.4.json déjà publié), une section dont les articles n'ont pas
+    changé est reprise telle quelle (images comprises) et un article inchangé garde son image
+    si item_images ne la fournit pas ; changes reçoit le détail des sections et articles modifiés.
+    """
+    
     menus_json = {
         "menus": [],
         "sections": [],
         "drinks": []
     }
     
-    # Mapping des catégories
-    category_mapping = {
-        "entrees": {"section": "sections", "name": {"fr": "ENTRÉES", "en": "STARTERS"}},
-        "salades": {"section": "sections", "name": {"fr": "SALADES", "en": "SALADS"}},
-        "plats": {"section": "sections", "name": {"fr": "PLATS", "en": "MAINS"}},
-        "desserts": {"section": "sections", "name": {"fr": "DESSERTS", "en": "DESSERTS"}},
-        "planches": {"section": "sections", "name": {"fr": "PLANCHES", "en": "BOARDS"}},
-        "tapas": {"section": "sections", "name": {"fr": "TAPAS", "en": "TAPAS"}},
-        "pinsa_pizza": {"section": "sections", "name": {"fr": "PINSA & PIZZA", "en": "PINSA & PIZZA"}},
-        "pates": {"section": "sections", "name": {"fr": "PÂTES", "en": "PASTA"}},
-        "burgers": {"section": "sections", "name": {"fr": "BURGERS", "en": "BURGERS"}},
-        "brasserie": {"section": "sections", "name": {"fr": "LA BRASSERIE", "en": "BRASSERIE"}},
-        "accompagnements": {"section": "sections", "name": {"fr": "ACCOMPAGNEMENTS", "en": "SIDE DISHES"}},
-        
-        "boissons_soft": {"section": "drinks", "name": {"fr": "SOFTS-EAUX", "en": "SOFT DRINKS"}},
-        "jus": {"section": "drinks", "name": {"fr": "JUS", "en": "JUICES"}},
-        "boissons_chaudes": {"section": "drinks", "name": {"fr": "CAFÉTERIE", "en": "HOT DRINKS"}},
-        
-        "bieres_pression": {"section": "drinks", "name": {"fr": "BIÈRES PRESSION", "en": "DRAFT BEERS"}},
-        "bieres_bouteilles": {"section": "drinks", "name": {"fr": "BIÈRES BOUTEILLES", "en": "BOTTLED BEERS"}},
-        
-        "vins_blancs_verre": {"section": "drinks", "name": {"fr": "VINS BLANCS VERRE", "en": "WHITE WINES GLASS"}},
-        "vins_rouges_verre": {"section": "drinks", "name": {"fr": "VINS ROUGES VERRE", "en": "RED WINES GLASS"}},
-        "vins_roses_verre": {"section": "drinks", "name": {"fr": "VINS ROSÉS VERRE", "en": "ROSÉ WINES GLASS"}},
-        
-        "vins_blancs_bouteille": {"section": "drinks", "name": {"fr": "VINS BLANCS BOUTEILLE", "en": "WHITE WINES BOTTLE"}},
-        "vins_rouges_bouteille": {"section": "drinks", "name": {"fr": "VINS ROUGES BOUTEILLE", "en": "RED WINES BOTTLE"}},
-        "vins_roses_bouteille": {"section": "drinks", "name": {"fr": "VINS ROSÉS BOUTEILLE", "en": "ROSÉ WINES BOTTLE"}},
-        
-        "vins_blancs_magnum": {"section": "drinks", "name": {"fr": "VINS BLANCS MAGNUM", "en": "WHITE WINES MAGNUM"}},
-        "vins_rouges_magnum": {"section": "drinks", "name": {"fr": "VINS ROUGES MAGNUM", "en": "RED WINES MAGNUM"}},
-        "vins_roses_magnum": {"section": "drinks", "name": {"fr": "VINS ROSÉS MAGNUM", "en": "ROSÉ WINES MAGNUM"}},
-        
-        "champagnes_coupe": {"section": "drinks", "name": {"fr": "CHAMPAGNES COUPE", "en": "CHAMPAGNES GLASS"}},
-        "champagnes_bouteille": {"section": "drinks", "name": {"fr": "CHAMPAGNES BOUTEILLE", "en": "CHAMPAGNES BOTTLE"}},
-        "champagnes_magnum": {"section": "drinks", "name": {"fr": "CHAMPAGNES MAGNUM", "en": "CHAMPAGNES MAGNUM"}},
-        
-        "aperitifs": {"section": "drinks", "name": {"fr": "APÉRITIFS", "en": "APERITIFS"}},
-        "spritz": {"section": "drinks", "name": {"fr": "SPRITZ", "en": "SPRITZ"}},
-        "cocktails": {"section": "drinks", "name": {"fr": "COCKTAILS", "en": "COCKTAILS"}},
-        "mocktails": {"section": "drinks", "name": {"fr": "MOCKTAILS", "en": "MOCKTAILS"}},
-        
-        "rhums": {"section": "drinks", "name": {"fr": "RHUMS", "en": "RUMS"}},
-        "vodkas": {"section": "drinks", "name": {"fr": "VODKAS", "en": "VODKAS"}},
-        "gins": {"section": "drinks", "name": {"fr": "GINS", "en": "GINS"}},
-        "tequilas": {"section": "drinks", "name": {"fr": "TEQUILAS", "en": "TEQUILAS"}},
-        "whiskies": {"section": "drinks", "name": {"fr": "WHISKIES", "en": "WHISKIES"}},
-        "digestifs": {"section": "drinks", "name": {"fr": "DIGESTIFS", "en": "DIGESTIFS"}},
-        "cognacs_armagnacs": {"section": "drinks", "name": {"fr": "COGNACS & ARMAGNACS", "en": "COGNACS & ARMAGNACS"}}
-    }
+    menu = as_menu_model(menu_data)
     
-    current_id = 4000
+    previous_sections = {}
+    previous_images = {}
+    # Menu publié avec des ID séquentiels (4000+) : les images sont retrouvées par (catégorie, nom)
+    sequential_images = {}
+    if previous_menus:
+        for section_type in ("sections", "drinks"):
+            for section in previous_menus.get(section_type, []):
+                previous_sections[(section_type, section["name"]["fr"])] = section
+                for article in section.get("articles", []):
+                    previous_images[article["articleId"]] = article.get("img", "")
+                    article_id = str(article["articleId"])
+                    if article.get("img") and article_id.isdigit() and int(article_id) < ARTICLE_ID_OFFSET:
+                        key = (section_type, section["name"]["fr"], normalize_article_name(article["name"]["fr"]))
+                        sequential_images.setdefault(key, []).append(article["img"])
     
-    for category, items in menu_data.items():
-        if category not in category_mapping:
-            continue
+    if changes is not None:
+        changes.update({"sections_changed": [], "sections_unchanged": [], "sections_removed": [],
+                        "articles_added": [], "articles_modified": [], "articles_removed": []})
+    
+    # Ordre du registre : c'est lui qui détermine les drinkIndex
+    for category, articles in menu.categories.items():
+        section_type = CATEGORY_SECTION[category]
+        section_name = CATEGORY_NAMES[category]["fr"]
+        previous_section = previous_sections.pop((section_type, section_name), None)
         
-        if not items or len(items) == 0:
-            continue
-            
-        cat_info = category_mapping[category]
-        section_type = cat_info["section"]
+        # Section inchangée (mêmes articles, même ordre, pas de nouvelle image) : reprise telle quelle
+        if previous_section is not None and not any(entry.article_id in (item_images or {}) for entry in articles):
+            previous_signatures = [article_signature(article) for article in previous_section.get("articles", [])]
+            current_signatures = [
+                (entry.article_id, entry.name, float(entry.price), entry.description, entry.allergens) for entry in articles
+            ]
+            if previous_signatures == current_signatures:
+                menus_json[section_type].append(previous_section)
+                if changes is not None:
+                    changes["sections_unchanged"].append(section_name)
+                continue
         
         category_section = {
-            "name": cat_info["name"],
+            "name": dict(CATEGORY_NAMES[category]),
             "articles": []
         }
         
-        for item in items:
+        for entry in articles:
             #  Récupérer l'image si elle existe
-            article_id = str(current_id)
-            image_path = ""
-            if item_images and article_id in item_images:
-                image_path = item_images[article_id]
-            
-            desc_value = item.get("description", False)
-            desc_text = "" if (desc_value is False or not desc_value or desc_value == item["nom"]) else desc_value
-
-            # ✅ NOUVEAU : Gérer les allergènes
-            allergens_value = item.get("allergens", False)
-            allergens_text = "" if (allergens_value is False or not allergens_value) else allergens_value
-            
+            image_path = previous_images.get(entry.article_id, "")
+            if not image_path and sequential_images:
+                same_name = sequential_images.get((section_type, section_name, normalize_article_name(entry.name)))
+                image_path = same_name.pop(0) if same_name else ""
+            if item_images and entry.article_id in item_images:
+                image_path = item_images[entry.article_id]
+                # Variantes renvoyées par /upload-item-images : garder le format principal
+                if isinstance(image_path, dict):
+                    image_path = image_path.get(primary_image_format()) or next(iter(image_path.values()), "")
             
             article = {
-                "name": {"fr": item["nom"], "en": item["nom"]},
-                "articleId": article_id,
-                "posName": item["nom"],
-                "price": {"priceId": "", "amount": float(item["prix"])},
+                "name": {"fr": entry.name, "en": entry.name},
+                "articleId": entry.article_id,
+                "posName": entry.name,
+                "price": {"priceId": "", "amount": float(entry.price)},
                 "img": image_path,
-                "descr": {"fr": desc_text, "en": desc_text},
-                "allergens": {"fr": allergens_text, "en": allergens_text}, # ✅ MODIFIÉ
+                "descr": {"fr": entry.description, "en": entry.description},
+                "allergens": {"fr": entry.allergens, "en": entry.allergens}, # ✅ MODIFIÉ
                 "additional": {"fr": "", "en": ""},
                 "wine_pairing": {"fr": "", "en": ""},
                 "options": [],
@@ -679,12 +1638,24 @@ def generate_menus_json(menu_data: Dict, restaurant_id: str, item_images: Dict =
             }
             
             category_section["articles"].append(article)
-            current_id += 1
         
-        if section_type == "sections":
-            menus_json["sections"].append(category_section)
-        else:
-            menus_json["drinks"].append(category_section)
+        menus_json[section_type].append(category_section)
+        
+        if changes is not None and previous_menus is not None:
+            changes["sections_changed"].append(section_name)
+            old_articles = {article["articleId"]: article_signature(article) for article in (previous_section or {}).get("articles", [])}
+            for article in category_section["articles"]:
+                old_signature = old_articles.pop(article["articleId"], None)
+                if old_signature is None:
+                    changes["articles_added"].append(article["articleId"])
+                elif old_signature != article_signature(article) or article["img"] != previous_images.get(article["articleId"]):
+                    changes["articles_modified"].append(article["articleId"])
+            changes["articles_removed"].extend(old_articles)
+    
+    if changes is not None:
+        for (_, section_name), section in previous_sections.items():
+            changes["sections_removed"].append(section_name)
+            changes["articles_removed"].extend(article["articleId"] for article in section.get("articles", []))
     
     return menus_json
 
@@ -695,86 +1666,48 @@ def home():
         "version": "3.0",
         "endpoints": {
             "/extract-menu": "POST - Extrait le menu pour prévisualisation",
-            "/generate-menu": "POST - Génère les 3 fichiers JSON finaux (backend, frontend, articles)"
+            "/extract-menu/stream": "POST - Extraction en streaming (NDJSON, catégorie par catégorie)",
+            "/extract-menu/batch": "POST - Extraction de plusieurs menus (PDF multiples ou ZIP)",
+            "/jobs/{type}": "POST - Lance extract-menu, generate-menu, upload-item-images ou upload-to-server en arrière-plan",
+            "/jobs/{job_id}": "GET - État d'un job (?wait=30 pour attendre la fin)",
+            "/generate-menu": "POST - Génère les 3 fichiers JSON finaux (backend, frontend, articles)",
+            "/menus/{restaurant_id}": "GET - Restaurant, version du menu (?version=N) et versions conservées ; PATCH - Modifie des articles et republie menus.4.json"
         }
     }
 
 
 @app.post("/reconcile-drink-indexes")
 async def reconcile_drink_indexes(
-    validated_menu: str = Form(...),
-    selected_buttons: str = Form(...)
+    validated_menu: str = Form(None),
+    selected_buttons: str = Form(...),
+    menu_id: str = Form(None),
+    menu_version: int = Form(None)
 ):
-    """Réconcilie les drinkIndex avec l'ordre RÉEL des catégories dans le menu final"""
+    """Réconcilie les drinkIndex avec l'ordre RÉEL des catégories dans le menu final
+    
+    Le menu est envoyé (validated_menu) ou désigné par menu_id/menu_version ; avec menu_id, les
+    boutons réconciliés sont enregistrés et réutilisés par /generate-menu.
+    """
     try:
-        menu_data = json.loads(validated_menu)
+        if validated_menu:
+            menu_data = json.loads(validated_menu)
+        elif menu_id:
+            stored = load_menu_version(menu_id, menu_version)
+            if stored is None:
+                raise HTTPException(status_code=404, detail=f"Menu {menu_id} introuvable")
+            menu_data = stored["menu"]
+        else:
+            raise HTTPException(status_code=400, detail="Vous devez fournir soit validated_menu, soit menu_id")
         buttons = json.loads(selected_buttons)
         
-        # ✅ Calculer l'ordre RÉEL des drinks EXACTEMENT comme dans generate_menus_json
-        drink_categories_order = [
-            "boissons_soft", "jus", "boissons_chaudes",
-            "bieres_pression", "bieres_bouteilles",
-            "vins_blancs_verre", "vins_rouges_verre", "vins_roses_verre",
-            "vins_blancs_bouteille", "vins_rouges_bouteille", "vins_roses_bouteille",
-            "vins_blancs_magnum", "vins_rouges_magnum", "vins_roses_magnum",
-            "champagnes_coupe", "champagnes_bouteille", "champagnes_magnum",
-            "aperitifs", "spritz", "cocktails", "mocktails",
-            "rhums", "vodkas", "gins", "tequilas", "whiskies", "digestifs", "cognacs_armagnacs"
-        ]
-        
-        # Créer le mapping catégorie -> index RÉEL
-        category_to_real_index = {}
-        current_drink_index = 0
-        
-        for category in drink_categories_order:
-            if menu_data.get(category) and len(menu_data[category]) > 0:
-                category_to_real_index[category] = current_drink_index
-                current_drink_index += 1
-        
+        # ✅ Ordre RÉEL des drinks : le même registre que generate_menus_json
+        category_to_real_index = MenuModel(menu_data).drink_indexes
         print(f"📍 Mapping catégorie -> index réel: {category_to_real_index}")
         
-        # ✅ Mapping des sections vers leurs catégories principales
-        section_to_categories = {
-            "Boissons fraîches": ["boissons_soft", "jus"],
-            "Cold drinks": ["boissons_soft", "jus"],
-            "Boissons chaudes": ["boissons_chaudes"],
-            "Hot drinks": ["boissons_chaudes"],
-            "Bières": ["bieres_pression", "bieres_bouteilles"],
-            "Beers": ["bieres_pression", "bieres_bouteilles"],
-            "Vins": ["vins_blancs_verre", "vins_rouges_verre", "vins_roses_verre",
-                     "vins_blancs_bouteille", "vins_rouges_bouteille", "vins_roses_bouteille",
-                     "vins_blancs_magnum", "vins_rouges_magnum", "vins_roses_magnum"],
-            "Wines": ["vins_blancs_verre", "vins_rouges_verre", "vins_roses_verre",
-                      "vins_blancs_bouteille", "vins_rouges_bouteille", "vins_roses_bouteille",
-                      "vins_blancs_magnum", "vins_rouges_magnum", "vins_roses_magnum"],
-            "Champagnes": ["champagnes_coupe", "champagnes_bouteille", "champagnes_magnum"],
-            "Cocktails": ["cocktails", "mocktails", "aperitifs", "spritz"],
-            "Spiritueux": ["rhums", "vodkas", "gins", "tequilas", "whiskies", "digestifs", "cognacs_armagnacs"],
-            "Spirits": ["rhums", "vodkas", "gins", "tequilas", "whiskies", "digestifs", "cognacs_armagnacs"]
-        }
-        
         # ✅ Mettre à jour les drinkIndex pour chaque bouton
-        reconciled_buttons = []
-        
-        for button in buttons:
-            if "drinkIndex" in button:
-                # Trouver la première catégorie active pour cette section
-                label = button["label"]["fr"]
-                categories = section_to_categories.get(label, [])
-                
-                first_active_category = None
-                for cat in categories:
-                    if cat in category_to_real_index:
-                        first_active_category = cat
-                        break
-                
-                if first_active_category:
-                    real_index = category_to_real_index[first_active_category]
-                    button["drinkIndex"] = real_index
-                    button["routerLink"] = f"/menus/drinks/{real_index}"
-                    print(f"✅ Bouton '{label}' -> index {real_index} (catégorie: {first_active_category})")
-            
-            reconciled_buttons.append(button)
+        reconciled_buttons = reconcile_button_indexes(buttons, category_to_real_index)
+        if menu_id:
+            save_restaurant(menu_id, selected_buttons=reconciled_buttons)
         
         return {
             "success": True,
@@ -782,9 +1715,458 @@ async def reconcile_drink_indexes(
             "category_mapping": category_to_real_index
         }
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur réconciliation: {str(e)}")
 
+def normalize_grid_word(word: str) -> str:
+    """Normalise un mot pour la détection des en-têtes de formats ("Bouteille", "75 cl"...)"""
+    return word.strip().strip(".:").lower().replace(" ", "")
+
+def has_raw_price_grid(text: str) -> bool:
+    """Le texte contient-il un en-tête de tableau de formats non structuré ?
+    
+    L'en-tête est soit une ligne avec au moins deux formats ("Verre  Bouteille  Magnum"),
+    soit plusieurs lignes consécutives ne contenant chacune qu'un format (une cellule par ligne).
+    """
+    outside_blocks = re.sub(re.escape(GRID_BLOCK_START) + r".*?" + re.escape(GRID_BLOCK_END), "", text, flags=re.S)
+    
+    consecutive = 0
+    for line in outside_blocks.splitlines():
+        words = line.split()
+        formats = sum(1 for word in words if normalize_grid_word(word) in GRID_FORMATS)
+        if formats >= 2:
+            return True
+        consecutive = consecutive + 1 if words and formats == len(words) else 0
+        if consecutive >= 2:
+            return True
+    
+    return False
+
+def group_word_rows(words: List[tuple]) -> List[List[tuple]]:
+    """Regroupe les mots fitz (x0, y0, x1, y1, texte, ...) en lignes visuelles, de haut en bas"""
+    rows = []
+    for word in sorted(words, key=lambda w: ((w[1] + w[3]) / 2, w[0])):
+        center = (word[1] + word[3]) / 2
+        if rows:
+            last = rows[-1]
+            last_center = (last[0][1] + last[0][3]) / 2
+            if abs(center - last_center) <= (last[0][3] - last[0][1]) / 2:
+                last.append(word)
+                continue
+        rows.append([word])
+    
+    return [sorted(row, key=lambda w: w[0]) for row in rows]
+
+def merge_euro_tokens(row: List[tuple]) -> List[tuple]:
+    """Recolle les "€" isolés au prix qui les précède ("150 €" -> "150€")"""
+    merged = []
+    for word in row:
+        if word[4].strip() == "€" and merged:
+            previous = merged[-1]
+            merged[-1] = (previous[0], previous[1], word[2], previous[3], previous[4] + "€")
+        else:
+            merged.append(word)
+    return merged
+
+def parse_grid_row(row: List[tuple], columns: List[tuple]):
+    """Découpe une ligne de tableau en nom + une cellule (prix ou None) par colonne
+    
+    Renvoie None si la ligne n'a aucune cellule alignée sur les colonnes de l'en-tête.
+    """
+    centers = [center for center, _ in columns]
+    gaps = [b - a for a, b in zip(centers, centers[1:])]
+    tolerance = (min(gaps) if gaps else 60) * 0.6
+    
+    cells = {}
+    first_cell_index = None
+    for index, word in enumerate(row):
+        token = word[4].strip()
+        if not (GRID_PRICE_RE.match(token) or token in GRID_EMPTY_CELLS):
+            continue
+        center = (word[0] + word[2]) / 2
+        column = min(range(len(centers)), key=lambda i: abs(centers[i] - center))
+        if abs(centers[column] - center) > tolerance:
+            continue
+        cells[column] = None if token in GRID_EMPTY_CELLS else token.rstrip("€").replace(",", ".")
+        if first_cell_index is None:
+            first_cell_index = index
+    
+    if first_cell_index is None or first_cell_index == 0:
+        return None
+    
+    # Le nom : les mots contigus juste avant la première cellule
+    name_words = [row[first_cell_index - 1]]
+    for word in reversed(row[:first_cell_index - 1]):
+        if name_words[0][0] - word[2] > GRID_NAME_GAP:
+            break
+        name_words.insert(0, word)
+    
+    return {
+        "name": " ".join(w[4] for w in name_words),
+        "cells": [(label, cells.get(i)) for i, (_, label) in enumerate(columns)],
+        "bbox": (name_words[0][0], min(w[1] for w in row), max(w[2] for w in row), max(w[3] for w in row))
+    }
+
+def detect_price_grids(page) -> List[Dict]:
+    """Détecte les tableaux de prix par format (Verre/Bouteille/Magnum...) à partir des positions des mots
+    
+    Une ligne sans prix suivie d'une ligne de prix seuls forme un même article (nom et prix sur
+    deux lignes). Les autres lignes non découpées (descriptions...) sont gardées telles quelles
+    ({"raw": texte}) : tout le texte du tableau parvient au modèle.
+    """
+    grids = []
+    current = None
+    # Ligne sans prix en attente : nom d'un article dont les prix sont sur la ligne suivante ?
+    pending = None
+    
+    def flush_pending():
+        """La ligne en attente n'était pas un nom : titre (fin du tableau) ou texte brut"""
+        nonlocal current, pending
+        if pending is None or current is None:
+            pending = None
+            return
+        text = " ".join(w[4] for w in pending)
+        if is_section_heading(text):
+            current = None
+        else:
+            current["rows"].append({"raw": text})
+        pending = None
+    
+    for row in group_word_rows(page.get_text("words")):
+        row = merge_euro_tokens(row)
+        tokens = [w[4].strip() for w in row]
+        price_tokens = [t for t in tokens if GRID_PRICE_RE.match(t)]
+        headers = [w for w in row if normalize_grid_word(w[4]) in GRID_FORMATS]
+        
+        # "Heineken 25cl 4,50 50cl 7" contient des formats mais c'est un article, pas un en-tête
+        if len(headers) >= 2 and not price_tokens:
+            flush_pending()
+            current = {
+                "title": " ".join(w[4] for w in row if w not in headers),
+                "columns": [((w[0] + w[2]) / 2, GRID_FORMATS[normalize_grid_word(w[4])]) for w in headers],
+                "rows": [],
+                "bbox": [min(w[0] for w in row), min(w[1] for w in row), max(w[2] for w in row), max(w[3] for w in row)]
+            }
+            grids.append(current)
+            continue
+        
+        if current is None:
+            continue
+        
+        parsed = parse_grid_row(row, current["columns"])
+        only_prices = price_tokens and all(GRID_PRICE_RE.match(t) or t in GRID_EMPTY_CELLS for t in tokens)
+        if parsed is None and pending is not None and only_prices:
+            parsed = parse_grid_row(pending + row, current["columns"])
+            if parsed is not None:
+                pending = None
+        
+        if parsed is None:
+            flush_pending()
+            if current is None:
+                continue
+            if price_tokens:
+                current["rows"].append({"raw": " ".join(tokens)})
+            else:
+                pending = row
+            continue
+        
+        flush_pending()
+        if current is None:
+            continue
+        current["rows"].append(parsed)
+        bbox = current["bbox"]
+        bbox[0] = min(bbox[0], parsed["bbox"][0])
+        bbox[1] = min(bbox[1], parsed["bbox"][1])
+        bbox[2] = max(bbox[2], parsed["bbox"][2])
+        bbox[3] = max(bbox[3], parsed["bbox"][3])
+    
+    # Les lignes brutes après le dernier article sont hors de la zone du tableau : elles restent
+    # dans le texte de la page
+    for grid in grids:
+        while grid["rows"] and "raw" in grid["rows"][-1]:
+            grid["rows"].pop()
+    return [grid for grid in grids if any("raw" not in row for row in grid["rows"])]
+
+def format_price_grid(grid: Dict) -> str:
+    """Écrit un tableau détecté sous forme d'un article par ligne et par format ("NOM Format : prix")"""
+    lines = [GRID_BLOCK_START]
+    if grid["title"]:
+        lines.append(grid["title"])
+    for row in grid["rows"]:
+        if "raw" in row:
+            lines.append(row["raw"])
+            continue
+        for label, price in row["cells"]:
+            if price is not None:
+                lines.append(f"{row['name']} {label} : {price}€")
+    lines.append(GRID_BLOCK_END)
+    return "\n".join(lines)
+
+def extract_page_text(page) -> str:
+    """Texte d'une page, avec les tableaux de formats remplacés par des lignes pré-structurées"""
+    text = page.get_text()
+    if not has_raw_price_grid(text):
+        return text
+    
+    grids = detect_price_grids(page)
+    if not grids:
+        return text
+    
+    # Reconstruire la page ligne par ligne (get_text("dict")) en remplaçant
+    # les lignes situées dans la zone d'un tableau par sa version structurée
+    lines = []
+    inserted = set()
+    for block in page.get_text("dict")["blocks"]:
+        if block.get("type") != 0:
+            continue
+        for line in block["lines"]:
+            x0, y0, x1, y1 = line["bbox"]
+            cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+            
+            grid_index = next(
+                (i for i, g in enumerate(grids)
+                 if g["bbox"][0] - 2 <= cx <= g["bbox"][2] + 2 and g["bbox"][1] - 2 <= cy <= g["bbox"][3] + 2),
+                None
+            )
+            if grid_index is None:
+                lines.append("".join(span["text"] for span in line["spans"]))
+            elif grid_index not in inserted:
+                lines.append(format_price_grid(grids[grid_index]))
+                inserted.add(grid_index)
+    
+    return "\n".join(lines) + "\n"
+
+def get_process_pool(name: str, max_workers: int) -> ProcessPoolExecutor:
+    """Pool de processus nommé (créé au premier usage)"""
+    pool = process_pools.get(name)
+    if pool is None:
+        pool = process_pools[name] = ProcessPoolExecutor(max_workers=max_workers)
+    return pool
+
+def reset_process_pool(name: str):
+    """Abandonne un pool de processus (processus mort) pour qu'il soit recréé"""
+    pool = process_pools.pop(name, None)
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+def ocr_page_image(png_bytes: bytes, lang: str) -> str:
+    """Exécuté dans un processus du pool : OCR tesseract d'une page rasterisée"""
+    import pytesseract
+    
+    try:
+        image = Image.open(io.BytesIO(png_bytes))
+        return pytesseract.image_to_string(image, lang=lang)
+    except Exception as e:
+        # Les exceptions pytesseract ne sont pas toutes picklables : on les ramène à une RuntimeError
+        raise RuntimeError(str(e))
+
+def rasterize_pages(doc, page_numbers: List[int]) -> List[tuple]:
+    """Rasterise les pages demandées en PNG niveaux de gris, avec le hash de leur contenu"""
+    rendered = []
+    for page_number in page_numbers:
+        pix = doc[page_number].get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY)
+        page_hash = cache_key(hashlib.sha256(pix.samples).hexdigest(), str(OCR_DPI), OCR_LANG)
+        rendered.append((page_number, page_hash, pix.tobytes("png")))
+    return rendered
+
+async def ocr_pages(doc, page_numbers: List[int]) -> Dict[int, str]:
+    """OCR des pages sans couche texte, réparties sur le pool de processus (cache par hash de page)"""
+    rendered = await asyncio.to_thread(rasterize_pages, doc, page_numbers)
+    
+    results = {}
+    pending = []
+    for page_number, page_hash, png_bytes in rendered:
+        cached = cache_get("ocr", page_hash)
+        if cached is not None:
+            results[page_number] = cached
+        else:
+            pending.append((page_number, page_hash, png_bytes))
+    
+    if pending:
+        loop = asyncio.get_running_loop()
+        pool = get_process_pool("ocr", OCR_MAX_WORKERS)
+        texts = await asyncio.gather(
+            *(loop.run_in_executor(pool, ocr_page_image, png_bytes, OCR_LANG) for _, _, png_bytes in pending),
+            return_exceptions=True
+        )
+        
+        for (page_number, page_hash, _), page_text in zip(pending, texts):
+            if isinstance(page_text, BrokenProcessPool):
+                # Un processus est mort : le pool sera recréé au prochain appel
+                reset_process_pool("ocr")
+            if isinstance(page_text, Exception):
+                print(f"⚠️  OCR impossible pour la page {page_number + 1}: {page_text}")
+                continue
+            results[page_number] = page_text
+            cache_put("ocr", page_hash, page_text, OCR_CACHE_MAX_BYTES)
+    
+    return results
+
+def iter_pages_text(doc) -> Iterator[str]:
+    """Texte des pages une à une : une seule page du document est chargée à la fois"""
+    for page in doc:
+        yield extract_page_text(page)
+
+def extract_pages_text(doc) -> List[str]:
+    """Texte de chaque page du document, dans l'ordre"""
+    return list(iter_pages_text(doc))
+
+def extract_page_range_text(pdf_path: str, start: int, stop: int) -> List[str]:
+    """Exécuté dans un processus du pool : texte des pages [start, stop[ (les objets PyMuPDF
+    ne se partagent pas entre processus, chaque appel ouvre son propre document)"""
+    doc = fitz.open(pdf_path, filetype="pdf")
+    try:
+        return [extract_page_text(doc[page_number]) for page_number in range(start, stop)]
+    finally:
+        doc.close()
+
+async def extract_pages_text_parallel(pdf_path: str, page_count: int) -> List[str]:
+    """Texte de chaque page, plages de pages réparties sur le pool "pdf", rassemblées dans l'ordre"""
+    # Deux plages par processus : une page lente (grille de prix, page dense) ne bloque pas tout un tiers du document
+    range_size = max(1, -(-page_count // (PDF_MAX_WORKERS * 2)))
+    ranges = [(start, min(start + range_size, page_count)) for start in range(0, page_count, range_size)]
+    
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool("pdf", PDF_MAX_WORKERS)
+    results = await asyncio.gather(
+        *(loop.run_in_executor(pool, extract_page_range_text, pdf_path, start, stop) for start, stop in ranges)
+    )
+    return [page_text for range_pages in results for page_text in range_pages]
+
+def spool_to_disk(source, max_bytes: int, suffix: str, label: str) -> str:
+    """Copie un flux binaire (méthode read) dans un fichier temporaire par morceaux de
+    PDF_SPOOL_CHUNK_SIZE et renvoie son chemin ; refuse (413) au-delà de max_bytes"""
+    fd, path = tempfile.mkstemp(suffix=suffix, dir=PDF_SPOOL_DIR)
+    size = 0
+    try:
+        with os.fdopen(fd, "wb") as target:
+            while True:
+                chunk = source.read(PDF_SPOOL_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=413,
+                        detail=f"{label} trop volumineux (maximum {max_bytes // (1024 * 1024)} Mo)"
+                    )
+                target.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return path
+
+def remove_spooled(paths):
+    """Supprime des fichiers temporaires sans lever d'erreur"""
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+@asynccontextmanager
+async def spooled_pdf(upload: UploadFile):
+    """Chemin d'un PDF reçu, copié sur disque le temps du bloc puis supprimé"""
+    if not (upload.filename or "").lower().endswith('.pdf'):
+        raise HTTPException(status_code=400, detail="Le fichier doit être un PDF")
+    
+    path = await asyncio.to_thread(spool_to_disk, upload.file, PDF_MAX_BYTES, ".pdf", "PDF")
+    try:
+        yield path
+    finally:
+        remove_spooled([path])
+
+async def extract_pdf_text(pdf_path: str) -> str:
+    """Extrait le texte d'un PDF enregistré sur disque (pages séparées par PAGE_SEPARATOR)
+    
+    PyMuPDF lit le fichier à la demande et les pages sont traitées une à une : la mémoire
+    utilisée dépend de la taille d'une page, pas de celle du fichier. À partir de
+    PDF_PARALLEL_MIN_PAGES pages, les plages de pages sont extraites en parallèle sur le pool
+    "pdf". Les pages dont la couche texte est vide (scans) passent par l'OCR, par lots de
+    OCR_BATCH_PAGES.
+    """
+    try:
+        doc = fitz.open(pdf_path, filetype="pdf")
+        try:
+            # Parsing CPU hors de la boucle d'événements
+            pages = None
+            if doc.page_count >= PDF_PARALLEL_MIN_PAGES and PDF_MAX_WORKERS > 1:
+                try:
+                    pages = await extract_pages_text_parallel(pdf_path, doc.page_count)
+                except BrokenProcessPool:
+                    # Un processus est mort : le pool sera recréé, ce document est traité dans un thread
+                    reset_process_pool("pdf")
+            if pages is None:
+                pages = await asyncio.to_thread(extract_pages_text, doc)
+            
+            scanned_pages = [i for i, page_text in enumerate(pages) if len(page_text.strip()) < OCR_MIN_PAGE_CHARS]
+            if scanned_pages and OCR_ENABLED:
+                print(f"🔎 OCR de {len(scanned_pages)} page(s) scannée(s) sur {len(pages)}")
+                for start in range(0, len(scanned_pages), OCR_BATCH_PAGES):
+                    batch = scanned_pages[start:start + OCR_BATCH_PAGES]
+                    for page_number, page_text in (await ocr_pages(doc, batch)).items():
+                        pages[page_number] = page_text
+        finally:
+            doc.close()
+        
+        text = PAGE_SEPARATOR.join(pages)
+        
+        if len(text.strip()) < 50:
+            raise HTTPException(
+                status_code=400, 
+                detail="⚠️ Ce PDF est une image scannée illisible (aucun texte détecté, même par OCR)."
+            )
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Erreur lecture PDF: {str(e)}")
+    
+    return text
+
+def build_extract_response(restaurant_name: str, qr_mode: str, colors: Dict, address: Dict, menu_data: Dict, classification_stats: Dict = None) -> Dict:
+    """Construit la réponse de prévisualisation renvoyée par /extract-menu
+    
+    Le menu extrait et les réglages du restaurant sont enregistrés : menu_id et menu_version
+    suffisent ensuite à /reconcile-drink-indexes, /generate-menu et /upload-to-server.
+    """
+    
+    menu = MenuModel(menu_data)
+    menu_id = restaurant_id_for(restaurant_name)
+    menu_version = None
+    try:
+        save_restaurant(menu_id, restaurant_name, qr_mode=qr_mode, colors=colors, address=address)
+        menu_version = save_menu_version(menu_id, menu_data, "extract")
+    except Exception as e:
+        print(f"⚠️ Menu non enregistré : {e}")
+    
+    # Détecter TOUTES les sections actives (pas de limite)
+    all_suggestions = detect_active_sections(menu)
+    
+    # Les 3 premiers par défaut
+    default_buttons = all_suggestions[:3]
+    return {
+        "success": True,
+        "data": {
+            "restaurant_name": restaurant_name,
+            "qr_mode": qr_mode,
+            "colors": colors,
+            "all_suggestions": all_suggestions,  # TOUTES les suggestions
+            "default_buttons": default_buttons,   # Les 3 par défaut
+            "address": address,
+            "menu": menu_data,
+            "article_ids": menu.article_ids(),  # articleId qui seront utilisés par /generate-menu
+            "menu_id": menu_id,
+            "menu_version": menu_version
+        },
+        "stats": {
+            "total_articles": menu.total_articles,
+            "par_categorie": menu.counts,
+            "classification": classification_stats or {}
+        }
+    }
+
 @app.post("/extract-menu")
 async def extract_menu(
     restaurant_name: str = Form(...),
@@ -801,9 +2183,12 @@ async def extract_menu(
     city: str = Form(""),
     country: str = Form("France"),
     menu_file: UploadFile = File(None),
-    manual_menu: str = Form(None)
+    manual_menu: str = Form(None),
+    bypass_cache: bool = Form(False),
+    chunked: bool = Form(False)
 ):
     """Extrait le menu pour prévisualisation"""
+    classification_stats = {}
     try:
         # Obtenir les données du menu
         if manual_menu:
@@ -813,77 +2198,41 @@ async def extract_menu(
                 raise HTTPException(status_code=400, detail=f"JSON manuel invalide: {str(e)}")
         
         elif menu_file:
-            if not menu_file.filename.lower().endswith('.pdf'):
-                raise HTTPException(status_code=400, detail="Le fichier doit être un PDF")
-            
-            pdf_content = await menu_file.read()
-            
-            # Extraire avec PyMuPDF
-            try:
-                doc = fitz.open(stream=pdf_content, filetype="pdf")
-                text = ""
-                for page in doc:
-                    text += page.get_text()
-                doc.close()
-                
-                if len(text.strip()) < 50:
-                    raise HTTPException(
-                        status_code=400, 
-                        detail="⚠️ Ce PDF est une image scannée. Veuillez convertir votre PDF en format texte."
-                    )
-            except HTTPException:
-                raise
-            except Exception as e:
-                raise HTTPException(status_code=400, detail=f"Erreur lecture PDF: {str(e)}")
+            # Extraire avec PyMuPDF depuis une copie sur disque
+            async with spooled_pdf(menu_file) as pdf_path:
+                text = await extract_pdf_text(pdf_path)
             
-            menu_data = classify_menu_with_groq(text)
+            menu_data = await classify_menu(text, bypass_cache, chunked, classification_stats)
             menu_data = clean_empty_categories(menu_data)
         
         else:
             raise HTTPException(status_code=400, detail="Vous devez fournir soit un PDF soit un menu manuel")
         
-        # Détecter TOUTES les sections actives (pas de limite)
-        all_suggestions = detect_active_sections(menu_data)
-        
-        # Les 3 premiers par défaut
-        default_buttons = all_suggestions[:3]
-        return {
-            "success": True,
-            "data": {
-                "restaurant_name": restaurant_name,
-                "qr_mode": qr_mode,
-                "colors": {
-                    "primary": color_primary,
-                    "accent": color_accent,
-                    "footer": color_footer,
-                    "footer_accent": color_footer_accent,
-                    "button_accent_background": color_button_accent_bg,
-                    "button_primary_font": color_button_primary_font,
-                    "button_menu_block_font": color_button_menu_block_font
-                },
-                "all_suggestions": all_suggestions,  # TOUTES les suggestions
-                "default_buttons": default_buttons,   # Les 3 par défaut
-                "address": {
-                    "street": street,
-                    "zip_code": zip_code,
-                    "city": city,
-                    "country": country
-                },
-                "menu": menu_data
-            },
-            "stats": {
-                "total_articles": sum(len(v) for v in menu_data.values()),
-                "par_categorie": {k: len(v) for k, v in menu_data.items()}
-            }
+        colors = {
+            "primary": color_primary,
+            "accent": color_accent,
+            "footer": color_footer,
+            "footer_accent": color_footer_accent,
+            "button_accent_background": color_button_accent_bg,
+            "button_primary_font": color_button_primary_font,
+            "button_menu_block_font": color_button_menu_block_font
+        }
+        address = {
+            "street": street,
+            "zip_code": zip_code,
+            "city": city,
+            "country": country
         }
         
+        return build_extract_response(restaurant_name, qr_mode, colors, address, menu_data, classification_stats)
+        
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erreur serveur: {str(e)}")
 
-@app.post("/generate-menu")
-async def generate_menu(
+@app.post("/extract-menu/stream")
+async def extract_menu_stream(
     restaurant_name: str = Form(...),
     color_primary: str = Form("#db5543"),
     color_accent: str = Form("#db5543"),
@@ -899,53 +2248,447 @@ async def generate_menu(
     country: str = Form("France"),
     menu_file: UploadFile = File(None),
     manual_menu: str = Form(None),
+    bypass_cache: bool = Form(False)
+):
+    """Variante streaming de /extract-menu (NDJSON)
+    
+    Émet un événement par article et par catégorie dès qu'ils sont complets dans la réponse Groq,
+    puis un événement final "done" contenant la même réponse que /extract-menu.
+    """
+    # Les erreurs de saisie sont levées AVANT le début du flux pour garder un vrai code HTTP
+    text = None
+    menu_data = None
+    
+    if manual_menu:
+        try:
+            menu_data = json.loads(manual_menu)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"JSON manuel invalide: {str(e)}")
+    elif menu_file:
+        async with spooled_pdf(menu_file) as pdf_path:
+            text = await extract_pdf_text(pdf_path)
+    else:
+        raise HTTPException(status_code=400, detail="Vous devez fournir soit un PDF soit un menu manuel")
+    
+    colors = {
+        "primary": color_primary,
+        "accent": color_accent,
+        "footer": color_footer,
+        "footer_accent": color_footer_accent,
+        "button_accent_background": color_button_accent_bg,
+        "button_primary_font": color_button_primary_font,
+        "button_menu_block_font": color_button_menu_block_font
+    }
+    address = {
+        "street": street,
+        "zip_code": zip_code,
+        "city": city,
+        "country": country
+    }
+    
+    async def events():
+        classification_stats = {}
+        try:
+            if menu_data is not None:
+                result = menu_data
+                for category, items in result.items():
+                    yield ndjson_event({"event": "category", "category": category, "articles": items})
+            else:
+                result = None
+                async for event in stream_classify_menu(text, bypass_cache, classification_stats):
+                    if event["event"] == "menu":
+                        result = event["menu"]
+                    else:
+                        yield ndjson_event(event)
+            
+            payload = build_extract_response(restaurant_name, qr_mode, colors, address, clean_empty_categories(result), classification_stats)
+            yield ndjson_event({"event": "done", **payload})
+        except HTTPException as e:
+            yield ndjson_event({"event": "error", "detail": e.detail})
+        except Exception as e:
+            yield ndjson_event({"event": "error", "detail": f"Erreur serveur: {str(e)}"})
+    
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+def spool_batch_pdfs(menu_files: List[UploadFile], zip_path: str = None) -> List[tuple]:
+    """Liste (nom de fichier, chemin temporaire) des PDF d'un lot : fichiers envoyés + PDF contenus
+    dans le ZIP, copiés sur disque un par un (à supprimer par l'appelant)"""
+    pdfs = []
+    try:
+        for menu_file in menu_files or []:
+            pdfs.append((menu_file.filename, spool_to_disk(menu_file.file, PDF_MAX_BYTES, ".pdf", menu_file.filename)))
+        
+        if zip_path:
+            try:
+                with zipfile.ZipFile(zip_path) as archive:
+                    members = [
+                        info for info in archive.infolist()
+                        if not (info.is_dir() or info.filename.startswith("__MACOSX/") or not info.filename.lower().endswith(".pdf"))
+                    ]
+                    # Nombre et tailles annoncées vérifiés avant toute décompression ; la taille
+                    # réelle reste plafonnée pendant la copie (en-tête mensonger)
+                    if len(pdfs) + len(members) > BATCH_MAX_FILES:
+                        raise HTTPException(
+                            status_code=400,
+                            detail=f"Trop de fichiers : {len(pdfs) + len(members)} (maximum {BATCH_MAX_FILES})"
+                        )
+                    oversized = next((info for info in members if info.file_size > PDF_MAX_BYTES), None)
+                    if oversized is not None:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"{os.path.basename(oversized.filename)} trop volumineux (maximum {PDF_MAX_BYTES // (1024 * 1024)} Mo)"
+                        )
+                    if sum(info.file_size for info in members) > BATCH_ZIP_MAX_BYTES:
+                        raise HTTPException(
+                            status_code=413,
+                            detail=f"Archive ZIP trop volumineuse une fois décompressée (maximum {BATCH_ZIP_MAX_BYTES // (1024 * 1024)} Mo)"
+                        )
+                    for info in members:
+                        with archive.open(info) as member:
+                            path = spool_to_disk(member, PDF_MAX_BYTES, ".pdf", os.path.basename(info.filename))
+                        pdfs.append((os.path.basename(info.filename), path))
+            except zipfile.BadZipFile:
+                raise HTTPException(status_code=400, detail="Archive ZIP invalide")
+    except BaseException:
+        remove_spooled(path for _, path in pdfs)
+        raise
+    
+    return pdfs
+
+@app.post("/extract-menu/batch")
+async def extract_menu_batch(
+    color_primary: str = Form("#db5543"),
+    color_accent: str = Form("#db5543"),
+    color_footer: str = Form("#db5543"),
+    color_footer_accent: str = Form("#eb5c27"),
+    color_button_accent_bg: str = Form("#db5543"),
+    color_button_primary_font: str = Form("#db5543"),
+    color_button_menu_block_font: str = Form("#eb5c27"),
+    qr_mode: str = Form("unique"),
+    country: str = Form("France"),
+    menu_files: List[UploadFile] = File(None),
+    menu_zip: UploadFile = File(None),
+    bypass_cache: bool = Form(False),
+    chunked: bool = Form(False)
+):
+    """Extrait plusieurs menus (PDF multiples et/ou ZIP) avec un pool de workers borné
+    
+    Chaque fichier donne un restaurant (nom = nom du fichier) et un résultat au format de /extract-menu.
+    BATCH_MAX_WORKERS menus sont traités en parallèle ; les appels Groq restent limités par GROQ_MAX_CONCURRENCY.
+    """
+    if len(menu_files or []) > BATCH_MAX_FILES:
+        raise HTTPException(status_code=400, detail=f"Trop de fichiers : {len(menu_files)} (maximum {BATCH_MAX_FILES})")
+    
+    zip_path = None
+    if menu_zip:
+        if not menu_zip.filename.lower().endswith('.zip'):
+            raise HTTPException(status_code=400, detail="L'archive doit être un fichier ZIP")
+        zip_path = await asyncio.to_thread(spool_to_disk, menu_zip.file, BATCH_ZIP_MAX_BYTES, ".zip", "Archive ZIP")
+    
+    try:
+        pdfs = await asyncio.to_thread(spool_batch_pdfs, menu_files, zip_path)
+    finally:
+        if zip_path:
+            remove_spooled([zip_path])
+    
+    if not pdfs:
+        raise HTTPException(status_code=400, detail="Aucun PDF fourni (fichiers ou archive ZIP)")
+    
+    colors = {
+        "primary": color_primary,
+        "accent": color_accent,
+        "footer": color_footer,
+        "footer_accent": color_footer_accent,
+        "button_accent_background": color_button_accent_bg,
+        "button_primary_font": color_button_primary_font,
+        "button_menu_block_font": color_button_menu_block_font
+    }
+    
+    workers = asyncio.Semaphore(BATCH_MAX_WORKERS)
+    
+    async def process(filename: str, pdf_path: str) -> Dict:
+        async with workers:
+            started = time.perf_counter()
+            restaurant_name = os.path.splitext(filename)[0].replace("_", " ").strip()
+            address = {"street": "", "zip_code": "", "city": "", "country": country}
+            classification_stats = {}
+            
+            try:
+                if not filename.lower().endswith('.pdf'):
+                    raise HTTPException(status_code=400, detail="Le fichier doit être un PDF")
+                
+                text = await extract_pdf_text(pdf_path)
+                menu_data = await classify_menu(text, bypass_cache, chunked, classification_stats)
+                menu_data = clean_empty_categories(menu_data)
+                
+                result = build_extract_response(restaurant_name, qr_mode, colors, address, menu_data, classification_stats)
+            except HTTPException as e:
+                result = {"success": False, "error": e.detail}
+            except Exception as e:
+                result = {"success": False, "error": f"Erreur serveur: {str(e)}"}
+            
+            result["filename"] = filename
+            result["duration_seconds"] = round(time.perf_counter() - started, 3)
+            print(f"📦 {filename} traité en {result['duration_seconds']}s")
+            return result
+    
+    started = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(process(filename, path) for filename, path in pdfs))
+    finally:
+        remove_spooled(path for _, path in pdfs)
+    elapsed = time.perf_counter() - started
+    
+    succeeded = [r for r in results if r["success"]]
+    total_articles = sum(r["stats"]["total_articles"] for r in succeeded)
+    total_tokens = sum(r["stats"]["classification"].get("tokens", {}).get("total_tokens", 0) for r in succeeded)
+    
+    return {
+        "success": len(succeeded) == len(results),
+        "results": results,
+        "stats": {
+            "files": len(results),
+            "succeeded": len(succeeded),
+            "failed": len(results) - len(succeeded),
+            "total_articles": total_articles,
+            "articles_sans_llm": sum(r["stats"]["classification"].get("articles_sans_llm", 0) for r in succeeded),
+            "total_tokens": total_tokens,
+            "elapsed_seconds": round(elapsed, 3),
+            "files_per_minute": round(len(results) / elapsed * 60, 2) if elapsed > 0 else None,
+            "articles_per_second": round(total_articles / elapsed, 2) if elapsed > 0 else None,
+            "workers": BATCH_MAX_WORKERS,
+            "groq_max_concurrency": GROQ_MAX_CONCURRENCY
+        }
+    }
+
+class BundleSink:
+    """Flux d'écriture non seekable : l'archive y écrit, le générateur vide au fil de l'eau"""
+    
+    def __init__(self):
+        self.chunks = []
+    
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self) -> List[bytes]:
+        chunks, self.chunks = self.chunks, []
+        return chunks
+
+def iter_json_bytes(document, indent: int = None) -> Iterator[bytes]:
+    """Encode un document JSON par morceaux (~BUNDLE_CHUNK_SIZE) sans construire la chaîne complète"""
+    separators = None if indent else (',', ':')
+    encoder = json.JSONEncoder(ensure_ascii=False, indent=indent, separators=separators)
+    buffer, size = [], 0
+    for piece in encoder.iterencode(document):
+        buffer.append(piece)
+        size += len(piece)
+        if size >= BUNDLE_CHUNK_SIZE:
+            yield "".join(buffer).encode("utf-8")
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer).encode("utf-8")
+
+def iter_text_bytes(text: str) -> Iterator[bytes]:
+    """Encode par morceaux (BUNDLE_CHUNK_SIZE caractères) un JSON déjà sérialisé"""
+    for start in range(0, len(text), BUNDLE_CHUNK_SIZE):
+        yield text[start:start + BUNDLE_CHUNK_SIZE].encode("utf-8")
+
+def stream_zip_bundle(documents: Dict[str, Iterator[bytes]]) -> Iterator[bytes]:
+    """Archive ZIP produite en flux (descripteurs de données, aucune copie complète en mémoire)"""
+    sink = BundleSink()
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, chunks in documents.items():
+            with archive.open(name, "w") as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    yield from sink.drain()
+    yield from sink.drain()
+
+def stream_tar_bundle(documents: Dict[str, Iterator[bytes]]) -> Iterator[bytes]:
+    """Archive tar produite en flux ; l'en-tête tar exige la taille, donc un seul fichier en mémoire à la fois"""
+    sink = BundleSink()
+    with tarfile.open(fileobj=sink, mode="w|") as archive:
+        for name, chunks in documents.items():
+            data = b"".join(chunks)
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            archive.addfile(info, io.BytesIO(data))
+            yield from sink.drain()
+    yield from sink.drain()
+
+def read_bundle_member(source, name: str, declared_size: int) -> bytes:
+    """Contenu d'une entrée du bundle, refusé au-delà de BUNDLE_MAX_FILE_BYTES (taille annoncée
+    vérifiée avant lecture, taille réelle pendant)"""
+    if declared_size > BUNDLE_MAX_FILE_BYTES:
+        raise ValueError(f"{name} trop volumineux ({declared_size} octets, maximum {BUNDLE_MAX_FILE_BYTES})")
+    with source as f:
+        data = f.read(BUNDLE_MAX_FILE_BYTES + 1)
+    if len(data) > BUNDLE_MAX_FILE_BYTES:
+        raise ValueError(f"{name} trop volumineux (maximum {BUNDLE_MAX_FILE_BYTES} octets)")
+    return data
+
+def read_bundle(bundle: UploadFile) -> Dict[str, str]:
+    """Lit un bundle ZIP ou tar de /generate-menu et renvoie {champ de formulaire: contenu JSON}
+    
+    Seuls les fichiers de BUNDLE_FILES et meta.json sont décompressés ; une archive de plus de
+    BUNDLE_MAX_MEMBERS entrées est refusée sans rien lire (ValueError).
+    """
+    wanted = set(BUNDLE_FILES) | {"meta.json"}
+    bundle.file.seek(0)
+    if zipfile.is_zipfile(bundle.file):
+        bundle.file.seek(0)
+        with zipfile.ZipFile(bundle.file) as archive:
+            members = archive.infolist()
+            if len(members) > BUNDLE_MAX_MEMBERS:
+                raise ValueError(f"{len(members)} entrées (maximum {BUNDLE_MAX_MEMBERS})")
+            contents = {
+                info.filename: read_bundle_member(archive.open(info), info.filename, info.file_size)
+                for info in members if info.filename in wanted and not info.is_dir()
+            }
+    else:
+        bundle.file.seek(0)
+        with tarfile.open(fileobj=bundle.file, mode="r:*") as archive:
+            # Parcours entrée par entrée : getmembers() lirait tout l'index d'une archive géante
+            members = []
+            for member in archive:
+                members.append(member)
+                if len(members) > BUNDLE_MAX_MEMBERS:
+                    raise ValueError(f"Plus de {BUNDLE_MAX_MEMBERS} entrées")
+            contents = {
+                member.name: read_bundle_member(archive.extractfile(member), member.name, member.size)
+                for member in members if member.name in wanted and member.isfile()
+            }
+    
+    meta = json.loads(contents.get("meta.json", b"{}"))
+    for alias, source in meta.get("aliases", {}).items():
+        if alias in BUNDLE_FILES and alias not in contents and source in contents:
+            contents[alias] = contents[source]
+    
+    return {field: contents[name].decode("utf-8") for name, field in BUNDLE_FILES.items() if name in contents}
+
+@app.post("/generate-menu")
+async def generate_menu(
+    restaurant_name: str = Form(None),
+    color_primary: str = Form(None),
+    color_accent: str = Form(None),
+    color_footer: str = Form(None),
+    color_footer_accent: str = Form(None),
+    color_button_accent_bg: str = Form(None),
+    color_button_primary_font: str = Form(None),
+    color_button_menu_block_font: str = Form(None),
+    qr_mode: str = Form(None),
+    street: str = Form(None),
+    zip_code: str = Form(None),
+    city: str = Form(None),
+    country: str = Form(None),
+    menu_id: str = Form(None),
+    menu_version: int = Form(None),
+    menu_file: UploadFile = File(None),
+    manual_menu: str = Form(None),
     validated_menu: str = Form(None),
     item_images_json: str = Form(None),
-    selected_buttons: str = Form(None)
+    selected_buttons: str = Form(None),
+    banner_paths_json: str = Form(None),
+    previous_menus_json: str = Form(None),
+    bypass_cache: bool = Form(False),
+    chunked: bool = Form(False),
+    response_format: str = Form("json")
 ):
-    """Génère les 3 fichiers JSON nécessaires"""
+    """Génère les 3 fichiers JSON nécessaires
+    
+    response_format=zip ou tar renvoie les fichiers dans une archive produite en flux (chaque JSON
+    encodé une seule fois, directement dans l'archive) au lieu de chaînes JSON dans la réponse.
+    
+    previous_menus_json (menus.4.json déjà publié) active la régénération incrémentale : seules les
+    sections modifiées sont reconstruites et la réponse détaille les changements ("incremental").
+    
+    menu_id (+ menu_version, la dernière par défaut) remplace le menu envoyé : le menu, le nom,
+    les couleurs, l'adresse, les boutons et les bannières enregistrés servent pour tout champ
+    absent. Les fichiers générés sont enregistrés avec la version (menu_version de la réponse).
+    """
+    classification_stats = {}
     try:
+        if response_format != "json" and response_format not in BUNDLE_FORMATS:
+            raise HTTPException(status_code=400, detail=f"response_format invalide : json, {', '.join(BUNDLE_FORMATS)}")
+        
+        restaurant = None
+        if menu_id:
+            restaurant = load_restaurant(menu_id)
+            if restaurant is None:
+                raise HTTPException(status_code=404, detail=f"Menu {menu_id} introuvable")
+        settings = restaurant["settings"] if restaurant else {}
+        restaurant_name = restaurant_name or (restaurant["restaurant_name"] if restaurant else None)
+        if not restaurant_name:
+            raise HTTPException(status_code=400, detail="Vous devez fournir restaurant_name ou menu_id")
+        
+        stored_version = None
         # 1. Obtenir les données du menu
         if validated_menu:
             try:
                 menu_data = json.loads(validated_menu)
-                print(f"✅ Menu validé reçu avec {sum(len(v) for v in menu_data.values())} articles")
+                source = "validé reçu"
             except json.JSONDecodeError as e:
                 raise HTTPException(status_code=400, detail=f"JSON validé invalide: {str(e)}")
         
         elif manual_menu:
             try:
                 menu_data = json.loads(manual_menu)
-                print(f"✅ Menu manuel reçu avec {sum(len(v) for v in menu_data.values())} articles")
+                source = "manuel reçu"
             except json.JSONDecodeError as e:
                 raise HTTPException(status_code=400, detail=f"JSON manuel invalide: {str(e)}")
         
         elif menu_file:
-            if not menu_file.filename.lower().endswith('.pdf'):
-                raise HTTPException(status_code=400, detail="Le fichier doit être un PDF")
+            # Même chaîne que /extract-menu (copie sur disque, pages une à une, OCR des scans)
+            async with spooled_pdf(menu_file) as pdf_path:
+                text = await extract_pdf_text(pdf_path)
             
-            pdf_content = await menu_file.read()
-            text = extract_text_from_pdf(pdf_content)
-            
-            if not text.strip():
-                raise HTTPException(status_code=400, detail="Impossible d'extraire du texte du PDF")
-            
-            menu_data = classify_menu_with_groq(text)
-            print(f"✅ Menu extrait du PDF avec {sum(len(v) for v in menu_data.values())} articles")
+            menu_data = await classify_menu(text, bypass_cache, chunked, classification_stats)
+            source = "extrait du PDF"
+        
+        elif menu_id:
+            stored_version = load_menu_version(menu_id, menu_version)
+            if stored_version is None:
+                raise HTTPException(status_code=404, detail=f"Version {menu_version} du menu {menu_id} introuvable")
+            menu_data = stored_version["menu"]
+            source = f"enregistré (version {stored_version['version']})"
         
         else:
-            raise HTTPException(status_code=400, detail="Vous devez fournir soit un PDF, soit un menu manuel, soit un menu validé")
+            raise HTTPException(status_code=400, detail="Vous devez fournir soit un PDF, soit un menu manuel, soit un menu validé, soit un menu_id")
+        
+        previous_menus = None
+        if previous_menus_json:
+            try:
+                previous_menus = json.loads(previous_menus_json)
+            except json.JSONDecodeError as e:
+                raise HTTPException(status_code=400, detail=f"menus.4.json précédent invalide: {str(e)}")
+        
+        # ID publiés à conserver : menus.4.json précédent, sinon celui de la version enregistrée
+        published_menus = previous_menus
+        if published_menus is None and stored_version is not None and stored_version["generated"]:
+            _, stored_files = load_menu_files(menu_id, stored_version["version"])
+            published_menus = json.loads(stored_files["menus"]) if "menus" in stored_files else None
+        
+        # Un seul parcours du menu, partagé par tous les générateurs
+        menu = MenuModel(menu_data, previous_menus=published_menus)
+        print(f"✅ Menu {source} avec {menu.total_articles} articles")
         
-        # 2. Préparer l'adresse
+        # 2. Préparer l'adresse (champs absents : valeurs enregistrées, puis valeurs par défaut)
+        stored_address = settings.get("address", {})
         address = {
-            "street": street,
-            "zip_code": zip_code,
-            "city": city,
-            "country": country
+            "street": street if street is not None else stored_address.get("street", ""),
+            "zip_code": zip_code if zip_code is not None else stored_address.get("zip_code", ""),
+            "city": city if city is not None else stored_address.get("city", ""),
+            "country": country if country is not None else stored_address.get("country", "France")
         }
+        qr_mode = qr_mode or settings.get("qr_mode", "unique")
         
         # 3. Générer les 3 fichiers JSON
-        colors = {
+        colors = resolve_colors({
             "primary": color_primary,
             "accent": color_accent,
             "footer": color_footer,
@@ -953,7 +2696,7 @@ async def generate_menu(
             "button_accent_background": color_button_accent_bg,
             "button_primary_font": color_button_primary_font,
             "button_menu_block_font": color_button_menu_block_font
-        }
+        }, settings.get("colors"))
         
         # Parser les chemins d'images
         item_images = {}
@@ -971,35 +2714,101 @@ async def generate_menu(
             except:
                 pass
         
+        # Chemins à empreinte des bannières déjà publiées (réponse de /upload-to-server)
+        banner_paths = {}
+        if banner_paths_json:
+            try:
+                banner_paths = json.loads(banner_paths_json)
+            except:
+                pass
+        buttons = buttons or settings.get("selected_buttons", [])
+        banner_paths = banner_paths or settings.get("banner_paths", {})
+        
         # Générer les fichiers
         backend_json = generate_backend_json(restaurant_name, qr_mode, address, version=1)
         backend_2_json = generate_backend_json(restaurant_name, qr_mode, address, version=2)
-        menus_json = generate_menus_json(menu_data, backend_json["restaurantId"], item_images)
-        frontend_json = generate_frontend_json(restaurant_name, colors, 1, menu_data)
-        frontend_2_json = generate_frontend_json(restaurant_name, colors, 2, menu_data, buttons if buttons else None)
-        menus_2_json = menus_json.copy()
+        changes = {} if previous_menus is not None else None
+        menus_json = generate_menus_json(menu, backend_json["restaurantId"], item_images, previous_menus, changes)
+        if changes is not None:
+            print(f"♻️ Régénération incrémentale : {len(changes['sections_unchanged'])} section(s) reprise(s), "
+                  f"{len(changes['sections_changed'])} reconstruite(s)")
+        frontend_json = generate_frontend_json(restaurant_name, colors, 1, menu, banner_paths=banner_paths)
+        frontend_2_json = generate_frontend_json(restaurant_name, colors, 2, menu, buttons if buttons else None, banner_paths)
+        
+        stats = {
+            "total_articles": menu.total_articles,
+            "entrees": menu.counts.get('entrees', 0),
+            "plats": menu.counts.get('plats', 0),
+            "desserts": menu.counts.get('desserts', 0),
+            "boissons_soft": menu.counts.get('boissons_soft', 0),
+            "boissons_alcoolisees": menu.counts.get('boissons_alcoolisees', 0),
+            "classification": classification_stats
+        }
+        if changes is not None:
+            stats["incremental"] = changes
+        
+        # menus_2 est identique à menus : sérialisé une seule fois
+        menus_text = json.dumps(menus_json, ensure_ascii=False, separators=(',', ':'))
+        files = {
+            "backend": json.dumps(backend_json, indent=2, ensure_ascii=False),
+            "frontend": json.dumps(frontend_json, indent=2, ensure_ascii=False),
+            "menus": menus_text,
+            "backend_2": json.dumps(backend_2_json, indent=2, ensure_ascii=False),
+            "frontend_2": json.dumps(frontend_2_json, indent=2, ensure_ascii=False),
+            "menus_2": menus_text
+        }
+        
+        # Enregistrement : un menu enregistré pas encore généré reçoit ses fichiers, sinon nouvelle version
+        store_id = menu_id or backend_json["restaurantId"]
+        generated_version = None
+        try:
+            save_restaurant(
+                store_id, restaurant_name, qr_mode=qr_mode, colors=colors, address=address,
+                selected_buttons=buttons or None, banner_paths=banner_paths or None
+            )
+            if stored_version is not None and not stored_version["generated"]:
+                save_menu_files(store_id, stored_version["version"], files)
+                generated_version = stored_version["version"]
+            else:
+                generated_version = save_menu_version(store_id, menu_data, "generate", files)
+        except Exception as e:
+            print(f"⚠️ Menu non enregistré : {e}")
+        
+        if response_format in BUNDLE_FORMATS:
+            # menus_2 est identique à menus : une seule copie, déclarée comme alias dans meta.json
+            meta = {
+                "restaurant_id": backend_json["restaurantId"],
+                "menu_id": store_id,
+                "menu_version": generated_version,
+                "address": address,
+                "stats": stats,
+                "aliases": {"menus_2.4.json": "menus.4.json"}
+            }
+            documents = {
+                "meta.json": iter_json_bytes(meta, indent=2),
+                "backend.json": iter_text_bytes(files["backend"]),
+                "frontend.json": iter_text_bytes(files["frontend"]),
+                "menus.4.json": iter_text_bytes(menus_text),
+                "backend_2.json": iter_text_bytes(files["backend_2"]),
+                "frontend_2.json": iter_text_bytes(files["frontend_2"])
+            }
+            stream = stream_zip_bundle(documents) if response_format == "zip" else stream_tar_bundle(documents)
+            return StreamingResponse(
+                stream,
+                media_type=BUNDLE_FORMATS[response_format],
+                headers={"Content-Disposition": f'attachment; filename="menu-{backend_json["restaurantId"]}.{response_format}"'}
+            )
         
         # 4. Retourner les 3 fichiers
         return {
             "success": True,
             "restaurant_id": backend_json["restaurantId"],
+            "menu_id": store_id,
+            "menu_version": generated_version,
             "address": address,
-            "files": {
-                "backend": json.dumps(backend_json, indent=2, ensure_ascii=False),
-                "frontend": json.dumps(frontend_json, indent=2, ensure_ascii=False),
-                "menus": json.dumps(menus_json, ensure_ascii=False, separators=(',', ':')),
-                "backend_2": json.dumps(backend_2_json, indent=2, ensure_ascii=False),
-                "frontend_2": json.dumps(frontend_2_json, indent=2, ensure_ascii=False),
-                "menus_2": json.dumps(menus_2_json,  ensure_ascii=False, separators=(',', ':'))
-            },
-            "stats": {
-                "total_articles": sum(len(v) for v in menu_data.values()),
-                "entrees": len(menu_data.get('entrees', [])),
-                "plats": len(menu_data.get('plats', [])),
-                "desserts": len(menu_data.get('desserts', [])),
-                "boissons_soft": len(menu_data.get('boissons_soft', [])),
-                "boissons_alcoolisees": len(menu_data.get('boissons_alcoolisees', []))
-            }
+            "files": files,
+            "article_ids": menu.article_ids(),
+            "stats": stats
         }
         
     except HTTPException:
@@ -1012,303 +2821,1575 @@ def health_check():
     return {
         "status": "running",
         "groq": "✅ OK" if GROQ_API_KEY else "❌ Non configuré",
+        "groq_max_concurrency": GROQ_MAX_CONCURRENCY,
+        "cache": {"menus": cache_info("menus"), "ocr": cache_info("ocr"), "defaults": cache_info("defaults")},
+        "groq_usage": groq_usage_totals,
+        "sftp_pool": {f"{host}:{port}": len(sessions) for (host, port, _), sessions in sftp_pool.items()},
         "version": "3.0"
     }
 
+def open_sftp_session(host: str, port: int, user: str, password: str) -> Dict:
+    """Ouvre une connexion SSH + SFTP (handshake complet) avec keepalive"""
+    ssh = paramiko.SSHClient()
+    ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+    ssh.connect(
+        hostname=host,
+        port=port,
+        username=user,
+        password=password,
+        timeout=30,
+        look_for_keys=False,
+        allow_agent=False
+    )
+    ssh.get_transport().set_keepalive(SFTP_KEEPALIVE)
+    
+    return {
+        "ssh": ssh,
+        "sftp": ssh.open_sftp(),
+        "password_hash": hashlib.sha256(password.encode("utf-8")).hexdigest(),
+        "last_used": time.time()
+    }
+
+def close_sftp_session(session: Dict):
+    """Ferme une session SFTP sans lever d'erreur"""
+    for client in (session["sftp"], session["ssh"]):
+        try:
+            client.close()
+        except Exception:
+            pass
+
+def is_sftp_session_alive(session: Dict) -> bool:
+    """Vérifie qu'une session du pool est encore utilisable"""
+    transport = session["ssh"].get_transport()
+    if transport is None or not transport.is_active():
+        return False
+    if time.time() - session["last_used"] < SFTP_HEALTHCHECK_AFTER:
+        return True
+    try:
+        session["sftp"].stat(".")
+        return True
+    except Exception:
+        return False
+
+def prune_sftp_pool():
+    """Ferme les sessions inactives depuis plus de SFTP_IDLE_TIMEOUT"""
+    now = time.time()
+    expired = []
+    with sftp_pool_lock:
+        for key, sessions in sftp_pool.items():
+            expired.extend(s for s in sessions if now - s["last_used"] > SFTP_IDLE_TIMEOUT)
+            sessions[:] = [s for s in sessions if now - s["last_used"] <= SFTP_IDLE_TIMEOUT]
+    
+    for session in expired:
+        close_sftp_session(session)
+
+def checkout_sftp_session(host: str, port: int, user: str, password: str) -> Dict:
+    """Reprend une session libre et saine du pool, ou en ouvre une nouvelle"""
+    key = (host, port, user)
+    password_hash = hashlib.sha256(password.encode("utf-8")).hexdigest()
+    prune_sftp_pool()
+    
+    while True:
+        with sftp_pool_lock:
+            sessions = sftp_pool.get(key, [])
+            index = next((i for i, s in enumerate(sessions) if s["password_hash"] == password_hash), None)
+            session = sessions.pop(index) if index is not None else None
+        
+        if session is None:
+            return open_sftp_session(host, port, user, password)
+        if is_sftp_session_alive(session):
+            return session
+        close_sftp_session(session)
+
+def release_sftp_session(host: str, port: int, user: str, session: Dict):
+    """Rend une session au pool (fermée si le pool est plein ou la session morte)"""
+    transport = session["ssh"].get_transport()
+    if transport is None or not transport.is_active():
+        close_sftp_session(session)
+        return
+    
+    session["last_used"] = time.time()
+    with sftp_pool_lock:
+        sessions = sftp_pool.setdefault((host, port, user), [])
+        if len(sessions) < SFTP_POOL_SIZE:
+            sessions.append(session)
+            return
+    close_sftp_session(session)
+
+@contextmanager
+def sftp_session(port: int, password: str, host: str = SFTP_HOST, user: str = SFTP_USER):
+    """Session SFTP empruntée au pool (keep-alive) et rendue à la sortie du bloc"""
+    session = checkout_sftp_session(host, port, user, password)
+    try:
+        yield session["sftp"]
+    finally:
+        release_sftp_session(host, port, user, session)
+
+def close_sftp_pool():
+    """Ferme toutes les sessions du pool"""
+    with sftp_pool_lock:
+        sessions = [s for pool_sessions in sftp_pool.values() for s in pool_sessions]
+        sftp_pool.clear()
+    for session in sessions:
+        close_sftp_session(session)
+
+def sftp_makedirs(sftp, path: str):
+    """Crée récursivement un dossier distant (ignore les dossiers existants)"""
+    current = ''
+    for part in path.split('/'):
+        if not part:
+            continue
+        current += '/' + part
+        try:
+            sftp.mkdir(current)
+        except:
+            pass
+
+def prewarm_sftp_pool():
+    """Ouvre une session par port au démarrage si SFTP_PASSWORD est configuré"""
+    for port in (SFTP_JSON_PORT, SFTP_IMAGES_PORT):
+        try:
+            release_sftp_session(SFTP_HOST, port, SFTP_USER, open_sftp_session(SFTP_HOST, port, SFTP_USER, SFTP_PASSWORD))
+            print(f"🔌 Session SFTP {SFTP_HOST}:{port} ouverte")
+        except Exception as e:
+            print(f"⚠️  Préchauffage SFTP {SFTP_HOST}:{port} impossible: {e}")
+
+async def sftp_pool_reaper():
+    """Ferme périodiquement les sessions SFTP inactives"""
+    while True:
+        await asyncio.sleep(60)
+        await asyncio.to_thread(prune_sftp_pool)
+
+@app.on_event("startup")
+async def start_sftp_pool():
+    if SFTP_PASSWORD:
+        asyncio.get_running_loop().run_in_executor(None, prewarm_sftp_pool)
+    asyncio.create_task(sftp_pool_reaper())
+
+@app.on_event("shutdown")
+def stop_sftp_pool():
+    close_sftp_pool()
+
+def write_remote_file(sftp, path: str, data: bytes):
+    """Écrit un fichier distant (écritures pipelinées) et le rend lisible par le serveur web"""
+    with sftp.file(path, 'wb') as f:
+        f.set_pipelined(True)
+        f.write(data)
+    sftp.chmod(path, 0o644)
+
+def available_image_formats() -> List[str]:
+    """Formats de IMAGE_FORMATS que Pillow sait écrire (l'AVIF dépend d'un plugin)"""
+    Image.init()
+    return [fmt for fmt in IMAGE_FORMATS if IMAGE_PIL_FORMATS.get(fmt) in Image.SAVE]
+
+def encode_web_variants(image_bytes: bytes, max_size: int) -> tuple:
+    """Exécuté dans un processus du pool : réduit l'image et l'encode dans les formats web
+    
+    Les métadonnées (EXIF, profils) ne sont pas recopiées. Renvoie ({extension: octets}, durée).
+    """
+    started = time.perf_counter()
+    image = Image.open(io.BytesIO(image_bytes))
+    
+    # JPEG : décodage directement à l'échelle 1/2, 1/4 ou 1/8 si l'image est bien plus grande
+    if image.format == "JPEG":
+        image.draft("RGB", (max_size, max_size))
+    
+    # Appliquer l'orientation EXIF avant de perdre les métadonnées
+    image = ImageOps.exif_transpose(image)
+    has_alpha = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+    image = image.convert("RGBA" if has_alpha else "RGB")
+    image.thumbnail((max_size, max_size), Image.LANCZOS)
+    
+    variants = {}
+    for fmt in available_image_formats():
+        buffer = io.BytesIO()
+        if fmt == "jpg":
+            flat = image
+            if has_alpha:
+                flat = Image.new("RGB", image.size, (255, 255, 255))
+                flat.paste(image, mask=image.getchannel("A"))
+            flat.save(buffer, format="JPEG", quality=IMAGE_QUALITY["jpg"], optimize=True, progressive=True)
+        elif fmt == "webp":
+            image.save(buffer, format="WEBP", quality=IMAGE_QUALITY["webp"], method=4)
+        else:
+            image.save(buffer, format=IMAGE_PIL_FORMATS[fmt], quality=IMAGE_QUALITY[fmt])
+        variants[fmt] = buffer.getvalue()
+    
+    return variants, time.perf_counter() - started
+
+def write_image_variants(sftp, directory: str, basename: str, variants: Dict[str, bytes]) -> Dict[str, str]:
+    """Écrit chaque variante ({basename}.{ext}) et renvoie {ext: chemin distant}"""
+    paths = {}
+    for fmt, data in variants.items():
+        path = f'{directory}/{basename}.{fmt}'
+        write_remote_file(sftp, path, data)
+        paths[fmt] = path
+    return paths
+
+def primary_image_format() -> str:
+    """Extension référencée dans les JSON (premier format disponible)"""
+    formats = available_image_formats()
+    return formats[0] if formats else "jpg"
+
+def image_source_hash(image_bytes: bytes, max_size: int) -> str:
+    """Empreinte d'une image source et des réglages d'encodage (détermine ses variantes)"""
+    return cache_key(
+        hashlib.sha256(image_bytes).hexdigest(), str(max_size),
+        ",".join(available_image_formats()), json.dumps(IMAGE_QUALITY, sort_keys=True)
+    )
+
+def load_sync_manifest(sftp, directory: str) -> Dict[str, Dict]:
+    """Lit le manifeste d'un dossier distant (vide s'il n'existe pas ou est illisible)"""
+    try:
+        with sftp.file(f'{directory}/{SYNC_MANIFEST_NAME}', 'rb') as f:
+            return json.loads(f.read())
+    except Exception:
+        return {}
+
+def save_sync_manifest(sftp, directory: str, manifest: Dict[str, Dict]):
+    """Réécrit le manifeste distant (fichier temporaire puis renommage atomique)"""
+    path = f'{directory}/{SYNC_MANIFEST_NAME}'
+    write_remote_file(sftp, f'{path}.tmp', json.dumps(manifest, sort_keys=True).encode("utf-8"))
+    sftp.posix_rename(f'{path}.tmp', path)
+
+def is_sync_entry_current(sftp, directory: str, name: str, content_hash: str, manifest: Dict[str, Dict]) -> bool:
+    """Vrai si le manifeste connaît ce contenu et que ses fichiers sont toujours présents à la bonne taille"""
+    entry = manifest.get(name)
+    if not entry or entry.get("hash") != content_hash:
+        return False
+    try:
+        return all(sftp.stat(f'{directory}/{filename}').st_size == size for filename, size in entry["files"].items())
+    except Exception:
+        return False
+
+def record_sync(manifest: Dict[str, Dict], sync_stats: Dict, name: str, content_hash: str, files: Dict[str, bytes] = None):
+    """Met à jour le manifeste et les compteurs après envoi (files) ou saut (files=None) d'une entrée"""
+    if files is None:
+        sizes = manifest[name]["files"]
+        sync_stats["skipped"] += len(sizes)
+        sync_stats["bytes_saved"] += sum(sizes.values())
+        return
+    
+    manifest[name] = {"hash": content_hash, "files": {filename: len(data) for filename, data in files.items()}}
+    sync_stats["uploaded"] += len(files)
+    sync_stats["bytes_sent"] += sum(len(data) for data in files.values())
+
+def new_sync_stats() -> Dict:
+    return {"uploaded": 0, "skipped": 0, "copied_remote": 0, "bytes_sent": 0, "bytes_saved": 0}
+
+def run_remote_command(sftp, command: str) -> int:
+    """Exécute une commande shell sur le serveur via le transport SSH de la session SFTP"""
+    channel = sftp.get_channel().get_transport().open_session()
+    try:
+        channel.exec_command(command)
+        return channel.recv_exit_status()
+    finally:
+        channel.close()
+
+def remote_copy(sftp, source: str, target: str) -> bool:
+    """Copie un fichier sur le serveur sans faire transiter ses octets par l'API
+    
+    Rien n'est écrit si la cible est déjà identique (cmp) ; sinon copie dans un fichier
+    temporaire puis renommage, pour ne jamais servir une image à moitié copiée. Si le serveur
+    n'accepte pas l'exécution de commandes (ou si elle échoue), le fichier est copié par SFTP.
+    Renvoie False si la source est introuvable.
+    """
+    src, dst, tmp = shlex.quote(source), shlex.quote(target), shlex.quote(f'{target}.tmp')
+    command = f'cmp -s {src} {dst} || {{ cp -f {src} {tmp} && chmod 644 {tmp} && mv -f {tmp} {dst}; }}'
+    try:
+        if run_remote_command(sftp, command) == 0:
+            return True
+    except Exception as e:
+        print(f"⚠️ Copie par commande distante impossible ({e}), copie par SFTP")
+    
+    try:
+        with sftp.file(source, 'rb') as f:
+            f.prefetch()
+            data = f.read()
+    except IOError:
+        return False
+    write_remote_file(sftp, f'{target}.tmp', data)
+    sftp.posix_rename(f'{target}.tmp', target)
+    return True
+
+def prepare_default_banner(sftp, source_path: str, refresh: bool = False) -> Dict:
+    """Variantes web d'une bannière par défaut : {"hash", "files": {ext: [chemin distant, taille]}}
+    
+    La source n'est téléchargée et encodée qu'une fois par version (taille + mtime) ;
+    les variantes sont ensuite réutilisées pour tous les restaurants.
+    """
+    attrs = sftp.stat(source_path)
+    key = cache_key(
+        source_path, str(attrs.st_size), str(attrs.st_mtime), str(IMAGE_BANNER_MAX_SIZE),
+        ",".join(available_image_formats()), json.dumps(IMAGE_QUALITY, sort_keys=True)
+    )
+    if not refresh:
+        cached = cache_get("defaults", key)
+        if cached is not None:
+            return cached
+    
+    with sftp.file(source_path, 'rb') as source:
+        source.prefetch()
+        image_bytes = source.read()
+    
+    content_hash = image_source_hash(image_bytes, IMAGE_BANNER_MAX_SIZE)
+    variants, _ = encode_web_variants(image_bytes, IMAGE_BANNER_MAX_SIZE)
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    variants_path = f'{DEFAULT_BANNERS_PATH}/.variants'
+    sftp_makedirs(sftp, variants_path)
+    paths = write_image_variants(sftp, variants_path, f'{stem}-{content_hash[:12]}', variants)
+    
+    info = {"hash": content_hash, "files": {fmt: [paths[fmt], len(data)] for fmt, data in variants.items()}}
+    cache_put("defaults", key, info, DEFAULTS_CACHE_MAX_BYTES)
+    print(f"🖼️  Variantes de la bannière par défaut {stem} préparées")
+    return info
+
+def hashed_name(basename: str, content_hash: str) -> str:
+    """Nom de fichier portant l'empreinte de son contenu (jamais réécrit, donc cacheable indéfiniment)"""
+    return f'{basename}-{content_hash[:12]}'
+
+def replace_asset_paths(value, mapping: Dict[str, str]):
+    """Remplace récursivement, dans un JSON décodé, les chaînes présentes dans mapping"""
+    if isinstance(value, dict):
+        return {key: replace_asset_paths(item, mapping) for key, item in value.items()}
+    if isinstance(value, list):
+        return [replace_asset_paths(item, mapping) for item in value]
+    if isinstance(value, str):
+        return mapping.get(value, value)
+    return value
+
+def json_artifact_files(name: str, data: bytes) -> Dict[str, bytes]:
+    """Fichier JSON et ses variantes précompressées au niveau maximal ({nom: octets})
+    
+    Le gzip est produit sans horodatage : même contenu, mêmes octets (et même empreinte).
+    """
+    files = {name: data, f'{name}.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        files[f'{name}.br'] = brotli.compress(data, mode=brotli.MODE_TEXT, quality=11)
+    return files
+
+def compression_report(files: Dict[str, bytes]) -> Dict:
+    """Tailles et taux de compression ({"size", "gz", "br", "ratio": {...}}) d'un fichier et de ses variantes"""
+    name = min(files, key=len)
+    size = len(files[name])
+    report = {"size": size, "ratio": {}}
+    for suffix in ("gz", "br"):
+        compressed = files.get(f'{name}.{suffix}')
+        if compressed is not None:
+            report[suffix] = len(compressed)
+            report["ratio"][suffix] = round(len(compressed) / size, 3) if size else 1.0
+    return report
+
+def publish_release(sftp, root: str, current_name: str, files: Dict[str, bytes], force: bool = False) -> Dict:
+    """Publie files dans {root}/releases/data-<empreinte> puis y fait pointer {root}/{current_name}
+    
+    Une version déjà présente et complète n'est pas renvoyée. Les autres fichiers de la version
+    servie (ou de l'ancien dossier réel, au premier passage) sont recopiés dans la nouvelle : ils
+    restent servis. La bascule remplace le lien symbolique par un renommage atomique :
+    l'application voit l'ancienne ou la nouvelle version, jamais un mélange des deux.
+    """
+    link_path = f'{root}/{current_name}'
+    releases_path = f'{root}/releases'
+    
+    # Version actuellement servie : cible du lien, ou dossier réel avant le premier passage
+    live_path = None
+    live_attrs = None
+    try:
+        live_attrs = sftp.lstat(link_path)
+        if S_ISLNK(live_attrs.st_mode):
+            link_target = sftp.readlink(link_path)
+            live_path = link_target if link_target.startswith('/') else f'{root}/{link_target}'
+        elif S_ISDIR(live_attrs.st_mode):
+            live_path = link_path
+    except IOError:
+        pass
+    
+    carried = {}
+    if live_path:
+        for attrs in sftp.listdir_attr(live_path):
+            if S_ISDIR(attrs.st_mode):
+                raise IOError(f"{live_path} contient le dossier {attrs.filename} : publication par version impossible")
+            if attrs.filename not in files:
+                carried[attrs.filename] = attrs
+    
+    release_hash = cache_key(
+        *(f'{name}:{hashlib.sha256(data).hexdigest()}' for name, data in sorted(files.items())),
+        *(f'{name}:{attrs.st_size}:{attrs.st_mtime}' for name, attrs in sorted(carried.items()))
+    )
+    release_name = f'data-{release_hash[:12]}'
+    release_path = f'{releases_path}/{release_name}'
+    sftp_makedirs(sftp, release_path)
+    
+    uploaded = []
+    for name, data in files.items():
+        if not force:
+            try:
+                if sftp.stat(f'{release_path}/{name}').st_size == len(data):
+                    continue
+            except IOError:
+                pass
+        write_remote_file(sftp, f'{release_path}/{name}', data)
+        uploaded.append(name)
+    
+    for name, attrs in carried.items():
+        try:
+            if sftp.stat(f'{release_path}/{name}').st_size == attrs.st_size:
+                continue
+        except IOError:
+            pass
+        if not remote_copy(sftp, f'{live_path}/{name}', f'{release_path}/{name}'):
+            raise IOError(f"Copie de {live_path}/{name} dans la nouvelle version impossible")
+    
+    target = f'releases/{release_name}'
+    previous = None
+    if live_attrs is not None and S_ISLNK(live_attrs.st_mode):
+        previous = sftp.readlink(link_path)
+    elif live_path:
+        # Premier passage : l'ancien dossier réel est archivé parmi les versions
+        sftp.rename(link_path, f'{releases_path}/{current_name}')
+        previous = f'releases/{current_name}'
+    
+    if previous != target:
+        tmp_link = f'{root}/.{current_name}.tmp'
+        try:
+            sftp.remove(tmp_link)
+        except IOError:
+            pass
+        sftp.symlink(target, tmp_link)
+        sftp.posix_rename(tmp_link, link_path)
+        print(f"🔀 {link_path} -> {target}")
+    
+    prune_releases(sftp, releases_path, {release_name, (previous or '').split('/')[-1]})
+    
+    return {
+        "release": release_name,
+        "previous": previous,
+        "uploaded": uploaded,
+        "skipped": [n for n in files if n not in uploaded],
+        "carried": sorted(carried)
+    }
+
+def prune_releases(sftp, releases_path: str, protected: set):
+    """Supprime les plus anciennes versions au-delà de PUBLISH_KEEP_RELEASES (jamais la courante ni la précédente)"""
+    try:
+        releases = sorted(sftp.listdir_attr(releases_path), key=lambda attrs: attrs.st_mtime, reverse=True)
+    except IOError:
+        return
+    
+    for attrs in releases[PUBLISH_KEEP_RELEASES:]:
+        if attrs.filename in protected:
+            continue
+        try:
+            run_remote_command(sftp, f'rm -rf {shlex.quote(f"{releases_path}/{attrs.filename}")}')
+        except Exception as e:
+            print(f"⚠️ Suppression de la version {attrs.filename} impossible: {e}")
+
+def copy_default_banner(sftp, source_path: str, directory: str, basename: str) -> Dict:
+    """Copie côté serveur les variantes d'une bannière par défaut vers {directory}/{basename}-<empreinte>.{ext}"""
+    for refresh in (False, True):
+        # Second essai : variantes distantes supprimées depuis la mise en cache, on les régénère
+        info = prepare_default_banner(sftp, source_path, refresh)
+        target = hashed_name(basename, info["hash"])
+        if all(remote_copy(sftp, path, f'{directory}/{target}.{fmt}') for fmt, (path, _) in info["files"].items()):
+            return info
+    raise RuntimeError(f"Copie distante impossible depuis {source_path}")
+
 @app.post("/upload-item-images")
 async def upload_item_images(
     restaurant_name: str = Form(...),
     ftp_password: str = Form(...),
     item_images: List[UploadFile] = File(...),
-    item_images_json: str = Form(...)
+    item_images_json: str = Form(...),
+    force_upload: bool = Form(False)
 ):
-    """Upload les images des articles et retourne leurs chemins"""
+    """Upload les images des articles et retourne leurs chemins
+    
+    Chaque image est réduite à IMAGE_ITEM_MAX_SIZE et encodée dans les formats web (IMAGE_FORMATS) ;
+    uploaded_images référence la variante principale, image_variants liste toutes les variantes.
+    Les conversions tournent dans un pool de processus et les transferts sur UPLOAD_CONCURRENCY
+    sessions SFTP en parallèle ; une file bornée (UPLOAD_QUEUE_SIZE) limite la mémoire utilisée.
+    Une image en échec n'interrompt pas les autres : elle est listée dans failed_images, success
+    vaut alors False et partial signale que d'autres images ont bien été envoyées.
+    Une image déjà présente sur le serveur (même source, d'après le manifeste) n'est ni convertie
+    ni renvoyée, sauf avec force_upload. Les fichiers portent l'empreinte de leur contenu
+    (item-{id}-<empreinte>.{ext}) : une nouvelle photo donne un nouveau chemin.
+    """
+    IMAGES_PATH = "/var/www/pleazze/static/adel/items"
+    
     try:
-        import paramiko
-        from PIL import Image
-        import io
-        
-        SFTP_HOST = "178.32.198.72"
-        SFTP_USER = "snadmin"
-        
-        # Connexion SFTP
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(
-            hostname=SFTP_HOST,
-            port=22,
-            username=SFTP_USER,
-            password=ftp_password,
-            timeout=30,
-            look_for_keys=False,
-            allow_agent=False
-        )
-        
-        sftp = ssh.open_sftp()
-        
-        IMAGES_PATH = "/var/www/pleazze/static/adel/items"
-        
-        # Créer le dossier
-        try:
-            parts = IMAGES_PATH.split('/')
-            current = ''
-            for part in parts:
-                if not part:
-                    continue
-                current += '/' + part
-                try:
-                    sftp.mkdir(current)
-                except:
-                    pass
-        except:
-            pass
-        
         # Parser le mapping
         image_mapping = json.loads(item_images_json)
-        uploaded_paths = {}
+        targets = [
+            (image_mapping.get(str(index)), image_file)
+            for index, image_file in enumerate(item_images)
+            if image_mapping.get(str(index))
+        ]
         
-        # Upload chaque image
-        for index, image_file in enumerate(item_images):
-            article_id = image_mapping.get(str(index))
-            if not article_id:
-                continue
-            
-            # Convertir en PNG
-            image_bytes = await image_file.read()
-            image = Image.open(io.BytesIO(image_bytes))
-            png_buffer = io.BytesIO()
-            image.save(png_buffer, format='PNG')
-            png_buffer.seek(0)
-            
-            # Nom du fichier
-            filename = f'item-{article_id}.png'
-            file_path = f'{IMAGES_PATH}/{filename}'
+        # Première session : valide la connexion, crée le dossier et lit le manifeste
+        first_session = await asyncio.to_thread(checkout_sftp_session, SFTP_HOST, SFTP_IMAGES_PORT, SFTP_USER, ftp_password)
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+    
+    started = time.perf_counter()
+    uploaded_paths = {}
+    image_variants = {}
+    failed_images = {}
+    timings = []
+    sync_stats = new_sync_stats()
+    primary_format = primary_image_format()
+    sessions = [first_session]
+    
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool("images", IMAGE_MAX_WORKERS)
+    queue = asyncio.Queue(maxsize=UPLOAD_QUEUE_SIZE)
+    worker_count = max(1, min(UPLOAD_CONCURRENCY, len(targets)))
+    manifest = {}
+    
+    async def produce():
+        for article_id, image_file in targets:
+            read_started = time.perf_counter()
+            image_bytes, content_hash, future = None, None, None
+            try:
+                image_bytes = await image_file.read()
+                content_hash = await asyncio.to_thread(image_source_hash, image_bytes, IMAGE_ITEM_MAX_SIZE)
+                # Source connue du manifeste : la conversion n'est lancée que si le serveur n'a plus les fichiers
+                if force_upload or manifest.get(f'item-{article_id}', {}).get("hash") != content_hash:
+                    future = loop.run_in_executor(pool, encode_web_variants, image_bytes, IMAGE_ITEM_MAX_SIZE)
+                    image_bytes = None
+            except Exception as e:
+                future = loop.create_future()
+                future.set_exception(e)
+            # Bloque quand la file est pleine : la mémoire reste bornée
+            await queue.put((article_id, content_hash, image_bytes, future, time.perf_counter() - read_started))
+        for _ in range(worker_count):
+            await queue.put(None)
+    
+    async def consume(worker_index: int):
+        session = first_session if worker_index == 0 else None
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
             
-            # Upload
-            with sftp.file(file_path, 'wb') as f:
-                f.write(png_buffer.getvalue())
+            article_id, content_hash, image_bytes, future, read_seconds = item
+            name = f'item-{article_id}'
+            timing = {"article_id": article_id, "read_ms": round(read_seconds * 1000, 1)}
             
-            sftp.chmod(file_path, 0o644)
+            try:
+                if session is None:
+                    session = await asyncio.to_thread(
+                        checkout_sftp_session, SFTP_HOST, SFTP_IMAGES_PORT, SFTP_USER, ftp_password
+                    )
+                    sessions.append(session)
+                
+                if future is None:
+                    if await asyncio.to_thread(is_sync_entry_current, session["sftp"], IMAGES_PATH, name, content_hash, manifest):
+                        record_sync(manifest, sync_stats, name, content_hash)
+                        public_paths = {
+                            filename.rsplit('.', 1)[-1]: f'/static/adel/items/{filename}'
+                            for filename in manifest[name]["files"]
+                        }
+                        image_variants[article_id] = public_paths
+                        uploaded_paths[article_id] = public_paths.get(primary_format) or next(iter(public_paths.values()))
+                        timing["skipped"] = True
+                        timings.append(timing)
+                        continue
+                    future = loop.run_in_executor(pool, encode_web_variants, image_bytes, IMAGE_ITEM_MAX_SIZE)
+                
+                variants, transcode_seconds = await future
+                timing["transcode_ms"] = round(transcode_seconds * 1000, 1)
+                timing["bytes"] = {fmt: len(data) for fmt, data in variants.items()}
+                
+                upload_started = time.perf_counter()
+                target = hashed_name(name, content_hash)
+                remote_paths = await asyncio.to_thread(
+                    write_image_variants, session["sftp"], IMAGES_PATH, target, variants
+                )
+                timing["upload_ms"] = round((time.perf_counter() - upload_started) * 1000, 1)
+                record_sync(manifest, sync_stats, name, content_hash, {f'{target}.{fmt}': data for fmt, data in variants.items()})
+                
+                public_paths = {fmt: path.replace('/var/www/pleazze', '', 1) for fmt, path in remote_paths.items()}
+                image_variants[article_id] = public_paths
+                uploaded_paths[article_id] = public_paths.get(primary_format) or next(iter(public_paths.values()))
+            except Exception as e:
+                if isinstance(e, BrokenProcessPool):
+                    reset_process_pool("images")
+                failed_images[article_id] = str(e)
+                timing["error"] = str(e)
+                print(f"⚠️ Erreur upload image {article_id}: {e}")
             
-            # Stocker le chemin
-            uploaded_paths[article_id] = f'/static/adel/items/{filename}'
-        
-        sftp.close()
-        ssh.close()
-        
-        return {
-            "success": True,
-            "uploaded_images": uploaded_paths
+            timings.append(timing)
+    
+    try:
+        try:
+            await asyncio.to_thread(sftp_makedirs, first_session["sftp"], IMAGES_PATH)
+            manifest.update(await asyncio.to_thread(load_sync_manifest, first_session["sftp"], IMAGES_PATH))
+        except Exception as e:
+            return {"success": False, "error": f"Préparation de {IMAGES_PATH} impossible : {e}"}
+        await asyncio.gather(produce(), *(consume(i) for i in range(worker_count)))
+        if sync_stats["uploaded"]:
+            await asyncio.to_thread(save_sync_manifest, first_session["sftp"], IMAGES_PATH, manifest)
+    finally:
+        for session in sessions:
+            release_sftp_session(SFTP_HOST, SFTP_IMAGES_PORT, SFTP_USER, session)
+    
+    elapsed = time.perf_counter() - started
+    result = {
+        "success": not failed_images,
+        "partial": bool(failed_images) and bool(uploaded_paths),
+        "uploaded_images": uploaded_paths,
+        "image_variants": image_variants,
+        "failed_images": failed_images,
+        "timings": timings,
+        "stats": {
+            "uploaded": len(uploaded_paths),
+            "failed": len(failed_images),
+            "elapsed_seconds": round(elapsed, 3),
+            "sftp_sessions": len(sessions),
+            "sync": sync_stats
         }
-        
-    except Exception as e:
-        return {"success": False, "error": str(e)}
+    }
+    if failed_images:
+        result["error"] = f"{len(failed_images)} image(s) sur {len(targets)} en échec : {', '.join(failed_images)}"
+    return result
 
 @app.post("/upload-to-server")
 async def upload_to_server(
     restaurant_id: str = Form(...),
     restaurant_name: str = Form(...),
-    backend_json: str = Form(...),
-    backend_2_json: str = Form(...),
-    frontend_json: str = Form(...),
-    frontend_2_json: str = Form(...),
-    menus_json: str = Form(...),
-    menus_2_json: str = Form(...),
+    backend_json: str = Form(None),
+    backend_2_json: str = Form(None),
+    frontend_json: str = Form(None),
+    frontend_2_json: str = Form(None),
+    menus_json: str = Form(None),
+    menus_2_json: str = Form(None),
     ftp_password: str = Form(...),
+    bundle: UploadFile = File(None),
     home_banner: UploadFile = File(None),
     menu_banner: UploadFile = File(None),
     home_banner_url: str = Form(None),  
-    menu_banner_url: str = Form(None)   
+    menu_banner_url: str = Form(None),
+    force_upload: bool = Form(False),
+    menu_version: int = Form(None)
 ):
-    """Upload les fichiers JSON + images sur le serveur via SFTP"""
+    """Upload les fichiers JSON + images sur le serveur via SFTP
     
-    def convert_to_png(image_file):
-        """Convertit n'importe quelle image en PNG"""
-        image_bytes = image_file.read()
-        image = Image.open(io.BytesIO(image_bytes))
-        
-        # Convertir en PNG
-        png_buffer = io.BytesIO()
-        image.save(png_buffer, format='PNG')
-        png_buffer.seek(0)
-        return png_buffer.getvalue()
+    Les bannières sont publiées en premier sous un nom à empreinte, puis les chemins des
+    frontend.json sont réécrits vers ces noms. Les JSON de config ne sont envoyés que s'ils ont
+    changé (manifeste du dossier, sauf force_upload) ; les JSON de cache forment une nouvelle
+    version sur laquelle bascule le lien PUBLISH_CURRENT_NAME. Chaque JSON est publié avec ses
+    variantes .gz/.br ; compression donne les taux obtenus par fichier.
+    Les JSON peuvent aussi être envoyés en une fois dans le bundle ZIP/tar de /generate-menu.
+    Les JSON absents sont repris des fichiers enregistrés pour restaurant_id (menu_version, la
+    dernière version générée par défaut) ; les chemins des bannières publiées y sont mémorisés.
+    """
     
     try:
-        import paramiko
-        
-        # CONNEXION 1 : Port 2266 pour les JSON
-        SFTP_HOST = "178.32.198.72"
-        SFTP_USER = "snadmin"
-        
-        ssh = paramiko.SSHClient()
-        ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        ssh.connect(
-            hostname=SFTP_HOST, 
-            port=2266,
-            username=SFTP_USER, 
-            password=ftp_password, 
-            timeout=30,
-            look_for_keys=False,
-            allow_agent=False
-        )
-        
-        sftp = ssh.open_sftp()
-        
         CONFIG_PATH = f"/var/www/pleazze/data/config/abdel"
-        CACHE_PATH = f"/var/www/pleazze/data/cache/abdel/data_2025-07-29_17-25-11"
         
-        # Créer les dossiers pour JSON
-        for path in [CONFIG_PATH, CACHE_PATH]:
+        json_fields = {
+            "backend_json": backend_json,
+            "backend_2_json": backend_2_json,
+            "frontend_json": frontend_json,
+            "frontend_2_json": frontend_2_json,
+            "menus_json": menus_json,
+            "menus_2_json": menus_2_json
+        }
+        if bundle:
+            # Les champs envoyés explicitement priment sur le contenu du bundle
             try:
-                parts = path.split('/')
-                current = ''
-                for part in parts:
-                    if not part:
-                        continue
-                    current += '/' + part
-                    try:
-                        sftp.mkdir(current)
-                    except:
-                        pass
-            except:
-                pass
+                bundle_fields = await asyncio.to_thread(read_bundle, bundle)
+            except (ValueError, zipfile.BadZipFile, tarfile.TarError) as e:
+                return {"success": False, "message": f"Bundle invalide : {str(e)}"}
+            for field, content in bundle_fields.items():
+                if json_fields[field] is None:
+                    json_fields[field] = content
         
-        # Upload JSON dans /config/
-        with sftp.file(f'{CONFIG_PATH}/backend.json', 'w') as f:
-            f.write(backend_json)
-
-        with sftp.file(f'{CONFIG_PATH}/backend_2.json', 'w') as f:
-            f.write(backend_2_json)
-
-        with sftp.file(f'{CONFIG_PATH}/frontend.json', 'w') as f:
-            f.write(frontend_json)
-
-        with sftp.file(f'{CONFIG_PATH}/frontend_2.json', 'w') as f:
-            f.write(frontend_2_json)
-
-        # Upload JSON dans /cache/
-        with sftp.file(f'{CACHE_PATH}/menus.4.json', 'w') as f:
-            f.write(menus_json)
-
-        with sftp.file(f'{CACHE_PATH}/menus_2.4.json', 'w') as f:
-            f.write(menus_2_json)
+        missing = [field for field, content in json_fields.items() if content is None]
+        if missing:
+            # Fichiers enregistrés par /generate-menu (ou PATCH /menus), envoyés sans être décodés
+            menu_version, stored_files = load_menu_files(restaurant_id, menu_version)
+            for field in missing:
+                json_fields[field] = stored_files.get(field[:-len("_json")])
+            missing = [field for field, content in json_fields.items() if content is None]
+        if missing:
+            return {"success": False, "message": f"Fichiers JSON manquants : {', '.join(missing)}"}
+        
+        backend_json, backend_2_json, frontend_json, frontend_2_json, menus_json, menus_2_json = json_fields.values()
         
-        sftp.close()
-        ssh.close()
+        sync_stats = new_sync_stats()
+        skipped_files = []
         
-        # CONNEXION 2 : Port 22 pour les images
+        # CONNEXION 1 : Port 22 pour les images
         uploaded_images = []
+        banner_paths = {}
+        banner_mapping = {}
         
-        if home_banner or menu_banner or home_banner_url or menu_banner_url:
-            ssh_images = paramiko.SSHClient()
-            ssh_images.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            ssh_images.connect(
-                hostname=SFTP_HOST,
-                port=22,
-                username=SFTP_USER,
-                password=ftp_password,
-                timeout=30,
-                look_for_keys=False,
-                allow_agent=False
-            )
-            
-            sftp_images = ssh_images.open_sftp()
-            
-            IMAGES_PATH = "/var/www/pleazze/static/adel"
-            
-            # Créer le dossier images
-            try:
-                parts = IMAGES_PATH.split('/')
-                current = ''
-                for part in parts:
-                    if not part:
-                        continue
-                    current += '/' + part
-                    try:
-                        sftp_images.mkdir(current)
-                    except:
-                        pass
-            except:
-                pass
-            
-            safe_restaurant_name = restaurant_name.lower().replace(' ', '-').replace('/', '-')
-            
-            # HOME BANNER
-            if home_banner:
-                # Upload d'une image personnalisée
-                png_content = convert_to_png(home_banner.file)
-                filename = f'home-banner-{safe_restaurant_name}.png'
-                file_path = f'{IMAGES_PATH}/{filename}'
+        # Les frontend.json générés sans banner_paths référencent les noms sans empreinte, qui ne
+        # sont jamais écrits : ils sont résolus via le manifeste même si aucune bannière n'est envoyée
+        safe_restaurant_name = restaurant_name.lower().replace(' ', '-').replace('/', '-')
+        unhashed_banners = [
+            kind for kind in ("home", "menu")
+            if f'/static/adel/{kind}-banner-{safe_restaurant_name}.' in frontend_json + frontend_2_json
+        ]
+        missing_banners = []
+        failed_banners = {}
+        
+        if home_banner or menu_banner or home_banner_url or menu_banner_url or unhashed_banners:
+            with sftp_session(SFTP_IMAGES_PORT, ftp_password) as sftp_images:
+                IMAGES_PATH = "/var/www/pleazze/static/adel"
                 
-                with sftp_images.file(file_path, 'wb') as f:
-                    f.write(png_content)
+                # Créer le dossier images
+                sftp_makedirs(sftp_images, IMAGES_PATH)
+                manifest = load_sync_manifest(sftp_images, IMAGES_PATH)
                 
-                sftp_images.chmod(file_path, 0o644)
-                uploaded_images.append(filename)
-            elif home_banner_url:
-                # Copier l'image par défaut
-                source_filename = home_banner_url.split('/')[-1]
-                target_filename = f'home-banner-{safe_restaurant_name}.png'
-                source_path = f'/var/www/pleazze/static/adel/defaults/{source_filename}'
-                target_path = f'{IMAGES_PATH}/{target_filename}'
+                pool = get_process_pool("images", IMAGE_MAX_WORKERS)
+                loop = asyncio.get_running_loop()
+                primary_format = primary_image_format()
                 
-                try:
-                    # Copier directement sur le serveur
-                    with sftp_images.file(source_path, 'rb') as source:
-                        with sftp_images.file(target_path, 'wb') as target:
-                            target.write(source.read())
+                for kind, banner_file, banner_url in (
+                    ("home", home_banner, home_banner_url),
+                    ("menu", menu_banner, menu_banner_url)
+                ):
+                    basename = f'{kind}-banner-{safe_restaurant_name}'
                     
-                    sftp_images.chmod(target_path, 0o644)
-                    uploaded_images.append(f"{target_filename} (copié depuis defaults)")
-                except Exception as e:
-                    print(f"⚠️ Erreur copie home banner: {e}")
-            
-            # MENU BANNER
-            if menu_banner:
-                # Upload d'une image personnalisée
-                png_content = convert_to_png(menu_banner.file)
-                filename = f'menu-banner-{safe_restaurant_name}.png'
-                file_path = f'{IMAGES_PATH}/{filename}'
+                    if banner_url and not banner_file:
+                        # Image par défaut : copie côté serveur, sans transit par l'API
+                        source_path = f'{DEFAULT_BANNERS_PATH}/{banner_url.split("/")[-1]}'
+                        try:
+                            info = await asyncio.to_thread(prepare_default_banner, sftp_images, source_path)
+                            if not force_upload and is_sync_entry_current(sftp_images, IMAGES_PATH, basename, info["hash"], manifest):
+                                record_sync(manifest, sync_stats, basename, info["hash"])
+                                skipped_files.extend(manifest[basename]["files"])
+                            else:
+                                info = await asyncio.to_thread(copy_default_banner, sftp_images, source_path, IMAGES_PATH, basename)
+                                target = hashed_name(basename, info["hash"])
+                                manifest[basename] = {
+                                    "hash": info["hash"],
+                                    "files": {f'{target}.{fmt}': size for fmt, (_, size) in info["files"].items()}
+                                }
+                                sync_stats["copied_remote"] += len(info["files"])
+                                uploaded_images.extend(f"{target}.{fmt} (copié depuis defaults)" for fmt in info["files"])
+                        except Exception as e:
+                            print(f"⚠️ Erreur copie {kind} banner: {e}")
+                            failed_banners[kind] = str(e)
+                            continue
+                    
+                    elif banner_file:
+                        # Upload d'une image personnalisée
+                        image_bytes = await banner_file.read()
+                        content_hash = image_source_hash(image_bytes, IMAGE_BANNER_MAX_SIZE)
+                        if not force_upload and is_sync_entry_current(sftp_images, IMAGES_PATH, basename, content_hash, manifest):
+                            record_sync(manifest, sync_stats, basename, content_hash)
+                            skipped_files.extend(manifest[basename]["files"])
+                        else:
+                            # Variantes web (réduites à IMAGE_BANNER_MAX_SIZE, sans métadonnées)
+                            variants, _ = await loop.run_in_executor(pool, encode_web_variants, image_bytes, IMAGE_BANNER_MAX_SIZE)
+                            target = hashed_name(basename, content_hash)
+                            write_image_variants(sftp_images, IMAGES_PATH, target, variants)
+                            record_sync(manifest, sync_stats, basename, content_hash, {f'{target}.{fmt}': data for fmt, data in variants.items()})
+                            uploaded_images.extend(f"{target}.{fmt}" for fmt in variants)
+                    
+                    elif basename not in manifest:
+                        # Aucune bannière publiée pour ce restaurant : le chemin resterait cassé
+                        if kind in unhashed_banners:
+                            missing_banners.append(kind)
+                        continue
+                    
+                    # Chemins sans empreinte (générés par /generate-menu) -> chemins publiés
+                    for filename in manifest[basename]["files"]:
+                        fmt = filename.rsplit('.', 1)[-1]
+                        banner_mapping[f'/static/adel/{basename}.{fmt}'] = f'/static/adel/{filename}'
+                    banner_paths[kind] = banner_mapping.get(f'/static/adel/{basename}.{primary_format}')
                 
-                with sftp_images.file(file_path, 'wb') as f:
-                    f.write(png_content)
+                if uploaded_images:
+                    save_sync_manifest(sftp_images, IMAGES_PATH, manifest)
+        
+        # Les frontend.json référencent les bannières publiées
+        if banner_mapping:
+            frontend_json, frontend_2_json = (
+                json.dumps(replace_asset_paths(json.loads(content), banner_mapping), indent=2, ensure_ascii=False)
+                for content in (frontend_json, frontend_2_json)
+            )
+        
+        config_files = {
+            "backend.json": backend_json,
+            "backend_2.json": backend_2_json,
+            "frontend.json": frontend_json,
+            "frontend_2.json": frontend_2_json
+        }
+        cache_files = {
+            "menus.4.json": menus_json,
+            "menus_2.4.json": menus_2_json
+        }
+        
+        # Compression (niveau maximal) une seule fois par contenu distinct (menus et menus_2 sont
+        # en général identiques), hors de la boucle d'événements
+        documents = {**config_files, **cache_files}
+        compressions = {
+            content: asyncio.ensure_future(asyncio.to_thread(json_artifact_files, "", content.encode("utf-8")))
+            for content in set(documents.values())
+        }
+        artifacts = {}
+        for filename, content in documents.items():
+            compressed = await compressions[content]
+            artifacts[filename] = {f'{filename}{suffix}': data for suffix, data in compressed.items()}
+        compression = {filename: compression_report(files) for filename, files in artifacts.items()}
+        uploaded_config = []
+        
+        # CONNEXION 2 : Port 2266 pour les JSON (session réutilisée depuis le pool)
+        with sftp_session(SFTP_JSON_PORT, ftp_password) as sftp:
+            # Créer le dossier et lire son manifeste
+            sftp_makedirs(sftp, CONFIG_PATH)
+            manifest = load_sync_manifest(sftp, CONFIG_PATH)
+            
+            for filename in config_files:
+                files = artifacts[filename]
+                content_hash = hashlib.sha256(files[filename]).hexdigest()
                 
-                sftp_images.chmod(file_path, 0o644)
-                uploaded_images.append(filename)
-            elif menu_banner_url:
-                # Copier l'image par défaut
-                source_filename = menu_banner_url.split('/')[-1]
-                target_filename = f'menu-banner-{safe_restaurant_name}.png'
-                source_path = f'/var/www/pleazze/static/adel/defaults/{source_filename}'
-                target_path = f'{IMAGES_PATH}/{target_filename}'
+                if not force_upload and is_sync_entry_current(sftp, CONFIG_PATH, filename, content_hash, manifest):
+                    record_sync(manifest, sync_stats, filename, content_hash)
+                    skipped_files.extend(manifest[filename]["files"])
+                    continue
                 
-                try:
-                    # Copier directement sur le serveur
-                    with sftp_images.file(source_path, 'rb') as source:
-                        with sftp_images.file(target_path, 'wb') as target:
-                            target.write(source.read())
-                    
-                    sftp_images.chmod(target_path, 0o644)
-                    uploaded_images.append(f"{target_filename} (copié depuis defaults)")
-                except Exception as e:
-                    print(f"⚠️ Erreur copie menu banner: {e}")
+                for artifact_name, data in files.items():
+                    write_remote_file(sftp, f'{CONFIG_PATH}/{artifact_name}', data)
+                record_sync(manifest, sync_stats, filename, content_hash, files)
+                uploaded_config.extend(files)
+            
+            if uploaded_config:
+                save_sync_manifest(sftp, CONFIG_PATH, manifest)
             
-            sftp_images.close()
-            ssh_images.close()
+            # Nouvelle version des JSON de cache puis bascule du lien
+            release_files = {name: data for filename in cache_files for name, data in artifacts[filename].items()}
+            release = publish_release(sftp, PUBLISH_CACHE_ROOT, PUBLISH_CURRENT_NAME, release_files, force_upload)
+            sync_stats["uploaded"] += len(release["uploaded"])
+            sync_stats["bytes_sent"] += sum(len(release_files[name]) for name in release["uploaded"])
+            sync_stats["skipped"] += len(release["skipped"])
+            sync_stats["bytes_saved"] += sum(len(release_files[name]) for name in release["skipped"])
+            skipped_files.extend(release["skipped"])
+        
+        if banner_paths:
+            try:
+                save_restaurant(restaurant_id, restaurant_name, banner_paths=banner_paths)
+            except Exception as e:
+                print(f"⚠️ Chemins des bannières non enregistrés : {e}")
         
         return {
             "success": True, 
-            "message": f"✅ {6 + len(uploaded_images)} fichiers uploadés avec succès",
+            "message": f"✅ {sync_stats['uploaded'] + sync_stats['copied_remote']} fichiers uploadés avec succès, {sync_stats['skipped']} inchangés"
+                       + (f" ⚠️ bannière(s) en échec : {', '.join(failed_banners)}" if failed_banners else ""),
             "details": {
-                "config": ["backend.json", "backend_2.json", "frontend.json", "frontend_2.json"],
-                "cache": ["menus.4.json", "menus_2.4.json"],
-                "images": uploaded_images if uploaded_images else ["Aucune image uploadée"]
-            }
+                "config": uploaded_config,
+                "cache": release["uploaded"],
+                "images": uploaded_images if uploaded_images else ["Aucune image uploadée"],
+                "skipped": skipped_files
+            },
+            "release": {"current": release["release"], "previous": release["previous"]},
+            "menu_version": menu_version,
+            "banner_paths": banner_paths,
+            "missing_banners": missing_banners,
+            "failed_banners": failed_banners,
+            "compression": compression,
+            "sync": sync_stats
         }
     except Exception as e:
         return {"success": False, "message": f"Erreur SFTP: {str(e)}"}
     
 
+# =============================================================================
+# JOBS EN ARRIÈRE-PLAN
+# =============================================================================
+
+# Opérations longues exécutables en job : nom -> endpoint appelé avec les mêmes champs de formulaire
+JOB_HANDLERS = {
+    "extract-menu": extract_menu,
+    "generate-menu": generate_menu,
+    "upload-item-images": upload_item_images,
+    "upload-to-server": upload_to_server
+}
+
+jobs_semaphore = asyncio.Semaphore(JOBS_MAX_WORKERS)
+# Événements de fin de job (long-polling) et secrets des jobs en cours, en mémoire uniquement
+job_events: Dict[str, asyncio.Event] = {}
+job_secrets: Dict[str, Dict[str, str]] = {}
+# Tâches des jobs en cours : la boucle ne garde qu'une référence faible, un job non référencé
+# peut être collecté en plein milieu
+job_tasks: Set[asyncio.Task] = set()
+
+def jobs_db() -> sqlite3.Connection:
+    """Connexion à la base des jobs"""
+    conn = sqlite3.connect(JOBS_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_jobs_db():
+    """Crée la base des jobs si nécessaire"""
+    os.makedirs(os.path.dirname(JOBS_DB_PATH) or ".", exist_ok=True)
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    with jobs_db() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                params TEXT NOT NULL,
+                stages TEXT NOT NULL DEFAULT '{}',
+                result TEXT,
+                error TEXT
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)")
+
+def update_job(job_id: str, **fields):
+    """Met à jour les colonnes d'un job (les dict sont sérialisés en JSON)"""
+    fields["updated_at"] = time.time()
+    values = [json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else v for v in fields.values()]
+    assignments = ", ".join(f"{name} = ?" for name in fields)
+    with jobs_db() as conn:
+        conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", [*values, job_id])
+
+def get_job(job_id: str) -> Dict:
+    """Lit un job (None s'il n'existe pas)"""
+    with jobs_db() as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    
+    return {
+        "job_id": row["id"],
+        "kind": row["kind"],
+        "status": row["status"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+        "attempts": row["attempts"],
+        "stages": json.loads(row["stages"]),
+        "result": json.loads(row["result"]) if row["result"] else None,
+        "error": row["error"]
+    }
+
+def convert_form_value(value: str, annotation):
+    """Convertit un champ de formulaire texte selon l'annotation de l'endpoint (comme FastAPI)"""
+    if annotation is bool:
+        return value.strip().lower() in ("1", "true", "on", "yes")
+    if annotation is int:
+        return int(value)
+    return value
+
+def build_job_kwargs(handler, params: Dict, secrets: Dict) -> tuple:
+    """Reconstruit les arguments d'un endpoint à partir des champs et fichiers sauvegardés du job
+    
+    Renvoie (kwargs, fichiers ouverts à fermer après l'appel).
+    """
+    fields = {**params["fields"], **secrets}
+    files = params["files"]
+    kwargs = {}
+    opened = []
+    
+    for name, parameter in inspect.signature(handler).parameters.items():
+        # Form(...)/File(...) : FieldInfo dont on reprend la valeur par défaut
+        field = parameter.default
+        required = field.is_required() if hasattr(field, "is_required") else field is inspect.Parameter.empty
+        default = getattr(field, "default", field)
+        
+        if name in files:
+            uploads = []
+            for saved in files[name]:
+                f = open(saved["path"], "rb")
+                opened.append(f)
+                uploads.append(UploadFile(
+                    file=f,
+                    filename=saved["filename"],
+                    headers=Headers({"content-type": saved["content_type"] or "application/octet-stream"})
+                ))
+            kwargs[name] = uploads if getattr(parameter.annotation, "__origin__", None) is list else uploads[0]
+        elif name in fields:
+            kwargs[name] = convert_form_value(fields[name], parameter.annotation)
+        elif required:
+            raise HTTPException(status_code=400, detail=f"Champ requis manquant : {name}")
+        else:
+            kwargs[name] = default
+    
+    return kwargs, opened
+
+async def run_job(job_id: str):
+    """Exécute un job sur le pool borné et persiste étapes, résultat et erreur"""
+    async with jobs_semaphore:
+        job = get_job(job_id)
+        if job is None or job["status"] not in ("queued", "running"):
+            return
+        
+        with jobs_db() as conn:
+            row = conn.execute("SELECT params FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        params = json.loads(row["params"])
+        
+        started = time.time()
+        stages = job["stages"]
+        stages["queued_seconds"] = round(started - job["created_at"], 3)
+        update_job(job_id, status="running", attempts=job["attempts"] + 1, stages=stages)
+        print(f"⚙️  Job {job_id} ({job['kind']}) démarré")
+        
+        opened = []
+        try:
+            secrets = job_secrets.get(job_id, {})
+            missing_secrets = [name for name in params.get("secret_fields", []) if name not in secrets]
+            if missing_secrets:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Job interrompu par un redémarrage : {', '.join(missing_secrets)} non conservé(s), relancez le job"
+                )
+            
+            kwargs, opened = build_job_kwargs(JOB_HANDLERS[job["kind"]], params, secrets)
+            result = await JOB_HANDLERS[job["kind"]](**kwargs)
+            
+            # Les endpoints d'upload signalent leurs échecs par success=False plutôt qu'une exception
+            failed = isinstance(result, dict) and result.get("success") is False
+            error = (result.get("error") or result.get("message")) if failed else None
+            stages["running_seconds"] = round(time.time() - started, 3)
+            update_job(job_id, status="failed" if failed else "succeeded", stages=stages, result=result, error=error)
+        except HTTPException as e:
+            stages["running_seconds"] = round(time.time() - started, 3)
+            update_job(job_id, status="failed", stages=stages, error=str(e.detail))
+        except Exception as e:
+            stages["running_seconds"] = round(time.time() - started, 3)
+            update_job(job_id, status="failed", stages=stages, error=f"Erreur serveur: {str(e)}")
+        finally:
+            for f in opened:
+                f.close()
+            shutil.rmtree(os.path.join(JOBS_DIR, job_id), ignore_errors=True)
+            job_secrets.pop(job_id, None)
+            # Les requêtes en attente gardent l'événement : il peut quitter le dictionnaire
+            event = job_events.pop(job_id, None)
+            if event is not None:
+                event.set()
+        
+        print(f"⚙️  Job {job_id} terminé en {stages['running_seconds']}s")
+
+def start_job(job_id: str):
+    """Lance run_job en tâche de fond en gardant une référence jusqu'à sa fin"""
+    task = asyncio.create_task(run_job(job_id))
+    job_tasks.add(task)
+    task.add_done_callback(job_tasks.discard)
+
+@app.on_event("startup")
+async def resume_jobs():
+    """Relance les jobs restés en file ou interrompus par un redémarrage du worker"""
+    init_jobs_db()
+    with jobs_db() as conn:
+        rows = conn.execute("SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at").fetchall()
+    
+    for row in rows:
+        print(f"🔁 Reprise du job {row['id']}")
+        update_job(row["id"], status="queued")
+        start_job(row["id"])
+
+@app.post("/jobs/{kind}")
+async def create_job(kind: str, request: Request):
+    """Crée un job en arrière-plan avec les mêmes champs que l'endpoint correspondant et renvoie son id"""
+    if kind not in JOB_HANDLERS:
+        raise HTTPException(status_code=404, detail=f"Type de job inconnu : {kind} ({', '.join(JOB_HANDLERS)})")
+    
+    form = await request.form()
+    if form.get("response_format", "json") != "json":
+        raise HTTPException(status_code=400, detail="Un job renvoie toujours du JSON : response_format=json uniquement")
+    
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(JOBS_DIR, job_id)
+    os.makedirs(job_dir, exist_ok=True)
+    
+    fields = {}
+    secrets = {}
+    files = {}
+    
+    for index, (name, value) in enumerate(form.multi_items()):
+        if isinstance(value, str):
+            if name in JOBS_SECRET_FIELDS:
+                secrets[name] = value
+            else:
+                fields[name] = value
+            continue
+        
+        # Fichier : copié sur disque pour survivre à la requête (et à un redémarrage)
+        path = os.path.join(job_dir, f"{index}-{os.path.basename(value.filename or 'upload')}")
+        with open(path, "wb") as f:
+            shutil.copyfileobj(value.file, f)
+        files.setdefault(name, []).append({
+            "path": path,
+            "filename": value.filename,
+            "content_type": value.content_type
+        })
+    
+    params = {"fields": fields, "files": files, "secret_fields": sorted(secrets)}
+    now = time.time()
+    with jobs_db() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, status, created_at, updated_at, params) VALUES (?, ?, 'queued', ?, ?, ?)",
+            (job_id, kind, now, now, json.dumps(params, ensure_ascii=False))
+        )
+    
+    job_secrets[job_id] = secrets
+    job_events[job_id] = asyncio.Event()
+    start_job(job_id)
+    
+    return {"success": True, "job_id": job_id, "status": "queued", "status_url": f"/jobs/{job_id}"}
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, wait: float = 0):
+    """État d'un job ; wait=N (secondes, max 60) attend sa fin (long-polling)"""
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job introuvable")
+    
+    if wait > 0 and job["status"] in ("queued", "running"):
+        event = job_events.setdefault(job_id, asyncio.Event())
+        try:
+            await asyncio.wait_for(event.wait(), timeout=min(wait, 60))
+        except asyncio.TimeoutError:
+            pass
+        job = get_job(job_id)
+        # Job terminé par un autre worker : personne ne libérera l'événement
+        if job["status"] not in ("queued", "running"):
+            job_events.pop(job_id, None)
+    
+    return job
+
+
+# =============================================================================
+# MENUS STOCKÉS ET MODIFICATIONS ARTICLE PAR ARTICLE
+# =============================================================================
+
+# Champs d'un article modifiables par PATCH
+MENU_PATCH_FIELDS = ("nom", "prix", "description", "allergens")
+DEFAULT_COLORS = {
+    "primary": "#db5543",
+    "accent": "#db5543",
+    "footer": "#db5543",
+    "footer_accent": "#eb5c27",
+    "button_accent_background": "#db5543",
+    "button_primary_font": "#db5543",
+    "button_menu_block_font": "#eb5c27"
+}
+
+def restaurant_id_for(restaurant_name: str) -> str:
+    """Identifiant d'un restaurant (restaurantId des backend.json, clé de la base des menus)"""
+    return restaurant_name.lower().replace(" ", "_")
+
+def menus_db() -> sqlite3.Connection:
+    """Connexion à la base des menus"""
+    conn = sqlite3.connect(MENUS_DB_PATH, timeout=30)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def init_menus_db():
+    """Crée la base des menus si nécessaire : restaurants (nom et réglages), versions des menus
+    et fichiers générés pour chaque version
+    
+    L'ancienne table menus (un menu par restaurant) est reprise comme version de chaque
+    restaurant, avec son menus.4.json, puis supprimée.
+    """
+    os.makedirs(os.path.dirname(MENUS_DB_PATH) or ".", exist_ok=True)
+    with menus_db() as conn:
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS restaurants (
+                restaurant_id TEXT PRIMARY KEY,
+                restaurant_name TEXT NOT NULL,
+                settings TEXT NOT NULL DEFAULT '{}',
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS menu_versions (
+                restaurant_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                source TEXT NOT NULL,
+                menu TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                PRIMARY KEY (restaurant_id, version)
+            )
+        """)
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS menu_files (
+                restaurant_id TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                content TEXT NOT NULL,
+                PRIMARY KEY (restaurant_id, version, name)
+            )
+        """)
+        
+        legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'menus'").fetchone()
+        if legacy is not None:
+            rows = conn.execute("SELECT * FROM menus").fetchall()
+            for row in rows:
+                if conn.execute("SELECT 1 FROM menu_versions WHERE restaurant_id = ?", (row["restaurant_id"],)).fetchone():
+                    continue
+                conn.execute(
+                    "INSERT OR IGNORE INTO restaurants (restaurant_id, restaurant_name, settings, updated_at) VALUES (?, ?, '{}', ?)",
+                    (row["restaurant_id"], row["restaurant_name"], row["updated_at"])
+                )
+                conn.execute(
+                    "INSERT INTO menu_versions (restaurant_id, version, source, menu, created_at) VALUES (?, ?, 'migration', ?, ?)",
+                    (row["restaurant_id"], row["revision"], row["menu"], row["updated_at"])
+                )
+                conn.executemany(
+                    "INSERT INTO menu_files (restaurant_id, version, name, content) VALUES (?, ?, ?, ?)",
+                    [(row["restaurant_id"], row["revision"], name, row["menus_json"]) for name in ("menus", "menus_2")]
+                )
+            conn.execute("DROP TABLE menus")
+            print(f"🗄️  Ancienne table menus reprise ({len(rows)} menu(s)) puis supprimée")
+
+def save_restaurant(restaurant_id: str, restaurant_name: str = None, **settings):
+    """Crée ou met à jour un restaurant ; les réglages non None (qr_mode, colors, address,
+    selected_buttons, banner_paths) remplacent les valeurs enregistrées"""
+    with menus_db() as conn:
+        row = conn.execute("SELECT restaurant_name, settings FROM restaurants WHERE restaurant_id = ?", (restaurant_id,)).fetchone()
+        merged = json.loads(row["settings"]) if row else {}
+        merged.update({name: value for name, value in settings.items() if value is not None})
+        conn.execute("""
+            INSERT INTO restaurants (restaurant_id, restaurant_name, settings, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (restaurant_id) DO UPDATE SET
+                restaurant_name = excluded.restaurant_name, settings = excluded.settings, updated_at = excluded.updated_at
+        """, (
+            restaurant_id,
+            restaurant_name or (row["restaurant_name"] if row else restaurant_id),
+            json.dumps(merged, ensure_ascii=False),
+            time.time()
+        ))
+
+def load_restaurant(restaurant_id: str) -> Dict:
+    """Lit un restaurant et ses réglages (None s'il n'existe pas)"""
+    with menus_db() as conn:
+        row = conn.execute("SELECT * FROM restaurants WHERE restaurant_id = ?", (restaurant_id,)).fetchone()
+    if row is None:
+        return None
+    
+    return {
+        "restaurant_id": row["restaurant_id"],
+        "restaurant_name": row["restaurant_name"],
+        "settings": json.loads(row["settings"]),
+        "updated_at": row["updated_at"]
+    }
+
+def save_menu_version(restaurant_id: str, menu_data: Dict, source: str, files: Dict[str, str] = None, base_version: int = None) -> int:
+    """Enregistre une nouvelle version du menu (et ses fichiers générés), renvoie son numéro
+    
+    base_version : refuse (409) si une autre version a été créée depuis. Seules les
+    MENU_VERSIONS_KEEP dernières versions sont conservées.
+    """
+    menu_text = json.dumps(menu_data, ensure_ascii=False)
+    with menus_db() as conn:
+        # Verrou d'écriture dès la lecture : deux requêtes ne peuvent pas créer le même numéro
+        conn.execute("BEGIN IMMEDIATE")
+        latest = conn.execute("SELECT MAX(version) FROM menu_versions WHERE restaurant_id = ?", (restaurant_id,)).fetchone()[0] or 0
+        if base_version is not None and base_version != latest:
+            raise HTTPException(status_code=409, detail=f"Version {base_version} périmée : le menu est en version {latest}")
+        
+        version = latest + 1
+        conn.execute(
+            "INSERT INTO menu_versions (restaurant_id, version, source, menu, created_at) VALUES (?, ?, ?, ?, ?)",
+            (restaurant_id, version, source, menu_text, time.time())
+        )
+        if files:
+            conn.executemany(
+                "INSERT INTO menu_files (restaurant_id, version, name, content) VALUES (?, ?, ?, ?)",
+                [(restaurant_id, version, name, content) for name, content in files.items()]
+            )
+        
+        oldest_kept = version - MENU_VERSIONS_KEEP
+        conn.execute("DELETE FROM menu_versions WHERE restaurant_id = ? AND version <= ?", (restaurant_id, oldest_kept))
+        conn.execute("DELETE FROM menu_files WHERE restaurant_id = ? AND version <= ?", (restaurant_id, oldest_kept))
+    return version
+
+def save_menu_files(restaurant_id: str, version: int, files: Dict[str, str]):
+    """Associe les fichiers générés à une version existante (menu extrait puis généré)"""
+    with menus_db() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO menu_files (restaurant_id, version, name, content) VALUES (?, ?, ?, ?)",
+            [(restaurant_id, version, name, content) for name, content in files.items()]
+        )
+
+def load_menu_version(restaurant_id: str, version: int = None) -> Dict:
+    """Lit une version du menu (la dernière par défaut) ; None si elle n'existe pas"""
+    with menus_db() as conn:
+        if version is None:
+            row = conn.execute(
+                "SELECT * FROM menu_versions WHERE restaurant_id = ? ORDER BY version DESC LIMIT 1", (restaurant_id,)
+            ).fetchone()
+        else:
+            row = conn.execute(
+                "SELECT * FROM menu_versions WHERE restaurant_id = ? AND version = ?", (restaurant_id, version)
+            ).fetchone()
+        if row is None:
+            return None
+        generated = conn.execute(
+            "SELECT 1 FROM menu_files WHERE restaurant_id = ? AND version = ? LIMIT 1", (restaurant_id, row["version"])
+        ).fetchone() is not None
+    
+    return {
+        "version": row["version"],
+        "source": row["source"],
+        "created_at": row["created_at"],
+        "generated": generated,
+        "menu": json.loads(row["menu"])
+    }
+
+def load_menu_files(restaurant_id: str, version: int = None) -> tuple:
+    """Fichiers générés d'une version (la dernière générée par défaut) : (version, {nom: contenu})
+    
+    Les contenus sont renvoyés tels qu'enregistrés, sans être décodés.
+    """
+    with menus_db() as conn:
+        if version is None:
+            version = conn.execute("SELECT MAX(version) FROM menu_files WHERE restaurant_id = ?", (restaurant_id,)).fetchone()[0]
+        rows = conn.execute(
+            "SELECT name, content FROM menu_files WHERE restaurant_id = ? AND version = ?", (restaurant_id, version)
+        ).fetchall()
+    return version, {row["name"]: row["content"] for row in rows}
+
+def list_menu_versions(restaurant_id: str) -> List[Dict]:
+    """Versions conservées d'un menu, de la plus récente à la plus ancienne"""
+    with menus_db() as conn:
+        rows = conn.execute("""
+            SELECT v.version, v.source, v.created_at,
+                   EXISTS (SELECT 1 FROM menu_files f WHERE f.restaurant_id = v.restaurant_id AND f.version = v.version) AS generated
+            FROM menu_versions v WHERE v.restaurant_id = ? ORDER BY v.version DESC
+        """, (restaurant_id,)).fetchall()
+    return [
+        {"version": row["version"], "source": row["source"], "created_at": row["created_at"], "generated": bool(row["generated"])}
+        for row in rows
+    ]
+
+def resolve_colors(colors: Dict, stored: Dict = None) -> Dict:
+    """Couleurs envoyées, sinon celles enregistrées pour le restaurant, sinon DEFAULT_COLORS"""
+    stored = stored or {}
+    return {
+        name: colors.get(name) if colors.get(name) is not None else stored.get(name, default)
+        for name, default in DEFAULT_COLORS.items()
+    }
+
+def clean_patch_article(values: Dict, base: Dict = None) -> Dict:
+    """Article après application de values (champs de MENU_PATCH_FIELDS) ; nom et prix obligatoires"""
+    article = dict(base or {})
+    for field, value in values.items():
+        if field not in MENU_PATCH_FIELDS:
+            raise HTTPException(status_code=400, detail=f"Champ d'article inconnu : {field} ({', '.join(MENU_PATCH_FIELDS)})")
+        article[field] = value
+    
+    if not str(article.get("nom") or "").strip():
+        raise HTTPException(status_code=400, detail="Un article doit avoir un nom")
+    try:
+        article["prix"] = float(article.get("prix"))
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Prix invalide pour {article['nom']} : {article.get('prix')}")
+    return article
+
+def check_patch_category(position: int, category) -> str:
+    if category not in CATEGORY_SECTION:
+        raise HTTPException(status_code=400, detail=f"Opération {position} : catégorie inconnue ({category})")
+    return category
+
+def apply_menu_patch(menu_data: Dict, menu: MenuModel, operations: List[Dict]):
+    """Applique au menu (sur place) des opérations add, update, remove et move
+    
+    Les articles existants sont désignés par leur articleId dans menu (MenuModel du menu avant
+    modification). Un article modifié ou déplacé reste le même objet : son articleId d'origine
+    se retrouve par identité.
+    """
+    articles = {
+        entry.article_id: (category, item)
+        for category, entries in menu.categories.items()
+        for entry, item in zip(entries, menu_data[category])
+    }
+    
+    for position, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            raise HTTPException(status_code=400, detail=f"Opération {position} : objet JSON attendu")
+        
+        op = operation.get("op")
+        index = operation.get("index")
+        try:
+            index = None if index is None else int(index)
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail=f"Opération {position} : index invalide ({index})")
+        
+        if op == "add":
+            items = menu_data.setdefault(check_patch_category(position, operation.get("category")), [])
+            items.insert(len(items) if index is None else index, clean_patch_article(operation.get("article") or {}))
+            continue
+        
+        if op not in ("update", "remove", "move"):
+            raise HTTPException(status_code=400, detail=f"Opération {position} : op inconnue ({op}) : add, update, remove, move")
+        
+        article_id = str(operation.get("article_id"))
+        if article_id not in articles:
+            raise HTTPException(status_code=404, detail=f"Opération {position} : article {article_id} introuvable")
+        category, item = articles[article_id]
+        
+        if op == "update":
+            updated = clean_patch_article(operation.get("fields") or {}, item)
+            item.clear()
+            item.update(updated)
+            continue
+        
+        target = check_patch_category(position, operation.get("category")) if op == "move" else None
+        items = menu_data[category]
+        items.pop(next(i for i, candidate in enumerate(items) if candidate is item))
+        del articles[article_id]
+        
+        if op == "move":
+            items = menu_data.setdefault(target, [])
+            items.insert(len(items) if index is None else index, item)
+            articles[article_id] = (target, item)
+
+@app.on_event("startup")
+def open_menus_db():
+    init_menus_db()
+
+@app.get("/menus/{restaurant_id}")
+async def get_menu(restaurant_id: str, version: int = None):
+    """Restaurant enregistré (réglages), une version de son menu (la dernière par défaut) avec ses
+    articleId, et la liste des versions conservées"""
+    restaurant = load_restaurant(restaurant_id)
+    stored = load_menu_version(restaurant_id, version)
+    if restaurant is None or stored is None:
+        raise HTTPException(status_code=404, detail="Aucun menu enregistré pour ce restaurant" if version is None else f"Version {version} introuvable")
+    
+    # articleId tels que publiés pour cette version (homonymes compris)
+    published_menus = None
+    if stored["generated"]:
+        _, files = load_menu_files(restaurant_id, stored["version"])
+        published_menus = json.loads(files["menus"]) if "menus" in files else None
+    
+    return {
+        "success": True,
+        "restaurant_id": restaurant_id,
+        "restaurant_name": restaurant["restaurant_name"],
+        "settings": restaurant["settings"],
+        "version": stored["version"],
+        "source": stored["source"],
+        "generated": stored["generated"],
+        "created_at": stored["created_at"],
+        "menu": stored["menu"],
+        "article_ids": MenuModel(stored["menu"], previous_menus=published_menus).article_ids(),
+        "versions": list_menu_versions(restaurant_id)
+    }
+
+@app.patch("/menus/{restaurant_id}")
+async def patch_menu(
+    restaurant_id: str,
+    operations: str = Form(...),
+    base_version: int = Form(None),
+    publish: bool = Form(False),
+    ftp_password: str = Form(None)
+):
+    """Modifie des articles de la dernière version générée sans renvoyer tout le menu
+    
+    operations : liste JSON appliquée dans l'ordre, tout ou rien
+      {"op": "add", "category": "plats", "article": {"nom": ..., "prix": ...}, "index": 0}
+      {"op": "update", "article_id": "...", "fields": {"prix": 12.5}}
+      {"op": "remove", "article_id": "..."}
+      {"op": "move", "article_id": "...", "category": "desserts", "index": 0}
+    Le résultat est enregistré comme nouvelle version. Seules les sections touchées de
+    menus.4.json sont reconstruites ; avec publish, seuls menus.4.json et menus_2.4.json (et leurs
+    .gz/.br) sont republiés. frontend_stale signale que les catégories affichées ont changé
+    (bannières et boutons à régénérer via /generate-menu).
+    """
+    started = time.perf_counter()
+    if publish and not ftp_password:
+        raise HTTPException(status_code=400, detail="ftp_password requis pour publier")
+    
+    try:
+        operations = json.loads(operations)
+    except json.JSONDecodeError as e:
+        raise HTTPException(status_code=400, detail=f"Opérations JSON invalides: {str(e)}")
+    if not isinstance(operations, list) or not operations:
+        raise HTTPException(status_code=400, detail="operations doit être une liste non vide")
+    
+    stored = load_menu_version(restaurant_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Aucun menu enregistré pour ce restaurant")
+    if base_version is not None and base_version != stored["version"]:
+        raise HTTPException(status_code=409, detail=f"Version {base_version} périmée : le menu est en version {stored['version']}")
+    if not stored["generated"]:
+        raise HTTPException(status_code=409, detail=f"Version {stored['version']} jamais générée : appelez d'abord /generate-menu")
+    
+    _, files = load_menu_files(restaurant_id, stored["version"])
+    previous_menus = json.loads(files["menus"])
+    menu_data = stored["menu"]
+    previous_model = MenuModel(menu_data, previous_menus=previous_menus)
+    # articleId d'origine de chaque article (par identité : les articles sont modifiés sur place)
+    original_ids = {
+        id(item): entry.article_id
+        for category, entries in previous_model.categories.items()
+        for entry, item in zip(entries, menu_data[category])
+    }
+    apply_menu_patch(menu_data, previous_model, operations)
+    
+    previous_images = {
+        article["articleId"]: article.get("img", "")
+        for section_type in ("sections", "drinks")
+        for section in previous_menus.get(section_type, [])
+        for article in section.get("articles", [])
+    }
+    
+    # Tout article dont l'articleId change (renommé, déplacé, homonyme voisin modifié) garde son
+    # image ; un article ajouté qui reprend l'ID d'un article retiré n'hérite pas de la sienne
+    menu = MenuModel(menu_data, previous_menus=previous_menus)
+    renamed_ids = {}
+    item_images = {}
+    for category, entries in menu.categories.items():
+        for entry, item in zip(entries, menu_data[category]):
+            original_id = original_ids.get(id(item))
+            if original_id == entry.article_id:
+                continue
+            if original_id is not None:
+                renamed_ids[original_id] = entry.article_id
+            if previous_images.get(original_id) or previous_images.get(entry.article_id):
+                item_images[entry.article_id] = previous_images.get(original_id, "")
+    
+    changes = {}
+    menus_json = generate_menus_json(menu, restaurant_id, item_images, previous_menus, changes)
+    menus_text = json.dumps(menus_json, ensure_ascii=False, separators=(',', ':'))
+    files.update({"menus": menus_text, "menus_2": menus_text})
+    version = save_menu_version(restaurant_id, menu_data, "patch", files, base_version=stored["version"])
+    print(f"✏️  Menu {restaurant_id} : {len(operations)} opération(s), version {version}")
+    
+    result = {
+        "success": True,
+        "restaurant_id": restaurant_id,
+        "version": version,
+        "changes": changes,
+        "renamed_ids": renamed_ids,
+        "frontend_stale": list(previous_model.categories) != list(menu.categories),
+        "total_articles": menu.total_articles
+    }
+    
+    if publish:
+        try:
+            compressed = await asyncio.to_thread(json_artifact_files, "", menus_text.encode("utf-8"))
+            release_files = {
+                f'{filename}{suffix}': data
+                for filename in ("menus.4.json", "menus_2.4.json")
+                for suffix, data in compressed.items()
+            }
+            with sftp_session(SFTP_JSON_PORT, ftp_password) as sftp:
+                release = publish_release(sftp, PUBLISH_CACHE_ROOT, PUBLISH_CURRENT_NAME, release_files)
+            result["publish"] = {
+                "success": True,
+                "release": {"current": release["release"], "previous": release["previous"]},
+                "uploaded": release["uploaded"],
+                "bytes_sent": sum(len(release_files[name]) for name in release["uploaded"])
+            }
+        except Exception as e:
+            result["publish"] = {"success": False, "message": f"Erreur SFTP: {str(e)}"}
+    
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# main.py crée le client Groq et lit sa configuration à l'import
+os.environ.setdefault("GROQ_API_KEY", "test")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,67 @@
+import main
+
+
+def published(menu_data, item_images=None, previous_menus=None):
+    """menus.4.json tel que publié, et ses articleId par catégorie"""
+    menu = main.MenuModel(menu_data, previous_menus=previous_menus)
+    return main.generate_menus_json(menu, "r", item_images, previous_menus), menu.article_ids()
+
+
+def images(menus_json):
+    return {
+        article["name"]["fr"] + "|" + str(article["price"]["amount"]): article["img"]
+        for section in menus_json["sections"] + menus_json["drinks"]
+        for article in section["articles"]
+    }
+
+
+HOMONYMS = {"plats": [
+    {"nom": "Salade", "prix": 9, "description": "César"},
+    {"nom": "Salade", "prix": 11, "description": "Niçoise"},
+    {"nom": "Steak", "prix": 18},
+]}
+
+
+def test_homonyms_do_not_depend_on_position():
+    salads = [{"nom": "Salade", "prix": price} for price in (9, 10, 11)]
+    ids = main.MenuModel({"plats": salads}).article_ids()["plats"]
+    assert len(set(ids)) == 3
+    # La troisième salade garde son ID sans la deuxième : il dépend de son prix, pas de son rang
+    assert main.MenuModel({"plats": [salads[0], salads[2]]}).article_ids()["plats"] == [ids[0], ids[2]]
+
+
+def test_removing_first_homonym_keeps_the_other_id_and_image():
+    ids = main.MenuModel(HOMONYMS).article_ids()["plats"]
+    previous, _ = published(HOMONYMS, {ids[0]: "/cesar.webp", ids[1]: "/nicoise.webp"})
+
+    menus_json, new_ids = published({"plats": HOMONYMS["plats"][1:]}, previous_menus=previous)
+    assert new_ids["plats"] == ids[1:]
+    assert images(menus_json)["Salade|11.0"] == "/nicoise.webp"
+
+
+def test_renaming_first_homonym_keeps_the_other_id_and_image():
+    ids = main.MenuModel(HOMONYMS).article_ids()["plats"]
+    previous, _ = published(HOMONYMS, {ids[0]: "/cesar.webp", ids[1]: "/nicoise.webp"})
+
+    renamed = {"plats": [dict(HOMONYMS["plats"][0], nom="Salade César")] + HOMONYMS["plats"][1:]}
+    menus_json, new_ids = published(renamed, previous_menus=previous)
+    assert new_ids["plats"][1:] == ids[1:]
+    assert images(menus_json)["Salade|11.0"] == "/nicoise.webp"
+
+
+def test_repriced_homonym_keeps_its_id():
+    previous, ids = published(HOMONYMS)
+    repriced = {"plats": [HOMONYMS["plats"][0], dict(HOMONYMS["plats"][1], prix=12)], "desserts": []}
+    _, new_ids = published(repriced, previous_menus=previous)
+    assert new_ids["plats"] == ids["plats"][:2]
+
+
+def test_images_follow_names_from_a_sequential_menu(monkeypatch):
+    monkeypatch.setattr(main, "ARTICLE_ID_MODE", "sequential")
+    previous, ids = published(HOMONYMS, {"4000": "/cesar.webp", "4001": "/nicoise.webp", "4002": "/steak.webp"})
+    assert ids["plats"] == ["4000", "4001", "4002"]
+
+    monkeypatch.setattr(main, "ARTICLE_ID_MODE", "stable")
+    menus_json, new_ids = published(HOMONYMS, previous_menus=previous)
+    assert all(int(article_id) >= main.ARTICLE_ID_OFFSET for article_id in new_ids["plats"])
+    assert images(menus_json) == {"Salade|9.0": "/cesar.webp", "Salade|11.0": "/nicoise.webp", "Steak|18.0": "/steak.webp"}
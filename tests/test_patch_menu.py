@@ -0,0 +1,90 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+
+
+MENU = {
+    "entrees": [{"nom": "Velouté", "prix": 8}],
+    "plats": [
+        {"nom": "Salade", "prix": 9, "description": "César"},
+        {"nom": "Salade", "prix": 11, "description": "Niçoise"},
+        {"nom": "Steak", "prix": 18},
+    ],
+}
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "MENUS_DB_PATH", str(tmp_path / "menus.sqlite3"))
+    monkeypatch.setattr(main, "JOBS_DB_PATH", str(tmp_path / "jobs.sqlite3"))
+    monkeypatch.setattr(main, "SFTP_PASSWORD", None)
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def published(client):
+    """Menu généré avec une image par article : (restaurant_id, articleId par catégorie)"""
+    ids = main.MenuModel(MENU).article_ids()
+    item_images = {article_id: f"/img/{article_id}.webp" for articles in ids.values() for article_id in articles}
+    response = client.post("/generate-menu", data={
+        "restaurant_name": "Chez Patch",
+        "validated_menu": json.dumps(MENU),
+        "item_images_json": json.dumps(item_images),
+    }).json()
+    assert response["article_ids"] == ids
+    return response["restaurant_id"], ids
+
+
+def patch(client, restaurant_id, *operations):
+    response = client.patch(f"/menus/{restaurant_id}", data={"operations": json.dumps(operations)})
+    assert response.status_code == 200, response.text
+    return response.json()
+
+
+def published_images(client, restaurant_id):
+    """{(section, nom, prix): image} du menus.4.json enregistré"""
+    _, files = main.load_menu_files(restaurant_id)
+    menus = json.loads(files["menus"])
+    return {
+        (section["name"]["fr"], article["name"]["fr"], article["price"]["amount"]): article["img"]
+        for section in menus["sections"]
+        for article in section["articles"]
+    }
+
+
+def test_rename_first_homonym_keeps_every_image(client, published):
+    restaurant_id, ids = published
+    result = patch(client, restaurant_id, {"op": "update", "article_id": ids["plats"][0], "fields": {"nom": "Salade César"}})
+
+    assert list(result["renamed_ids"]) == [ids["plats"][0]]
+    assert client.get(f"/menus/{restaurant_id}").json()["article_ids"]["plats"][1:] == ids["plats"][1:]
+    images = published_images(client, restaurant_id)
+    assert images[("PLATS", "Salade César", 9.0)] == f"/img/{ids['plats'][0]}.webp"
+    assert images[("PLATS", "Salade", 11.0)] == f"/img/{ids['plats'][1]}.webp"
+
+
+def test_added_homonym_does_not_take_a_removed_image(client, published):
+    restaurant_id, ids = published
+    patch(client, restaurant_id,
+          {"op": "remove", "article_id": ids["plats"][0]},
+          {"op": "add", "category": "plats", "article": {"nom": "Salade", "prix": 9, "description": "César"}})
+
+    images = published_images(client, restaurant_id)
+    assert images[("PLATS", "Salade", 9.0)] == ""
+    assert images[("PLATS", "Salade", 11.0)] == f"/img/{ids['plats'][1]}.webp"
+
+
+def test_move_homonym_keeps_its_image(client, published):
+    restaurant_id, ids = published
+    result = patch(client, restaurant_id, {"op": "move", "article_id": ids["plats"][1], "category": "entrees", "index": 0})
+
+    new_ids = client.get(f"/menus/{restaurant_id}").json()["article_ids"]
+    assert result["renamed_ids"] == {ids["plats"][1]: new_ids["entrees"][0]}
+    assert [ids["plats"][0], ids["plats"][2]] == new_ids["plats"]
+    images = published_images(client, restaurant_id)
+    assert images[("ENTRÉES", "Salade", 11.0)] == f"/img/{ids['plats'][1]}.webp"
+    assert images[("PLATS", "Salade", 9.0)] == f"/img/{ids['plats'][0]}.webp"
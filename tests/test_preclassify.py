@@ -0,0 +1,49 @@
+import pytest
+
+import main
+
+
+@pytest.mark.parametrize("line", [
+    "Noisette d'agneau rôtie 24",
+    "Cafe de Paris entrecote 26",
+    "The Classic Burger 14",
+    "Jus de viande corsé, pommes 18",
+    "Riz au lait 6",
+    "Café gourmand 9",
+    "Thé à la menthe et pâtisseries orientales 12",
+    "Riz cantonais aux crevettes 13",
+    "Frites de patate douce, sauce barbecue 6",
+    "Perrier-Jouët Grand Brut 85",
+    "Perrier Jouët Belle Epoque 190",
+    "Sirop d'érable sur pancakes 8",
+    "Pression des champs 12",
+])
+def test_dishes_are_left_to_groq(line):
+    assert main.preclassify_line(line) is None
+
+
+@pytest.mark.parametrize("line, category", [
+    ("Café 2,50", "boissons_chaudes"),
+    ("Café noisette 2,80", "boissons_chaudes"),
+    ("Double expresso 3", "boissons_chaudes"),
+    ("Thé vert 4", "boissons_chaudes"),
+    ("Jus d'orange 4", "jus"),
+    ("Orange pressée 5", "jus"),
+    ("Coca-Cola 33cl 4", "boissons_soft"),
+    ("Perrier 4", "boissons_soft"),
+    ("Sirop de menthe 2,50", "boissons_soft"),
+    ("Demi pression 3,50", "bieres_pression"),
+    ("Heineken pression 25cl 4", "bieres_pression"),
+    ("Frites maison 4", "accompagnements"),
+    ("Portion de riz 3", "accompagnements"),
+])
+def test_obvious_lines_are_classified(line, category):
+    result = main.preclassify_line(line)
+    assert result is not None and result[0] == category
+
+
+def test_misclassified_dishes_stay_in_groq_text():
+    text = "NOS PLATS\nNoisette d'agneau rôtie 24\nThe Classic Burger 14\nCafé 2,50\n"
+    local_menu, residue = main.preclassify_menu_text(text)
+    assert local_menu == {"boissons_chaudes": [{"nom": "Café", "prix": 2.5, "description": False}]}
+    assert "Noisette d'agneau" in residue and "Classic Burger" in residue
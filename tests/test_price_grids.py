@@ -0,0 +1,81 @@
+import fitz
+
+import main
+
+
+def page_with(rows, header=("VINS BLANCS", "Verre", "Bouteille")):
+    """Page avec un en-tête de formats puis des lignes (nom, prix colonne 1, prix colonne 2)"""
+    doc = fitz.open()
+    page = doc.new_page()
+    y = 60
+    page.insert_text((50, y), header[0])
+    page.insert_text((300, y), header[1])
+    page.insert_text((400, y), header[2])
+    for name, first, second in rows:
+        y += 18
+        if name:
+            page.insert_text((50, y), name)
+        if first:
+            page.insert_text((305, y), first)
+        if second:
+            page.insert_text((405, y), second)
+    y += 40
+    page.insert_text((50, y), "DESSERTS")
+    page.insert_text((50, y + 18), "Tiramisu 8")
+    return doc, page
+
+
+def block(text):
+    start = text.index(main.GRID_BLOCK_START)
+    return text[start:text.index(main.GRID_BLOCK_END, start)]
+
+
+def test_description_lines_are_kept_in_the_block():
+    doc, page = page_with([
+        ("Sancerre", "9,00", "45,00"),
+        ("Notes minérales, agrumes", None, None),
+        ("Chablis", "8,00", "40,00"),
+    ])
+    grid = block(main.extract_page_text(page))
+    assert "Sancerre Verre : 9.00€" in grid
+    assert "Notes minérales, agrumes" in grid
+    assert "Chablis Bouteille : 40.00€" in grid
+    doc.close()
+
+
+def test_name_and_prices_on_separate_lines_form_one_row():
+    doc, page = page_with([
+        ("Sancerre", "9,00", "45,00"),
+        ("Pouilly-Fumé", None, None),
+        (None, "8,00", "38,00"),
+        ("Chablis", "8,00", "40,00"),
+    ])
+    text = main.extract_page_text(page)
+    grid = block(text)
+    assert "Pouilly-Fumé Verre : 8.00€" in grid
+    assert "Pouilly-Fumé Bouteille : 38.00€" in grid
+    assert "Tiramisu 8" in text
+    doc.close()
+
+
+def test_row_with_format_words_and_prices_is_not_a_header():
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((50, 60), "BIÈRES")
+    page.insert_text((300, 60), "25cl")
+    page.insert_text((400, 60), "50cl")
+    page.insert_text((50, 78), "Heineken 25cl 50cl")
+    page.insert_text((305, 78), "4,50")
+    page.insert_text((405, 78), "7,00")
+    page.insert_text((50, 96), "Leffe")
+    page.insert_text((305, 96), "5,00")
+    page.insert_text((405, 96), "8,50")
+
+    grids = main.detect_price_grids(page)
+    assert len(grids) == 1
+    assert [row["cells"] for row in grids[0]["rows"]] == [
+        [("25cl", "4.50"), ("50cl", "7.00")],
+        [("25cl", "5.00"), ("50cl", "8.50")],
+    ]
+    assert grids[0]["rows"][1]["name"] == "Leffe"
+    doc.close()
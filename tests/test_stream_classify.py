@@ -0,0 +1,57 @@
+import asyncio
+import json
+import types
+
+import main
+
+
+MENU = {
+    "entrees": [{"nom": "Soupe", "prix": 7.5, "description": False}],
+    "plats": [
+        {"nom": "Steak frites", "prix": 18, "description": False},
+        {"nom": "Filet de bar", "prix": 22, "description": False},
+    ],
+}
+
+
+def fake_create(calls, truncate_at):
+    """Faux client Groq en streaming : la première réponse est coupée après truncate_at caractères"""
+    content = json.dumps(MENU, ensure_ascii=False)
+
+    async def create(**kwargs):
+        calls.append(kwargs["max_tokens"])
+        text = content[:truncate_at] if len(calls) == 1 else content
+        finish_reason = "length" if len(calls) == 1 else "stop"
+
+        async def chunks():
+            for start in range(0, len(text), 5):
+                choice = types.SimpleNamespace(delta=types.SimpleNamespace(content=text[start:start + 5]), finish_reason=None)
+                yield types.SimpleNamespace(choices=[choice], x_groq=None)
+            yield types.SimpleNamespace(
+                choices=[types.SimpleNamespace(delta=types.SimpleNamespace(content=None), finish_reason=finish_reason)],
+                x_groq=None
+            )
+        return chunks()
+    return create
+
+
+def collect(text):
+    async def run():
+        return [event async for event in main.stream_classify_menu_with_groq(text, bypass_cache=True)]
+    return asyncio.run(run())
+
+
+def test_truncated_stream_is_resumed_with_full_budget(monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "CACHE_DIR", str(tmp_path))
+    calls = []
+    # Coupé au milieu du deuxième plat : entrées complètes, un plat déjà émis
+    truncate_at = json.dumps(MENU, ensure_ascii=False).index("Filet")
+    monkeypatch.setattr(main.groq_client.chat.completions, "create", fake_create(calls, truncate_at))
+
+    events = collect("ENTRÉES\nSoupe 7,50\nPLATS\nSteak frites 18\nFilet de bar 22")
+
+    assert calls == [main.estimate_max_tokens("ENTRÉES\nSoupe 7,50\nPLATS\nSteak frites 18\nFilet de bar 22"), main.GROQ_MAX_TOKENS]
+    articles = [event["article"]["nom"] for event in events if event["event"] == "article"]
+    assert articles == ["Soupe", "Steak frites", "Filet de bar"]
+    assert [event["category"] for event in events if event["event"] == "category_start"] == ["entrees", "plats"]
+    assert events[-1] == {"event": "menu", "menu": MENU}